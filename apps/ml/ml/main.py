@@ -1,6 +1,19 @@
 import logging
-from fastapi import FastAPI, File, UploadFile, HTTPException
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from fastapi import (
+    BackgroundTasks,
+    FastAPI,
+    File,
+    Header,
+    HTTPException,
+    UploadFile,
+    Depends,
+)
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel
 from PIL import Image
 import torch
 from torchvision import transforms
@@ -8,6 +21,11 @@ from torchvision.models import resnet34, ResNet34_Weights
 import torch.nn as nn
 import io
 import os
+import time
+import hashlib
+import secrets
+
+from metrics import REGISTRY, REQUESTS_IN_FLIGHT, PREDICTIONS, time_stage
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -31,7 +49,16 @@ logger.info(f"Using device: {device}")
 
 
 # Model configuration
-def load_model():
+WEIGHTS_DIR = os.path.join(os.path.dirname(__file__), "weights")
+DEFAULT_MODEL_PATH = os.path.join(WEIGHTS_DIR, "model.pth")
+# Model versions kept in memory; the oldest inactive ones are dropped first
+MAX_VERSIONS = 2
+# Model management endpoints require this in the X-Admin-Token header; they
+# are disabled when it is not set
+ADMIN_TOKEN = os.environ.get("ML_ADMIN_TOKEN")
+
+
+def load_model(model_path=DEFAULT_MODEL_PATH):
     logger.info("Loading model...")
 
     # Load the pre-trained ResNet-34 model with the ImageNet weights
@@ -41,13 +68,6 @@ def load_model():
     num_classes = 10
     model.fc = nn.Linear(model.fc.in_features, num_classes)
 
-    # Load weights from file in the same directory
-    model_path = os.path.join(
-        os.path.dirname(__file__),  # Location of main.py
-        "weights",  # weights directory
-        "model.pth",  # model file name
-    )
-
     if os.path.exists(model_path):
         # If custom weights file is available, load it
         logger.info(f"Loading custom model weights from {model_path}")
@@ -62,7 +82,104 @@ def load_model():
     return model.to(device)
 
 
-model = load_model()
+def file_hash(path):
+    """Return the sha256 of the weights file, or None if it does not exist."""
+    if not os.path.exists(path):
+        return None
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def warmup_model(model, batch_sizes=(1, 4), iterations=2):
+    """
+    Run dummy batches through the model so kernel selection and allocator
+    warm-up happen before the first real request.
+    """
+    latencies = {}
+    with torch.no_grad():
+        for batch_size in batch_sizes:
+            dummy = torch.zeros(batch_size, 3, 224, 224, device=device)
+            for _ in range(iterations):
+                start = time.perf_counter()
+                model(dummy)
+                if device.type == "cuda":
+                    torch.cuda.synchronize()
+                elapsed = time.perf_counter() - start
+            latencies[f"batch_{batch_size}"] = round(elapsed * 1000, 2)
+
+    logger.info(f"Model warmed up: {latencies}")
+    return latencies
+
+
+model_info = {
+    "ready": False,
+    "model_version": None,
+    "model_hash": None,
+    "backend": f"torch-{torch.__version__}:{device}",
+    "warm_latency_ms": {},
+}
+
+# version -> (model, info), in load order
+models: Dict[str, tuple] = OrderedDict()
+# (version, model) serving new requests. Replaced in a single assignment, so
+# a request that already picked up the previous model finishes on it
+active = None
+_load_lock = threading.Lock()
+# path -> state of loads that have not finished
+loads: Dict[str, dict] = {}
+
+
+def load_version(model_path, version=None, activate=True):
+    """
+    Load and warm up weights as a new version while the active one keeps
+    serving. version defaults to the start of the weights file hash.
+    """
+    loads[model_path] = {"version": version, "state": "loading"}
+    try:
+        with _load_lock:
+            digest = file_hash(model_path)
+            if version is None:
+                version = digest[:12] if digest else "imagenet"
+
+            if version not in models:
+                model = load_model(model_path)
+                models[version] = (
+                    model,
+                    {
+                        "model_path": model_path,
+                        "model_hash": digest,
+                        "warm_latency_ms": warmup_model(model),
+                        "loaded_at": time.time(),
+                    },
+                )
+                inactive = [v for v in models if active is None or v != active[0]]
+                while len(models) > MAX_VERSIONS and inactive:
+                    models.pop(inactive.pop(0))
+    except Exception as e:
+        loads[model_path] = {"version": version, "state": "failed", "error": str(e)}
+        logger.error(f"Failed to load model from {model_path}: {e}")
+        raise
+
+    loads.pop(model_path, None)
+    if activate:
+        activate_version(version)
+    return version
+
+
+def activate_version(version):
+    """Switch new requests to a loaded version."""
+    global active
+    model, info = models[version]
+    active = (version, model)
+    model_info.update({"ready": True, "model_version": version, **info})
+    logger.info(f"Active model is now {version}")
+
+
+load_version(DEFAULT_MODEL_PATH)
 
 # Category mapping
 category_map = {
@@ -88,6 +205,17 @@ transform = transforms.Compose(
     ]
 )
 
+# Deterministic variant for batches of detector crops
+batch_transform = transforms.Compose(
+    [
+        transforms.Resize((224, 224)),
+        transforms.ToTensor(),
+        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
+    ]
+)
+
+MAX_BATCH_SIZE = 64
+
 
 @app.post("/predict/")
 async def predict(file: UploadFile = File(...)):
@@ -100,33 +228,103 @@ async def predict(file: UploadFile = File(...)):
             status_code=400, detail="Invalid file type. Please upload an image."
         )
 
+    REQUESTS_IN_FLIGHT.inc()
+    version, model = active
     try:
         # Read image file
         contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert("RGB")
+        with time_stage("decode"):
+            image = Image.open(io.BytesIO(contents)).convert("RGB")
 
         # Apply transformations
-        input_tensor = transform(image).unsqueeze(0).to(device)
+        with time_stage("preprocess"):
+            input_tensor = transform(image).unsqueeze(0).to(device)
 
         # Run inference
         with torch.no_grad():
-            outputs = model(input_tensor)
-            _, predicted = torch.max(outputs, 1)
-            prediction = predicted.item()
+            with time_stage("inference"):
+                outputs = model(input_tensor)
+            with time_stage("postprocess"):
+                _, predicted = torch.max(outputs, 1)
+                prediction = predicted.item()
+                confidence = outputs.softmax(1)[0][prediction].item()
 
         logger.info(
-            f"Prediction made: {prediction} - {category_map[prediction]} with confidence {outputs.softmax(1)[0][prediction].item():.4f}"
+            f"Prediction made: {prediction} - {category_map[prediction]} with confidence {confidence:.4f}"
         )
+        PREDICTIONS.inc(result="success")
 
         return {
             "class_id": prediction,
             "class_name": category_map[prediction],
-            "confidence": outputs.softmax(1)[0][prediction].item(),
+            "confidence": confidence,
+            "model_version": version,
         }
 
     except Exception as e:
+        PREDICTIONS.inc(result="error")
         logger.error(f"Error processing image: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
+    finally:
+        REQUESTS_IN_FLIGHT.dec()
+
+
+@app.post("/predict/batch/")
+async def predict_batch(files: List[UploadFile] = File(...)):
+    """
+    Classify several images in a single forward pass, e.g. the object crops
+    sent by the detector's cascade mode. Predictions are returned in the
+    order of the uploaded files.
+    """
+    if len(files) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many images, at most {MAX_BATCH_SIZE} per batch",
+        )
+
+    REQUESTS_IN_FLIGHT.inc()
+    version, model = active
+    try:
+        with time_stage("decode"):
+            images = [
+                Image.open(io.BytesIO(await file.read())).convert("RGB")
+                for file in files
+            ]
+
+        with time_stage("preprocess"):
+            batch = torch.stack([batch_transform(image) for image in images]).to(device)
+
+        with torch.no_grad():
+            with time_stage("inference"):
+                outputs = model(batch)
+            with time_stage("postprocess"):
+                confidences, predicted = outputs.softmax(1).max(1)
+                confidences = confidences.tolist()
+                predicted = predicted.tolist()
+
+        logger.info(f"Batch prediction made for {len(files)} images")
+        PREDICTIONS.inc(len(files), result="success")
+
+        return {
+            "predictions": [
+                {
+                    "class_id": class_id,
+                    "class_name": category_map[class_id],
+                    "confidence": confidence,
+                }
+                for class_id, confidence in zip(predicted, confidences)
+            ],
+            "model_version": version,
+        }
+
+    except Exception as e:
+        PREDICTIONS.inc(len(files), result="error")
+        logger.error(f"Error processing image batch: {str(e)}")
+        raise HTTPException(
+            status_code=500, detail=f"Error processing image batch: {str(e)}"
+        )
+    finally:
+        REQUESTS_IN_FLIGHT.dec()
 
 
 @app.get("/health")
@@ -135,6 +333,89 @@ def health_check():
     return {"status": "healthy", "device": str(device)}
 
 
+@app.get("/ready")
+def readiness_check():
+    """Readiness probe, only succeeds once the model is loaded and warmed up."""
+    if not model_info["ready"]:
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    return {"status": "ready", **model_info}
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Reject model management requests without the configured token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(
+            status_code=403, detail="Model management disabled, set ML_ADMIN_TOKEN"
+        )
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+class ModelLoad(BaseModel):
+    """Request model for loading a model version"""
+
+    # Relative to the weights directory
+    path: str
+    version: Optional[str] = None
+    activate: bool = True
+
+
+def describe_models():
+    return {
+        "active": active[0] if active else None,
+        "versions": {version: info for version, (_, info) in models.items()},
+        "loading": dict(loads),
+    }
+
+
+def _load_in_background(model_path, version, activate):
+    try:
+        load_version(model_path, version, activate)
+    except Exception:
+        # Logged and reported through GET /models
+        pass
+
+
+@app.get("/models", dependencies=[Depends(require_admin)])
+def list_models():
+    return describe_models()
+
+
+@app.post("/models", status_code=202, dependencies=[Depends(require_admin)])
+def load_model_version(load: ModelLoad, background_tasks: BackgroundTasks):
+    """
+    Load and warm up new weights in the background, then switch to them
+    without a restart. Progress is shown under "loading" in GET /models.
+    """
+    weights_dir = os.path.realpath(WEIGHTS_DIR)
+    model_path = os.path.realpath(os.path.join(weights_dir, load.path))
+    if os.path.commonpath([weights_dir, model_path]) != weights_dir:
+        raise HTTPException(
+            status_code=400, detail="Path is outside the weights directory"
+        )
+    if not os.path.isfile(model_path):
+        raise HTTPException(status_code=404, detail="Model file not found")
+
+    background_tasks.add_task(
+        _load_in_background, model_path, load.version, load.activate
+    )
+    return {"status": "loading", "path": model_path}
+
+
+@app.post("/models/{version}/activate", dependencies=[Depends(require_admin)])
+def activate_model_version(version: str):
+    if version not in models:
+        raise HTTPException(status_code=404, detail="Unknown model version")
+    activate_version(version)
+    return describe_models()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Expose metrics in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,146 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Latency buckets in seconds, from image decoding up to CPU inference on
+# large batches
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class _Metric:
+    """A named metric with one value per label set."""
+
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(k)} {v}" for k, v in items]
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets."""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self._buckets = tuple(sorted(buckets))
+        # label key -> [bucket counts..., sum, count]
+        self._states: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            state = self._states.setdefault(key, [0.0] * (len(self._buckets) + 2))
+            for i, bound in enumerate(self._buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._states.items()]
+        samples = []
+        for key, state in items:
+            cumulative = 0.0
+            for bound, count in zip(self._buckets, state):
+                cumulative += count
+                samples.append(
+                    f"{self.name}_bucket{_format_labels(key, ('le', str(bound)))} {cumulative}"
+                )
+            samples.append(
+                f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {state[-1]}"
+            )
+            samples.append(f"{self.name}_sum{_format_labels(key)} {state[-2]}")
+            samples.append(f"{self.name}_count{_format_labels(key)} {state[-1]}")
+        return samples
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for m in self._metrics for line in m.render()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_LATENCY: Histogram = REGISTRY.register(
+    Histogram(
+        "ml_stage_latency_seconds",
+        "Latency of each processing stage (decode, preprocess, inference, postprocess).",
+    )
+)
+REQUESTS_IN_FLIGHT: Gauge = REGISTRY.register(
+    Gauge("ml_requests_in_flight", "Prediction requests currently being processed.")
+)
+PREDICTIONS: Counter = REGISTRY.register(
+    Counter("ml_predictions_total", "Prediction requests by outcome.")
+)
+
+
+def time_stage(stage: str):
+    """Context manager recording the duration of a processing stage."""
+    return STAGE_LATENCY.time(stage=stage)
@@ -31,17 +31,33 @@ interface Detection {
   image_height: number;
 }
 
+interface DetectionMessage {
+  type: "detections";
+  // Server frame pts on the 90 kHz RTP clock
+  pts: number;
+  data: Detection[];
+}
+
+// Detection messages kept while waiting for their frame to be displayed
+const MAX_PENDING_MESSAGES = 30;
+
 export default function ClientDrawingPage() {
   const localVideoRef = useRef<HTMLVideoElement>(null);
   const remoteVideoRef = useRef<HTMLVideoElement>(null);
   const canvasRef = useRef<HTMLCanvasElement>(null);
   const pcRef = useRef<RTCPeerConnection | null>(null);
-  const wsRef = useRef<WebSocket | null>(null);
+  const channelRef = useRef<RTCDataChannel | null>(null);
   const animationRef = useRef<number | null>(null);
 
   // Store detections in a ref to avoid re-renders
   const detectionsRef = useRef<Detection[]>([]);
 
+  // Messages not yet matched to a displayed frame, oldest first
+  const pendingRef = useRef<DetectionMessage[]>([]);
+  // Offset between the RTP timestamps of displayed frames and server pts
+  const rtpOffsetRef = useRef<number | null>(null);
+  const frameCallbackRef = useRef<number | null>(null);
+
   // Store canvas drawing state in refs
   const scaleFactorsRef = useRef({ x: 1, y: 1 });
   const frameCountRef = useRef(0);
@@ -49,20 +65,19 @@ export default function ClientDrawingPage() {
   const [isConnected, setIsConnected] = useState(false);
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
-  const [clientId, setClientId] = useState<string | null>(null);
   const [detections, setDetections] = useState<Detection[]>([]);
   const [confidenceThreshold, setConfidenceThreshold] = useState(0.25);
   const [boxColor, setBoxColor] = useState("#00FF00");
 
   const [debugInfo, setDebugInfo] = useState<{
-    wsStatus: string;
+    channelStatus: string;
     lastMessageTime: number | null;
     messageCount: number;
     detectionCount: number;
     canvasSize: { width: number; height: number } | null;
     videoSize: { width: number; height: number } | null;
   }>({
-    wsStatus: "Not connected",
+    channelStatus: "Not connected",
     lastMessageTime: null,
     messageCount: 0,
     detectionCount: 0,
@@ -70,102 +85,117 @@ export default function ClientDrawingPage() {
     videoSize: null,
   });
 
-  // Set up WebSocket connection for detection data
-  const setupWebSocket = () => {
-    const wsUrl = `ws://127.0.0.1:5005/ws/detections`;
-    console.log(`Attempting WebSocket connection to: ${wsUrl}`);
-
-    setDebugInfo((prev) => ({
-      ...prev,
-      wsStatus: `Connecting to ${wsUrl}...`,
-    }));
-    const ws = new WebSocket(wsUrl);
-
-    const connectionTimeout = setTimeout(() => {
-      if (ws.readyState !== 1) {
-        console.error("WebSocket connection timed out after 5 seconds");
-        setError(
-          "WebSocket connection timed out - server may not be reachable"
-        );
-        setDebugInfo((prev) => ({ ...prev, wsStatus: "Connection timeout" }));
+  const showDetections = (detections: Detection[]) => {
+    detectionsRef.current = detections;
+
+    // Update state less frequently
+    if (frameCountRef.current % 5 === 0) {
+      setDetections(detections);
+      setDebugInfo((prev) => ({
+        ...prev,
+        detectionCount: detections.length,
+      }));
+    }
+  };
+
+  // Store detections received over the data channel until their frame shows
+  const handleDetectionMessage = (event: MessageEvent) => {
+    try {
+      const message = JSON.parse(event.data);
+      if (message.type !== "detections") {
+        return;
       }
-    }, 5000);
 
-    ws.onopen = () => {
-      console.log("WebSocket connection opened");
-      clearTimeout(connectionTimeout);
-      setDebugInfo((prev) => ({ ...prev, wsStatus: "Connected ✓" }));
-    };
+      // Update debug info less frequently
+      if (frameCountRef.current % 10 === 0) {
+        setDebugInfo((prev) => ({
+          ...prev,
+          lastMessageTime: Date.now(),
+          messageCount: prev.messageCount + 1,
+        }));
+      }
 
-    ws.onmessage = (event) => {
-      try {
-        const message = JSON.parse(event.data);
-
-        // Update debug info less frequently
-        if (frameCountRef.current % 10 === 0) {
-          setDebugInfo((prev) => ({
-            ...prev,
-            lastMessageTime: Date.now(),
-            messageCount: prev.messageCount + 1,
-          }));
-        }
+      const pending = pendingRef.current;
+      pending.push(message);
+      if (pending.length > MAX_PENDING_MESSAGES) {
+        pending.shift();
+      }
 
-        if (message.type === "client_id") {
-          console.log(`Received client_id: ${message.client_id}`);
-          setClientId(message.client_id);
-        } else if (message.type === "detections") {
-          // Store in ref for immediate access
-          detectionsRef.current = message.data;
-
-          // Update state less frequently
-          if (frameCountRef.current % 5 === 0) {
-            setDetections(message.data);
-            setDebugInfo((prev) => ({
-              ...prev,
-              detectionCount: message.data.length,
-            }));
-          }
-
-          if (message.data.length > 0 && frameCountRef.current % 30 === 0) {
-            const firstDetection = message.data[0];
-            console.log(
-              `Received ${message.data.length} detections. First: ${firstDetection.class_name} (${firstDetection.confidence.toFixed(2)})`
-            );
-          }
-        }
+      // Without per-frame callbacks, show the latest results directly
+      if (!("requestVideoFrameCallback" in HTMLVideoElement.prototype)) {
+        showDetections(message.data);
+        pending.length = 0;
+      }
 
-        frameCountRef.current++;
-      } catch (err) {
-        console.error("Error processing WebSocket message:", err);
+      if (message.data.length > 0 && frameCountRef.current % 30 === 0) {
+        const firstDetection = message.data[0];
+        console.log(
+          `Received ${message.data.length} detections for pts ${message.pts}. First: ${firstDetection.class_name} (${firstDetection.confidence.toFixed(2)})`
+        );
       }
-    };
 
-    ws.onerror = (error) => {
-      console.error("WebSocket error:", error);
-      setError(
-        `Failed to connect to detection stream: ${error.message || "Unknown error"}`
-      );
-      setDebugInfo((prev) => ({
-        ...prev,
-        wsStatus: `Error: ${error.message || "Unknown"}`,
-      }));
-    };
+      frameCountRef.current++;
+    } catch (err) {
+      console.error("Error processing detection message:", err);
+    }
+  };
 
-    ws.onclose = () => {
-      console.log("WebSocket connection closed");
-      setDebugInfo((prev) => ({ ...prev, wsStatus: "Closed" }));
-    };
+  // Match the displayed frame to the detections computed on it. The server
+  // forwards frames unchanged, so a frame's RTP timestamp is its server pts
+  // plus a constant offset. Detections are sent before their frame, so
+  // RTP timestamp minus the newest received pts never exceeds that offset
+  // and equals it whenever the newest detections belong to the frame shown.
+  const onVideoFrame = (
+    _now: number,
+    metadata: VideoFrameCallbackMetadata & { rtpTimestamp?: number }
+  ) => {
+    const video = remoteVideoRef.current;
+    if (!video) {
+      return;
+    }
+
+    const pending = pendingRef.current;
+    const rtp = metadata.rtpTimestamp;
+    if (rtp !== undefined && pending.length > 0) {
+      const estimate = (rtp - pending[pending.length - 1].pts) >>> 0;
+      if (
+        rtpOffsetRef.current === null ||
+        ((estimate - rtpOffsetRef.current) | 0) > 0
+      ) {
+        rtpOffsetRef.current = estimate;
+      }
 
-    wsRef.current = ws;
-    return ws;
+      const pts = (rtp - rtpOffsetRef.current) >>> 0;
+      let matched = -1;
+      for (let i = 0; i < pending.length; i++) {
+        if (((pending[i].pts - pts) | 0) <= 0) {
+          matched = i;
+        }
+      }
+      if (matched >= 0) {
+        showDetections(pending[matched].data);
+        pending.splice(0, matched + 1);
+      }
+    } else if (rtp === undefined && pending.length > 0) {
+      showDetections(pending[pending.length - 1].data);
+      pending.length = 0;
+    }
+
+    frameCallbackRef.current = video.requestVideoFrameCallback(onVideoFrame);
   };
 
-  // Clean up WebSocket connection
-  const cleanupWebSocket = () => {
-    if (wsRef.current) {
-      wsRef.current.close();
-      wsRef.current = null;
+  // Close the detections data channel
+  const cleanupDataChannel = () => {
+    if (channelRef.current) {
+      channelRef.current.close();
+      channelRef.current = null;
+    }
+    if (frameCallbackRef.current !== null && remoteVideoRef.current) {
+      remoteVideoRef.current.cancelVideoFrameCallback(frameCallbackRef.current);
     }
+    frameCallbackRef.current = null;
+    pendingRef.current = [];
+    rtpOffsetRef.current = null;
   };
 
   // Draw bounding boxes on canvas based on detections
@@ -266,41 +296,27 @@ export default function ClientDrawingPage() {
       setIsLoading(true);
       setError(null);
 
-      // Connect WebSocket first
-      const wsPromise = new Promise((resolve, reject) => {
-        const ws = setupWebSocket();
-
-        const wsTimeout = setTimeout(() => {
-          reject(new Error("WebSocket connection timed out"));
-        }, 5000);
-
-        ws.onopen = () => {
-          clearTimeout(wsTimeout);
-          resolve(ws);
-        };
-
-        ws.onerror = (err) => {
-          clearTimeout(wsTimeout);
-          reject(new Error("WebSocket connection failed"));
-        };
-      });
-
-      try {
-        await wsPromise;
-        console.log("WebSocket connected, proceeding with WebRTC");
-      } catch (wsError) {
-        console.error("Failed to establish WebSocket connection:", wsError);
-        setError("Could not connect to detection stream. Please try again.");
-        setIsLoading(false);
-        return;
-      }
-
       // Create peer connection
       const pc = new RTCPeerConnection({
         iceServers: [{ urls: "stun:stun.l.google.com:19302" }],
       });
       pcRef.current = pc;
 
+      // Detections arrive on a data channel of the same connection. Stale
+      // results are useless, so the channel is unordered without retransmits
+      const channel = pc.createDataChannel("detections", {
+        ordered: false,
+        maxRetransmits: 0,
+      });
+      channel.onopen = () => {
+        setDebugInfo((prev) => ({ ...prev, channelStatus: "Open ✓" }));
+      };
+      channel.onclose = () => {
+        setDebugInfo((prev) => ({ ...prev, channelStatus: "Closed" }));
+      };
+      channel.onmessage = handleDetectionMessage;
+      channelRef.current = channel;
+
       // Get user media
       const stream = await navigator.mediaDevices.getUserMedia({
         video: {
@@ -359,6 +375,12 @@ export default function ClientDrawingPage() {
                 }
 
                 animationRef.current = requestAnimationFrame(drawBoundingBoxes);
+
+                const video = remoteVideoRef.current;
+                if (video && "requestVideoFrameCallback" in video) {
+                  frameCallbackRef.current =
+                    video.requestVideoFrameCallback(onVideoFrame);
+                }
               })
               .catch((err) => {
                 console.error("Failed to play remote video:", err);
@@ -389,14 +411,7 @@ export default function ClientDrawingPage() {
       });
       await pc.setLocalDescription(offer);
 
-      // Wait for client ID from WebSocket before sending offer
-      let retries = 0;
-      while (!clientId && retries < 50) {
-        await new Promise((resolve) => setTimeout(resolve, 100));
-        retries++;
-      }
-
-      console.log(`Sending offer with client_id: ${clientId}`);
+      console.log("Sending offer");
       const response = await fetch(
         `${process.env.NEXT_PUBLIC_API_URL || "http://localhost:5005"}/client-drawing-offer`,
         {
@@ -407,7 +422,6 @@ export default function ClientDrawingPage() {
           body: JSON.stringify({
             sdp: pc.localDescription?.sdp,
             type: pc.localDescription?.type,
-            client_id: clientId,
           }),
         }
       );
@@ -425,7 +439,7 @@ export default function ClientDrawingPage() {
         err instanceof Error ? err.message : "An unknown error occurred"
       );
       setIsLoading(false);
-      cleanupWebSocket();
+      cleanupDataChannel();
     }
   };
 
@@ -436,7 +450,7 @@ export default function ClientDrawingPage() {
       animationRef.current = null;
     }
 
-    cleanupWebSocket();
+    cleanupDataChannel();
 
     if (pcRef.current) {
       pcRef.current.close();
@@ -462,7 +476,6 @@ export default function ClientDrawingPage() {
 
     detectionsRef.current = [];
     setDetections([]);
-    setClientId(null);
     setIsConnected(false);
   };
 
@@ -630,9 +643,8 @@ export default function ClientDrawingPage() {
         <CardContent>
           <div className="grid grid-cols-2 md:grid-cols-3 gap-4">
             <div>
-              <h3 className="font-semibold">WebSocket</h3>
-              <p>Status: {debugInfo.wsStatus}</p>
-              <p>Client ID: {clientId || "None"}</p>
+              <h3 className="font-semibold">Data channel</h3>
+              <p>Status: {debugInfo.channelStatus}</p>
               <p>Messages: {debugInfo.messageCount}</p>
               <p>
                 Last message:{" "}
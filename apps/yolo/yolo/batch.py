@@ -0,0 +1,380 @@
+"""
+Offline batch detection over a directory, glob, or tar/zip archive.
+
+Run from the yolo directory, e.g.:
+
+    python -m batch /data/photos --output results.jsonl --checkpoint photos.ckpt
+    python -m batch "archive/**/*.jpg" --format parquet --output results/
+    python -m batch photos.tar.gz --annotated-dir annotated/ --batch-size 32
+
+Images are read and decoded on a thread pool and run through the model in
+batches. Keys of finished images are appended to the checkpoint file after
+their results are written, so an interrupted run can be restarted with the
+same arguments and continues where it stopped (images that were in flight
+may be written twice).
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import tarfile
+import zipfile
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import cv2
+import numpy as np
+
+from core.model import get_model
+from core.postprocess import (
+    class_names,
+    extract_detections,
+    scale_detections,
+    serialize_detections,
+)
+from core.preprocess import decode_image
+from core.render import draw_detections
+from core.scheduler import Priority, scheduler
+from utils.logger import setup_logger
+from config import SETTINGS
+
+logger = setup_logger()
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+# Parquet rows written per part file
+ROWS_PER_PART = 50000
+
+
+def _is_image(name: str) -> bool:
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def iter_inputs(source: str) -> Iterator[Tuple[str, Callable[[], bytes]]]:
+    """
+    Yield (key, loader) pairs for every image in a directory, zip or tar
+    archive, or glob pattern. Loaders are called on the decode pool, except
+    for tar archives, which are streamed and so read in order here.
+    """
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if _is_image(name):
+                    path = os.path.join(root, name)
+                    yield os.path.relpath(path, source), partial(_read_file, path)
+    elif os.path.isfile(source) and zipfile.is_zipfile(source):
+        # ZipFile serializes reads of the shared file handle internally
+        archive = zipfile.ZipFile(source)
+        for info in archive.infolist():
+            if not info.is_dir() and _is_image(info.filename):
+                yield info.filename, partial(archive.read, info)
+    elif os.path.isfile(source) and tarfile.is_tarfile(source):
+        with tarfile.open(source, "r|*") as archive:
+            for member in archive:
+                if member.isfile() and _is_image(member.name):
+                    data = archive.extractfile(member).read()
+                    yield member.name, partial(bytes, data)
+    else:
+        for path in glob.iglob(source, recursive=True):
+            if os.path.isfile(path) and _is_image(path):
+                yield path, partial(_read_file, path)
+
+
+class Checkpoint:
+    """Append-only record of the keys that have been fully processed"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.done: Set[str] = set()
+        self._file = None
+        if path:
+            if os.path.exists(path):
+                with open(path) as f:
+                    self.done = {line.rstrip("\n") for line in f if line.strip()}
+            self._file = open(path, "a")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.done
+
+    def mark(self, keys: List[str]) -> None:
+        self.done.update(keys)
+        if self._file:
+            self._file.writelines(f"{key}\n" for key in keys)
+            self._file.flush()
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+
+
+class JsonlWriter:
+    """
+    Appends one JSON object per image. Like ParquetWriter, write and close
+    return the keys of the rows that reached the output, which are the
+    ones that may be checkpointed.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "a")
+
+    def write(self, rows: List[Dict[str, Any]]) -> List[str]:
+        self._file.writelines(json.dumps(row) + "\n" for row in rows)
+        self._file.flush()
+        return [row["key"] for row in rows]
+
+    def close(self) -> List[str]:
+        self._file.close()
+        return []
+
+
+class ParquetWriter:
+    """
+    Writes rows to numbered part files in a directory, so resumed runs add
+    new parts next to the existing ones.
+    """
+
+    def __init__(self, directory: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            sys.exit("Parquet output requires pyarrow (poetry install -E parquet)")
+
+        self._pa, self._pq = pa, pq
+        detection = pa.struct(
+            [
+                ("x1", pa.float32()),
+                ("y1", pa.float32()),
+                ("x2", pa.float32()),
+                ("y2", pa.float32()),
+                ("confidence", pa.float32()),
+                ("class_id", pa.int32()),
+                ("class_name", pa.string()),
+            ]
+        )
+        self._schema = pa.schema(
+            [
+                ("key", pa.string()),
+                ("width", pa.int32()),
+                ("height", pa.int32()),
+                ("detections", pa.list_(detection)),
+                ("error", pa.string()),
+            ]
+        )
+
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._part = len(glob.glob(os.path.join(directory, "part-*.parquet")))
+        self._rows: List[Dict[str, Any]] = []
+
+    def write(self, rows: List[Dict[str, Any]]) -> List[str]:
+        """Buffer rows; returns the keys written if a part file was flushed."""
+        self._rows.extend(rows)
+        if len(self._rows) >= ROWS_PER_PART:
+            return self.flush()
+        return []
+
+    def flush(self) -> List[str]:
+        """Write the buffered rows as a part file and return their keys."""
+        if not self._rows:
+            return []
+        table = self._pa.Table.from_pylist(self._rows, schema=self._schema)
+        path = os.path.join(self.directory, f"part-{self._part:05d}.parquet")
+        self._pq.write_table(table, path)
+        self._part += 1
+        keys = [row["key"] for row in self._rows]
+        self._rows = []
+        return keys
+
+    def close(self) -> List[str]:
+        return self.flush()
+
+
+def _annotated_path(directory: str, key: str) -> str:
+    """Map a key to a path under directory, refusing to escape it"""
+    relative = os.path.normpath(key.replace("\\", "/")).lstrip("/")
+    if relative.startswith(".."):
+        relative = relative.replace("..", "_")
+    return os.path.join(directory, relative)
+
+
+def _load(key: str, loader: Callable[[], bytes], full_resolution: bool):
+    """Read and decode one image on the decode pool"""
+    try:
+        data = loader()
+        img, dimensions = decode_image(
+            data, None if full_resolution else SETTINGS["inference_size"]
+        )
+    except Exception as e:
+        logger.error(f"Could not read {key}: {e}")
+        return key, None, None
+    return key, img, dimensions
+
+
+class BatchRunner:
+    """Runs batches of decoded images through the model and writes the results"""
+
+    def __init__(self, writer, checkpoint: Checkpoint, args):
+        self.writer = writer
+        self.checkpoint = checkpoint
+        self.args = args
+        self.model = get_model()
+        self.names = class_names(self.model)
+        self.processed = 0
+        self.failed = 0
+
+    def run(self, batch: List[Tuple[str, Optional[np.ndarray], Any]]) -> None:
+        rows = []
+        images = [(key, img, dims) for key, img, dims in batch if img is not None]
+
+        for key, img, _ in batch:
+            if img is None:
+                rows.append(
+                    {
+                        "key": key,
+                        "width": None,
+                        "height": None,
+                        "detections": [],
+                        "error": "decode_failed",
+                    }
+                )
+                self.failed += 1
+
+        if images:
+            results = scheduler.run(
+                partial(
+                    self.model.predict,
+                    source=[img for _, img, _ in images],
+                    conf=self.args.confidence,
+                    verbose=False,
+                ),
+                Priority.BATCH,
+            )
+            for (key, img, (width, height)), result in zip(images, results):
+                detections = scale_detections(
+                    extract_detections([result]),
+                    width / img.shape[1],
+                    height / img.shape[0],
+                )
+                rows.append(
+                    {
+                        "key": key,
+                        "width": width,
+                        "height": height,
+                        "detections": serialize_detections(detections, self.names),
+                        "error": None,
+                    }
+                )
+
+                if self.args.annotated_dir:
+                    draw_detections(img, detections, self.names)
+                    path = _annotated_path(self.args.annotated_dir, key)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    cv2.imwrite(path, img)
+
+        # Only rows that reached the output are done; buffered ones are
+        # marked once their part file is written
+        self.checkpoint.mark(self.writer.write(rows))
+        self.processed += len(images)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("source", help="Directory, glob pattern, or tar/zip archive")
+    parser.add_argument(
+        "--output",
+        required=True,
+        help="JSONL file, or a directory of part files for --format parquet",
+    )
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    parser.add_argument(
+        "--annotated-dir", help="Also write annotated images into this directory"
+    )
+    parser.add_argument("--checkpoint", help="File recording finished images")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 4, help="Decode threads"
+    )
+    parser.add_argument(
+        "--confidence", type=float, default=SETTINGS["detection_confidence"]
+    )
+    parser.add_argument("--limit", type=int, help="Stop after this many images")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+
+    checkpoint = Checkpoint(args.checkpoint)
+    if checkpoint.done:
+        logger.info(f"Resuming, {len(checkpoint.done)} images already processed")
+
+    writer = (
+        ParquetWriter(args.output)
+        if args.format == "parquet"
+        else JsonlWriter(args.output)
+    )
+    runner = BatchRunner(writer, checkpoint, args)
+
+    # Annotated outputs are drawn at full resolution; otherwise large JPEGs
+    # are decoded straight at reduced size
+    full_resolution = bool(args.annotated_dir)
+    # Enough decoded images in flight to keep the model busy without
+    # holding the whole input in memory
+    window = args.batch_size * 2 + args.workers
+
+    start = time.perf_counter()
+    submitted = 0
+    pending = deque()
+    batch = []
+
+    def drain(limit: int) -> None:
+        while len(pending) > limit:
+            batch.append(pending.popleft().result())
+            if len(batch) >= args.batch_size:
+                runner.run(batch)
+                batch.clear()
+
+                done = runner.processed + runner.failed
+                if done % (args.batch_size * 20) < args.batch_size:
+                    rate = done / (time.perf_counter() - start)
+                    logger.info(f"Processed {done} images ({rate:.1f}/s)")
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            for key, loader in iter_inputs(args.source):
+                if key in checkpoint:
+                    continue
+                if args.limit is not None and submitted >= args.limit:
+                    break
+                pending.append(pool.submit(_load, key, loader, full_resolution))
+                submitted += 1
+                drain(window)
+
+            drain(0)
+            if batch:
+                runner.run(batch)
+    finally:
+        checkpoint.mark(writer.close())
+        checkpoint.close()
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Batch complete: {runner.processed} images processed, {runner.failed} failed "
+        f"in {elapsed:.1f}s ({runner.processed / elapsed if elapsed else 0:.1f}/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,415 @@
+"""
+End-to-end benchmark for the YOLO entry points.
+
+Run from the yolo directory, e.g.:
+
+    python -m bench.benchmark --scenarios image,webrtc --concurrency 4 \
+        --output bench.json --baseline previous.json
+
+Everything runs in-process and offline; pass --device cpu to hide any GPU.
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+import cv2
+
+from bench.common import (
+    DEFAULT_IMAGES_DIR,
+    ResourceMonitor,
+    SyntheticVideoTrack,
+    encode_data_url,
+    free_port,
+    load_sample_images,
+    summarize_latencies,
+)
+
+SCENARIOS = ["image", "video", "localonly", "webrtc_server", "webrtc_client"]
+
+
+# Address every in-process client reports; see _disable_load_shedding
+BENCH_CLIENT = "127.0.0.1"
+
+
+def _disable_load_shedding() -> None:
+    """
+    Let every frame through admission and deadlines, so scenarios time the
+    pipeline rather than the load shedding in front of it (bench.loadgen
+    measures that against a running server).
+    """
+    from config import SETTINGS
+
+    SETTINGS["admission_exempt_clients"] = [BENCH_CLIENT]
+    SETTINGS["admission_global_fps"] = 1e9
+    SETTINGS["live_frame_deadline_ms"] = 3_600_000
+
+
+def _scenario_result(
+    latencies: List[float], monitor: ResourceMonitor, concurrency: int, unit: str
+) -> Dict[str, Any]:
+    return {
+        "concurrency": concurrency,
+        "throughput_per_s": round(len(latencies) / monitor.wall_seconds, 3)
+        if monitor.wall_seconds > 0
+        else 0.0,
+        "throughput_unit": unit,
+        "latency_ms": summarize_latencies(latencies),
+        **monitor.report(),
+    }
+
+
+def _run_threaded(
+    task: Callable[[int], None], iterations: int, concurrency: int
+) -> List[float]:
+    """Run task(i) for every iteration on a thread pool, returning latencies."""
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def timed(i: int):
+        start = time.perf_counter()
+        task(i)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, range(iterations)))
+    return latencies
+
+
+def bench_image(args, workdir: str) -> Dict[str, Any]:
+    from routers.file_upload import process_image
+
+    images = []
+    for name in sorted(os.listdir(args.images_dir)):
+        ext = os.path.splitext(name)[1].lower()
+        if ext in (".jpg", ".jpeg", ".png"):
+            with open(os.path.join(args.images_dir, name), "rb") as f:
+                images.append((f.read(), ext))
+
+    def task(i: int):
+        data, ext = images[i % len(images)]
+        process_image(data, ext)
+
+    with ResourceMonitor() as monitor:
+        latencies = _run_threaded(task, args.iterations, args.concurrency)
+    return _scenario_result(latencies, monitor, args.concurrency, "images")
+
+
+def _write_sample_video(path: str, images, frames: int, fps: int = 30) -> None:
+    height, width = images[0].shape[:2]
+    writer = cv2.VideoWriter(
+        path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height)
+    )
+    for i in range(frames):
+        writer.write(images[i % len(images)])
+    writer.release()
+
+
+def bench_video(args, workdir: str) -> Dict[str, Any]:
+    from routers.file_upload import process_video
+
+    images = load_sample_images(args.images_dir, size=args.frame_size)
+    video_path = os.path.join(workdir, "sample.mp4")
+    _write_sample_video(video_path, images, args.video_frames)
+
+    iterations = max(1, args.iterations // 10)
+
+    def task(i: int):
+        process_video(video_path, os.path.join(workdir, f"video_{i}.mp4"))
+
+    with ResourceMonitor() as monitor:
+        latencies = _run_threaded(task, iterations, args.concurrency)
+
+    result = _scenario_result(latencies, monitor, args.concurrency, "videos")
+    result["video_frames"] = args.video_frames
+    result["frames_per_s"] = round(
+        iterations * args.video_frames / monitor.wall_seconds, 3
+    )
+    return result
+
+
+class _ServerThread:
+    """Run the full FastAPI application on a local port in a background thread."""
+
+    def __init__(self):
+        import uvicorn
+        from main import app
+
+        self.port = free_port()
+        config = uvicorn.Config(
+            app, host="127.0.0.1", port=self.port, log_level="warning"
+        )
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._server.should_exit = True
+        self._thread.join()
+        return False
+
+
+async def _localonly_client(url: str, frames: List[str], count: int) -> List[float]:
+    import websockets
+
+    latencies = []
+    async with websockets.connect(url, max_size=None) as ws:
+        hello = json.loads(await ws.recv())
+        client_id = hello.get("client_id")
+
+        for i in range(count):
+            message = json.dumps(
+                {
+                    "type": "video_frame",
+                    "client_id": client_id,
+                    "frame": frames[i % len(frames)],
+                    "timestamp": int(time.time() * 1000),
+                }
+            )
+            start = time.perf_counter()
+            await ws.send(message)
+            # Frames the server did not run are answered with "dropped"
+            reply = json.loads(await ws.recv())
+            while reply.get("type") not in ("detections", "dropped"):
+                reply = json.loads(await ws.recv())
+            if reply["type"] == "detections":
+                latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_localonly(args, workdir: str) -> Dict[str, Any]:
+    images = load_sample_images(args.images_dir, size=args.frame_size)
+    frames = [encode_data_url(img) for img in images]
+    per_client = max(1, args.iterations // args.concurrency)
+
+    async def run(url: str) -> List[float]:
+        results = await asyncio.gather(
+            *[
+                _localonly_client(url, frames, per_client)
+                for _ in range(args.concurrency)
+            ]
+        )
+        return [latency for client in results for latency in client]
+
+    with _ServerThread() as server:
+        url = f"ws://127.0.0.1:{server.port}/localonly/ws/detections"
+        with ResourceMonitor() as monitor:
+            latencies = asyncio.run(run(url))
+    return _scenario_result(latencies, monitor, args.concurrency, "frames")
+
+
+def _bench_track(args, track_cls, label: str) -> Dict[str, Any]:
+    """
+    Pull frames through a track as fast as it returns them. Only frames the
+    track ran the detector on are timed; the others are passed through.
+    """
+    from config import SETTINGS
+    from utils.metrics import FRAMES_DROPPED, FRAMES_PROCESSED
+
+    images = load_sample_images(args.images_dir, size=args.frame_size)
+    per_track = max(1, args.iterations // args.concurrency)
+
+    async def drive(track) -> List[float]:
+        latencies = []
+        for _ in range(per_track):
+            processed = FRAMES_PROCESSED.value(track=label)
+            start = time.perf_counter()
+            await track.recv()
+            elapsed = time.perf_counter() - start
+            # Frames of other tracks may finish meanwhile, so this only
+            # tells whether some frame was run; the count check below
+            # makes sure every due frame was
+            if FRAMES_PROCESSED.value(track=label) > processed:
+                latencies.append(elapsed)
+        return latencies
+
+    async def run() -> List[float]:
+        tracks = [
+            track_cls(SyntheticVideoTrack(images, paced=False), client=BENCH_CLIENT)
+            for _ in range(args.concurrency)
+        ]
+        results = await asyncio.gather(*[drive(track) for track in tracks])
+        return [latency for track in results for latency in track]
+
+    before = FRAMES_PROCESSED.value(track=label)
+    with ResourceMonitor() as monitor:
+        latencies = asyncio.run(run())
+
+    processed = FRAMES_PROCESSED.value(track=label) - before
+    due = args.concurrency * (per_track // SETTINGS["detection_interval"])
+    if processed != due:
+        dropped = {
+            reason: FRAMES_DROPPED.value(track=label, reason=reason)
+            for reason in ("rate_limited", "overloaded", "deadline", "error")
+        }
+        raise RuntimeError(
+            f"{label}: {processed:.0f} of {due} due frames were processed, "
+            f"drops so far: {dropped}"
+        )
+
+    result = _scenario_result(latencies, monitor, args.concurrency, "detected_frames")
+    result["frames_per_s"] = round(
+        args.concurrency * per_track / monitor.wall_seconds, 3
+    )
+    return result
+
+
+def bench_webrtc_server(args, workdir: str) -> Dict[str, Any]:
+    from tracks.yolo_track import YOLOVideoStreamTrack
+
+    return _bench_track(args, YOLOVideoStreamTrack, "server_drawing")
+
+
+def bench_webrtc_client(args, workdir: str) -> Dict[str, Any]:
+    from tracks.client_track import ClientDrawingYOLOVideoStreamTrack
+
+    return _bench_track(args, ClientDrawingYOLOVideoStreamTrack, "client_drawing")
+
+
+BENCHMARKS = {
+    "image": bench_image,
+    "video": bench_video,
+    "localonly": bench_localonly,
+    "webrtc_server": bench_webrtc_server,
+    "webrtc_client": bench_webrtc_client,
+}
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """Print throughput and tail latency changes against a previous report."""
+    print(f"Comparing against {baseline.get('revision', 'baseline')}:")
+    for name, result in report["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+
+        def change(new, old):
+            return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+        print(
+            f"  {name}: throughput {change(result['throughput_per_s'], previous['throughput_per_s'])}, "
+            f"p95 {change(result['latency_ms']['p95'], previous['latency_ms']['p95'])}, "
+            f"p99 {change(result['latency_ms']['p99'], previous['latency_ms']['p99'])}, "
+            f"peak RSS {change(result['rss_mb']['peak'], previous['rss_mb']['peak'])}"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help=f"Comma separated scenarios to run ({', '.join(SCENARIOS)})",
+    )
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=50,
+        help="Requests/frames per scenario (videos use a tenth of this)",
+    )
+    parser.add_argument("--images-dir", default=DEFAULT_IMAGES_DIR)
+    parser.add_argument(
+        "--frame-size",
+        default="1280x720",
+        help="WIDTHxHEIGHT of frames for the video, websocket and WebRTC scenarios",
+    )
+    parser.add_argument("--video-frames", type=int, default=90)
+    parser.add_argument("--device", default=None, help="Set to 'cpu' to hide GPUs")
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    parser.add_argument("--baseline", help="Previous JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    width, height = args.frame_size.lower().split("x")
+    args.frame_size = (int(width), int(height))
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None) -> Dict[str, Any]:
+    args = parse_args(argv)
+
+    if args.device == "cpu":
+        # Must happen before torch is imported by the model module
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+    from core.model import warmup_model
+
+    _disable_load_shedding()
+    model_info = warmup_model()
+
+    report = {
+        "revision": _git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "model": model_info,
+        "config": {
+            "concurrency": args.concurrency,
+            "iterations": args.iterations,
+            "frame_size": list(args.frame_size),
+            "video_frames": args.video_frames,
+        },
+        "scenarios": {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="yolo-bench-") as workdir:
+        for name in args.scenarios:
+            print(f"Running {name} benchmark...", flush=True)
+            result = BENCHMARKS[name](args, workdir)
+            report["scenarios"][name] = result
+            print(
+                f"  {result['throughput_per_s']} {result['throughput_unit']}/s, "
+                f"p50 {result['latency_ms']['p50']}ms, "
+                f"p95 {result['latency_ms']['p95']}ms, "
+                f"p99 {result['latency_ms']['p99']}ms, "
+                f"peak RSS {result['rss_mb']['peak']}MB",
+                flush=True,
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(report, json.load(f))
+
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import os
+import glob
+import base64
+import time
+import asyncio
+import socket
+import resource
+import fractions
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+from av import VideoFrame
+from aiortc import VideoStreamTrack
+
+DATA_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "training_and_data"
+)
+DEFAULT_IMAGES_DIR = os.path.join(DATA_DIR, "test", "images")
+
+VIDEO_CLOCK_RATE = 90000
+VIDEO_TIME_BASE = fractions.Fraction(1, VIDEO_CLOCK_RATE)
+
+
+def load_sample_images(
+    images_dir: str = DEFAULT_IMAGES_DIR,
+    limit: int = 32,
+    size: Optional[Tuple[int, int]] = None,
+) -> List[np.ndarray]:
+    """
+    Load sample images from the training data, optionally resized to a fixed
+    (width, height) so synthetic video tracks have a constant resolution.
+    """
+    paths = sorted(
+        p
+        for ext in ("*.jpg", "*.jpeg", "*.png")
+        for p in glob.glob(os.path.join(images_dir, ext))
+    )[:limit]
+
+    images = []
+    for path in paths:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        if size is not None:
+            img = cv2.resize(img, size)
+        images.append(img)
+
+    if not images:
+        raise RuntimeError(f"No sample images found in {images_dir}")
+    return images
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    return float(np.percentile(np.asarray(values), pct))
+
+
+def summarize_latencies(latencies: List[float]) -> Dict[str, float]:
+    """Summarize latencies given in seconds as milliseconds."""
+    return {
+        "count": len(latencies),
+        "mean": round(float(np.mean(latencies)) * 1000, 3) if latencies else 0.0,
+        "p50": round(percentile(latencies, 50) * 1000, 3),
+        "p95": round(percentile(latencies, 95) * 1000, 3),
+        "p99": round(percentile(latencies, 99) * 1000, 3),
+        "max": round(max(latencies) * 1000, 3) if latencies else 0.0,
+    }
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process, read from /proc on Linux."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is reported in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ResourceMonitor:
+    """
+    Track wall time, process CPU time and peak RSS over a benchmark run.
+    RSS is sampled on a background thread since ru_maxrss never goes down.
+    """
+
+    def __init__(self, interval: float = 0.05):
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.peak_rss = 0
+
+    def __enter__(self):
+        self.start_rss = current_rss_bytes()
+        self.peak_rss = self.start_rss
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.wall_seconds = time.perf_counter() - self._wall_start
+        self.cpu_seconds = time.process_time() - self._cpu_start
+        self._stop.set()
+        self._thread.join()
+        self.end_rss = current_rss_bytes()
+        return False
+
+    def _sample(self):
+        while not self._stop.wait(self._interval):
+            self.peak_rss = max(self.peak_rss, current_rss_bytes())
+
+    def report(self) -> Dict[str, Any]:
+        mb = 1024 * 1024
+        return {
+            "wall_seconds": round(self.wall_seconds, 3),
+            "cpu_seconds": round(self.cpu_seconds, 3),
+            "cpu_percent": round(100 * self.cpu_seconds / self.wall_seconds, 1)
+            if self.wall_seconds > 0
+            else 0.0,
+            "rss_mb": {
+                "start": round(self.start_rss / mb, 1),
+                "peak": round(self.peak_rss / mb, 1),
+                "end": round(self.end_rss / mb, 1),
+            },
+        }
+
+
+class SyntheticVideoTrack(VideoStreamTrack):
+    """
+    aiortc video track that cycles through sample images.
+    When paced, frames are delivered in real time at the given fps like a
+    camera; otherwise they are produced as fast as the consumer pulls them.
+    """
+
+    def __init__(self, images: List[np.ndarray], fps: int = 30, paced: bool = True):
+        super().__init__()
+        # Pre-convert to the YUV format a decoded camera stream arrives in
+        self._frames = [
+            VideoFrame.from_ndarray(img, format="bgr24").reformat(format="yuv420p")
+            for img in images
+        ]
+        self._fps = fps
+        self._paced = paced
+        self._index = 0
+        self._pts = 0
+        self._start = None
+
+    async def next_timestamp(self):
+        if self._start is None:
+            self._start = time.time()
+        else:
+            self._pts += int(VIDEO_CLOCK_RATE / self._fps)
+
+        if self._paced:
+            wait = self._start + self._pts / VIDEO_CLOCK_RATE - time.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        return self._pts, VIDEO_TIME_BASE
+
+    async def recv(self):
+        pts, time_base = await self.next_timestamp()
+        frame = self._frames[self._index % len(self._frames)]
+        self._index += 1
+
+        frame.pts = pts
+        frame.time_base = time_base
+        return frame
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def encode_data_url(img: np.ndarray, quality: int = 70) -> str:
+    """Encode a frame the way the browser client does (JPEG data URL)."""
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError("Failed to encode frame")
+    return "data:image/jpeg;base64," + base64.b64encode(buf.tobytes()).decode()
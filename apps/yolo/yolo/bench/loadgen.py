@@ -0,0 +1,486 @@
+"""
+Load generator for sizing a yolo node.
+
+Spins up N synthetic clients per mode against a running server, ramping the
+client count until the latency or drop-rate SLO breaks, e.g.:
+
+    python -m bench.loadgen --url http://127.0.0.1:5005 \
+        --modes offer,client_drawing,localonly --max-clients 64 \
+        --output capacity.json
+
+Modes:
+  offer           WebRTC peer on /offer, latency measured glass-to-annotated-frame
+  client_drawing  peer on /client-drawing-offer, detections on its data channel
+  localonly       JPEG frames pushed over /localonly/ws/detections
+
+Latency is measured for frames the server ran the detector on, and frames
+that were due for detection but never got any count as dropped. In offer
+mode a frame only shows it was run when boxes were drawn on it, so that
+mode needs weights and images that produce detections.
+
+All clients connect from this host and so share one set of per client
+admission limits; start the server with YOLO_ADMISSION_EXEMPT=127.0.0.1 to
+measure the server rather than the per client rate limiter.
+"""
+
+import json
+import time
+import asyncio
+import argparse
+import urllib.request
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from av import VideoFrame
+from aiortc import RTCPeerConnection, RTCSessionDescription
+
+from config import SETTINGS
+from bench.common import (
+    DEFAULT_IMAGES_DIR,
+    SyntheticVideoTrack,
+    encode_data_url,
+    load_sample_images,
+    summarize_latencies,
+)
+
+MODES = ["offer", "client_drawing", "localonly"]
+
+# Frame ids are stamped into the top-left corner as a row of black/white
+# cells, large enough to survive VP8 compression
+STAMP_BITS = 16
+STAMP_CELL = 16
+
+# A returned frame counts as annotated when at least this many pixels became
+# much greener than in the frame that was sent, as the boxes are pure green
+ANNOTATION_GREEN_DELTA = 128
+ANNOTATION_MIN_PIXELS = 100
+
+
+def stamp_frame_id(img: np.ndarray, frame_id: int) -> None:
+    for bit in range(STAMP_BITS):
+        value = 255 if (frame_id >> bit) & 1 else 0
+        x = bit * STAMP_CELL
+        img[0:STAMP_CELL, x : x + STAMP_CELL] = value
+
+
+def read_frame_id(img: np.ndarray) -> int:
+    centre = STAMP_CELL // 2
+    frame_id = 0
+    for bit in range(STAMP_BITS):
+        x = bit * STAMP_CELL + centre
+        if img[centre, x].mean() > 127:
+            frame_id |= 1 << bit
+    return frame_id
+
+
+def _greenness(img: np.ndarray) -> np.ndarray:
+    img = img.astype(np.int16)
+    return img[..., 1] - np.maximum(img[..., 0], img[..., 2])
+
+
+def is_annotated(received: np.ndarray, sent: np.ndarray) -> bool:
+    """Whether boxes were drawn on a returned frame, ignoring the stamp."""
+    delta = _greenness(received[STAMP_CELL:]) - _greenness(sent[STAMP_CELL:])
+    return np.count_nonzero(delta > ANNOTATION_GREEN_DELTA) >= ANNOTATION_MIN_PIXELS
+
+
+class ClientStats:
+    """
+    Per-client latency and frame accounting. Every detection_interval-th
+    frame sent is due for detection; the ones that got none are dropped.
+    """
+
+    def __init__(self, detection_interval: int = 1):
+        self.detection_interval = max(1, detection_interval)
+        self.started = time.perf_counter()
+        self.sent: Dict[int, float] = {}
+        # Image each stamped frame was made from, by frame id
+        self.sources: Dict[int, np.ndarray] = {}
+        # Send time by pts, for matching data channel messages
+        self.sent_pts: Dict[int, float] = {}
+        # (sent at, latency) of every frame that got detections
+        self.latencies: List[tuple] = []
+        self.received = 0
+        self.detected = 0
+        self.detection_updates = 0
+        self.error: Optional[str] = None
+
+    @property
+    def dropped(self) -> int:
+        return max(0, len(self.sent) // self.detection_interval - self.detected)
+
+    def record_detection(self, sent_at: float) -> None:
+        self.detected += 1
+        self.latencies.append((sent_at, time.perf_counter() - sent_at))
+
+
+class StampedVideoTrack(SyntheticVideoTrack):
+    """Synthetic camera that stamps a frame id and records its send time."""
+
+    def __init__(self, images, stats: ClientStats, fps: int):
+        super().__init__(images, fps=fps, paced=True)
+        self._images = [img.copy() for img in images]
+        self._stats = stats
+        self._frame_id = 0
+
+    async def recv(self):
+        pts, time_base = await self.next_timestamp()
+        img = self._images[self._frame_id % len(self._images)]
+        frame_id = self._frame_id % (1 << STAMP_BITS)
+        self._frame_id += 1
+
+        stamp_frame_id(img, frame_id)
+        frame = VideoFrame.from_ndarray(img, format="bgr24")
+        frame.pts = pts
+        frame.time_base = time_base
+        sent_at = time.perf_counter()
+        self._stats.sent[frame_id] = sent_at
+        self._stats.sources[frame_id] = img
+        self._stats.sent_pts[pts] = sent_at
+        return frame
+
+
+def _post_json(url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+
+async def _consume_video(
+    track, stats: ClientStats, stop: asyncio.Event, annotated: bool
+) -> None:
+    """
+    Count returned frames. With annotated set, frames that come back with
+    boxes drawn on them also count as detected.
+    """
+    seen = set()
+    while not stop.is_set():
+        try:
+            frame = await asyncio.wait_for(track.recv(), timeout=1.0)
+        except asyncio.TimeoutError:
+            continue
+        img = frame.to_ndarray(format="bgr24")
+        frame_id = read_frame_id(img)
+        sent_at = stats.sent.get(frame_id)
+        if sent_at is None or frame_id in seen:
+            continue
+        seen.add(frame_id)
+        stats.received += 1
+        if annotated and is_annotated(img, stats.sources[frame_id]):
+            stats.record_detection(sent_at)
+
+
+async def _run_peer(
+    base_url: str,
+    path: str,
+    images,
+    stats: ClientStats,
+    args,
+    stop: asyncio.Event,
+    on_detections: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> None:
+    pc = RTCPeerConnection()
+    consumers = []
+
+    if on_detections is not None:
+        channel = pc.createDataChannel("detections", ordered=False, maxRetransmits=0)
+
+        @channel.on("message")
+        def on_message(message):
+            on_detections(json.loads(message))
+
+    @pc.on("track")
+    def on_track(track):
+        if track.kind == "video":
+            consumers.append(
+                asyncio.ensure_future(
+                    _consume_video(track, stats, stop, on_detections is None)
+                )
+            )
+
+    try:
+        pc.addTrack(StampedVideoTrack(images, stats, args.fps))
+        await pc.setLocalDescription(await pc.createOffer())
+
+        payload = {"sdp": pc.localDescription.sdp, "type": pc.localDescription.type}
+        answer = await asyncio.to_thread(_post_json, f"{base_url}{path}", payload)
+        await pc.setRemoteDescription(
+            RTCSessionDescription(sdp=answer["sdp"], type=answer["type"])
+        )
+
+        await stop.wait()
+    finally:
+        for task in consumers:
+            task.cancel()
+        await pc.close()
+
+
+async def run_offer_client(base_url, images, args, stop) -> ClientStats:
+    stats = ClientStats(args.detection_interval)
+    try:
+        await _run_peer(base_url, "/offer", images, stats, args, stop)
+    except Exception as e:
+        stats.error = str(e)
+    return stats
+
+
+async def run_client_drawing_client(base_url, images, args, stop) -> ClientStats:
+    stats = ClientStats(args.detection_interval)
+
+    def on_detections(message):
+        if message.get("type") != "detections":
+            return
+        stats.detection_updates += 1
+        # The server's pts count from the first frame it received, which is
+        # our first, so they match the pts the frames were sent with up to
+        # a tick of rounding between time bases
+        pts = message.get("pts")
+        if not isinstance(pts, int):
+            return
+        for candidate in (pts, pts + 1, pts - 1):
+            sent_at = stats.sent_pts.pop(candidate, None)
+            if sent_at is not None:
+                stats.record_detection(sent_at)
+                return
+
+    try:
+        await _run_peer(
+            base_url,
+            "/client-drawing-offer",
+            images,
+            stats,
+            args,
+            stop,
+            on_detections=on_detections,
+        )
+    except Exception as e:
+        stats.error = str(e)
+    return stats
+
+
+async def run_localonly_client(base_url, frames, args, stop) -> ClientStats:
+    import websockets
+
+    stats = ClientStats()
+    ws_url = base_url.replace("http", "ws", 1) + "/localonly/ws/detections"
+
+    try:
+        async with websockets.connect(ws_url, max_size=None) as ws:
+            hello = json.loads(await ws.recv())
+            client_id = hello.get("client_id")
+            # The server answers frames in order, so match replies FIFO
+            in_flight = deque()
+
+            async def read_detections():
+                async for message in ws:
+                    kind = json.loads(message).get("type")
+                    # Frames the server did not run are answered with
+                    # "dropped" and count as dropped
+                    if kind in ("detections", "dropped") and in_flight:
+                        sent_at = in_flight.popleft()
+                        stats.received += 1
+                        if kind == "detections":
+                            stats.record_detection(sent_at)
+
+            reader = asyncio.ensure_future(read_detections())
+            interval = 1.0 / args.fps
+            frame_id = 0
+            try:
+                while not stop.is_set():
+                    sent_at = time.perf_counter()
+                    await ws.send(
+                        json.dumps(
+                            {
+                                "type": "video_frame",
+                                "client_id": client_id,
+                                "frame": frames[frame_id % len(frames)],
+                                "timestamp": int(time.time() * 1000),
+                            }
+                        )
+                    )
+                    in_flight.append(sent_at)
+                    stats.sent[frame_id] = sent_at
+                    frame_id += 1
+                    await asyncio.sleep(
+                        max(0.0, interval - (time.perf_counter() - sent_at))
+                    )
+            finally:
+                reader.cancel()
+    except Exception as e:
+        stats.error = str(e)
+    return stats
+
+
+async def run_level(mode: str, clients: int, base_url: str, images, frames, args):
+    stop = asyncio.Event()
+
+    if mode == "offer":
+        coros = [run_offer_client(base_url, images, args, stop) for _ in range(clients)]
+    elif mode == "client_drawing":
+        coros = [
+            run_client_drawing_client(base_url, images, args, stop)
+            for _ in range(clients)
+        ]
+    else:
+        coros = [
+            run_localonly_client(base_url, frames, args, stop) for _ in range(clients)
+        ]
+
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    await asyncio.sleep(args.duration)
+    stop.set()
+    return await asyncio.gather(*tasks)
+
+
+def summarize_level(clients: int, results: List[ClientStats], args) -> Dict[str, Any]:
+    # Skip the warm-up window of each client when computing latency
+    latencies = [
+        latency
+        for stats in results
+        for sent_at, latency in stats.latencies
+        if sent_at - stats.started >= args.warmup
+    ]
+    sent = sum(len(stats.sent) for stats in results)
+    due = sum(len(stats.sent) // stats.detection_interval for stats in results)
+    dropped = sum(stats.dropped for stats in results)
+    errors = [stats.error for stats in results if stats.error]
+    drop_rate = dropped / due if due else 1.0
+    summary = summarize_latencies(latencies)
+
+    level = {
+        "clients": clients,
+        "latency_ms": summary,
+        "frames_sent": sent,
+        "frames_due": due,
+        "frames_dropped": dropped,
+        "drop_rate": round(drop_rate, 4),
+        "received_fps_per_client": round(
+            sum(stats.received for stats in results) / clients / args.duration, 2
+        ),
+        "detected_fps_per_client": round(
+            sum(stats.detected for stats in results) / clients / args.duration, 2
+        ),
+        "detection_updates_per_client_per_s": round(
+            sum(stats.detection_updates for stats in results) / clients / args.duration,
+            2,
+        ),
+        "errors": errors,
+    }
+    level["within_slo"] = (
+        not errors
+        and bool(latencies)
+        and summary["p95"] <= args.slo_p95_ms
+        and drop_rate <= args.slo_drop_rate
+    )
+    return level
+
+
+async def ramp(mode: str, args, images, frames) -> Dict[str, Any]:
+    curve = []
+    capacity = 0
+    clients = args.start_clients
+
+    while clients <= args.max_clients:
+        print(f"[{mode}] running {clients} clients for {args.duration}s...", flush=True)
+        results = await run_level(mode, clients, args.url, images, frames, args)
+        level = summarize_level(clients, results, args)
+        curve.append(level)
+        print(
+            f"[{mode}] {clients} clients: p95 {level['latency_ms']['p95']}ms, "
+            f"drop rate {level['drop_rate']:.2%}, within SLO: {level['within_slo']}",
+            flush=True,
+        )
+
+        if not level["within_slo"]:
+            break
+        capacity = clients
+        clients = max(clients + 1, int(clients * args.ramp_factor))
+
+    return {"max_clients_within_slo": capacity, "curve": curve}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:5005")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--start-clients", type=int, default=1)
+    parser.add_argument("--max-clients", type=int, default=64)
+    parser.add_argument("--ramp-factor", type=float, default=2.0)
+    parser.add_argument(
+        "--duration", type=float, default=20.0, help="Seconds per level"
+    )
+    parser.add_argument(
+        "--warmup",
+        type=float,
+        default=2.0,
+        help="Seconds per client excluded from stats",
+    )
+    parser.add_argument(
+        "--fps", type=int, default=15, help="Frames sent per client per second"
+    )
+    parser.add_argument(
+        "--detection-interval",
+        type=int,
+        default=SETTINGS["detection_interval"],
+        help="The server's detection_interval, for counting dropped WebRTC frames",
+    )
+    parser.add_argument("--frame-size", default="1280x720")
+    parser.add_argument("--images-dir", default=DEFAULT_IMAGES_DIR)
+    parser.add_argument("--slo-p95-ms", type=float, default=500.0)
+    parser.add_argument("--slo-drop-rate", type=float, default=0.1)
+    parser.add_argument("--output", help="Write the capacity curves as JSON")
+    args = parser.parse_args(argv)
+
+    width, height = args.frame_size.lower().split("x")
+    args.frame_size = (int(width), int(height))
+    args.url = args.url.rstrip("/")
+    args.modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    unknown = set(args.modes) - set(MODES)
+    if unknown:
+        parser.error(f"Unknown modes: {', '.join(sorted(unknown))}")
+    return args
+
+
+async def run(args) -> Dict[str, Any]:
+    images = load_sample_images(args.images_dir, size=args.frame_size)
+    frames = [encode_data_url(img) for img in images]
+
+    report = {
+        "url": args.url,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {
+            "fps": args.fps,
+            "detection_interval": args.detection_interval,
+            "frame_size": list(args.frame_size),
+            "duration": args.duration,
+            "slo_p95_ms": args.slo_p95_ms,
+            "slo_drop_rate": args.slo_drop_rate,
+        },
+        "modes": {},
+    }
+    for mode in args.modes:
+        report["modes"][mode] = await ramp(mode, args, images, frames)
+    return report
+
+
+def main(argv=None) -> Dict[str, Any]:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+
+    for mode, result in report["modes"].items():
+        print(f"{mode}: {result['max_clients_within_slo']} clients within SLO")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
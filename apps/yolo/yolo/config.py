@@ -3,7 +3,140 @@ from typing import Dict, Any
 
 SETTINGS: Dict[str, Any] = {
     "model_path": os.path.join(os.getcwd(), "weights.pt"),
+    # Routers to mount, by module name under routers/. Each is imported only
+    # when mounted, so e.g. an upload only deployment never loads aiortc
+    "routers": os.environ.get(
+        "YOLO_ROUTERS", "index,webrtc,localonly,file_upload,metrics,admin"
+    ).split(","),
+    # Worker processes started by serve.py; they are forked after the model
+    # is loaded and share its weights. With more than one, processed outputs
+    # are always written to disk so any worker can serve them, and serve.py
+    # refuses to start with the webrtc router, whose sessions are per worker
+    "serve_workers": int(os.environ.get("YOLO_WORKERS", 1)),
     "detection_confidence": 0.25,
     "detection_interval": 5,
+    # Detections of a class are logged again for the same client after
+    # this many seconds
     "log_interval": 1.0,
+    # "text" or "json" (one object per line with structured fields)
+    "log_format": os.environ.get("YOLO_LOG_FORMAT", "text"),
+    "log_level": os.environ.get("YOLO_LOG_LEVEL", "INFO"),
+    # Records waiting for the log writer thread; more are dropped
+    "log_queue_size": 10000,
+    # Longest side, in pixels, of the image handed to the model; larger
+    # inputs are downscaled before inference
+    "inference_size": 640,
+    # (height, width) shapes run through the model at startup so the first
+    # real request does not pay for kernel selection and allocator warm-up
+    "warmup_shapes": [(480, 640), (720, 1280), (1080, 1920)],
+    "warmup_iterations": 2,
+    # Admin endpoints require this token in the X-Admin-Token header; they
+    # are disabled when it is not set
+    "admin_token": os.environ.get("YOLO_ADMIN_TOKEN"),
+    # Model versions kept in memory for switching back, A/B splits and
+    # shadow comparison; admin loads are restricted to weights under model_dir
+    "model_max_versions": 3,
+    "model_dir": os.getcwd(),
+    # Ways to run a request, cheapest first: model input size and optionally
+    # a resident model version (e.g. a smaller model loaded through the
+    # admin API). Clients may ask for a variant by name as their quality;
+    # the best variant should match inference_size
+    "model_variants": [
+        {"name": "low", "imgsz": 320},
+        {"name": "medium", "imgsz": 480},
+        {"name": "high", "imgsz": 640},
+    ],
+    # Requests step one variant down per this many jobs they would wait for
+    # (queued ahead of them, or running on the last free worker)
+    "variant_queue_step": 1,
+    # Share of live frames rerun on the shadow version, if one is set, and
+    # the batch queue depth beyond which shadow runs are skipped
+    "model_shadow_sample": 0.1,
+    "model_shadow_queue": 8,
+    # Limits of one /admin/profiling/sample run; every sample walks the
+    # stack of every thread
+    "profiling_max_seconds": 60,
+    "profiling_max_samples": 20000,
+    # Processed video output; preset and crf apply to libx264/libx265
+    "video_codec": "libx264",
+    "video_preset": "superfast",
+    "video_crf": 23,
+    # 0 lets the encoder pick a thread count
+    "video_encode_threads": 0,
+    # Detections-only uploads seek instead of decoding when the next sampled
+    # frame is further ahead than this
+    "seek_min_gap_seconds": 2.0,
+    # Processed outputs are kept in memory up to this many bytes in total,
+    # spilling the oldest to disk; larger single outputs go straight to disk
+    "artifact_memory_bytes": 256 * 1024 * 1024,
+    "artifact_spill_bytes": 8 * 1024 * 1024,
+    # Processed outputs can be downloaded for this long
+    "artifact_ttl_seconds": 3600,
+    # Least recently downloaded files are evicted beyond this much disk usage
+    "artifact_disk_quota_bytes": 4 * 1024 * 1024 * 1024,
+    # Threads running model calls. Live frames always go first; per class
+    # limits only matter with more than one worker, e.g. to keep a worker
+    # free for live streams on a GPU host
+    "inference_workers": 1,
+    "inference_concurrency": {"live": 1, "upload": 1, "batch": 1},
+    # Live frames still queued after this long are passed through undetected
+    "live_frame_deadline_ms": 250,
+    # Admission control, per client IP unless noted. Live connections are
+    # peer connections and localonly websockets
+    "admission_max_connections": 64,
+    "admission_connections_per_client": 4,
+    # Live frames run through the model per second, with bursts up to
+    "admission_client_fps": 10.0,
+    "admission_client_burst": 20,
+    # Server-wide live frames per second; None follows the measured
+    # inference throughput times the headroom factor
+    "admission_global_fps": None,
+    "admission_capacity_headroom": 0.9,
+    "admission_uploads_per_minute": 30,
+    "admission_concurrent_uploads": 2,
+    # Uploads are refused while this many upload inference jobs are queued
+    "admission_upload_queue": 32,
+    # Localonly websockets are closed after this many frames in a row
+    # were rejected
+    "admission_ws_violation_limit": 100,
+    # Client IPs exempt from the per client limits (server-wide ones still
+    # apply), e.g. 127.0.0.1 for load tests whose clients share one address
+    "admission_exempt_clients": [
+        ip for ip in os.environ.get("YOLO_ADMISSION_EXEMPT", "").split(",") if ip
+    ],
+    # Live client sessions not updated for this long are dropped, checked
+    # every session_sweep_seconds; beyond session_max_bytes the least
+    # recently updated are dropped first
+    "session_ttl_seconds": 300,
+    "session_sweep_seconds": 30,
+    "session_max_bytes": 64 * 1024 * 1024,
+    # Detector-classifier cascade: "local" runs the apps/ml ResNet-34 in
+    # process, "http" sends crops to the ml service, None turns it off
+    "cascade_backend": os.environ.get("YOLO_CASCADE_BACKEND"),
+    "cascade_weights_path": os.path.join(
+        os.getcwd(), "..", "..", "ml", "ml", "weights", "model.pth"
+    ),
+    "cascade_url": os.environ.get("YOLO_CASCADE_URL", "http://127.0.0.1:5001"),
+    "cascade_pool_size": 4,
+    "cascade_timeout_seconds": 5.0,
+    # Classification is skipped for this long after the classifier fails
+    "cascade_retry_seconds": 30.0,
+    # Detections below this confidence are not sent to the classifier
+    "cascade_min_confidence": 0.4,
+    # Detections are linked into tracks by IoU so each track is classified
+    # once; labels of at most this many tracks are kept per stream
+    "cascade_track_iou": 0.3,
+    "cascade_track_max_missed": 10,
+    "cascade_cache_size": 1024,
+    # Uploaded images whose longest side reaches this are run in overlapping
+    # tiles of tiling_tile_size (the model's native input size) as well as
+    # whole, so small items are not lost to downscaling
+    "tiling_min_size": 2000,
+    "tiling_tile_size": 640,
+    "tiling_overlap": 0.2,
+    # Tiles run through the model per call
+    "tiling_batch_size": 8,
+    # Boxes from neighbouring tiles are merged when their intersection
+    # covers this fraction of the smaller box
+    "tiling_merge_threshold": 0.6,
 }
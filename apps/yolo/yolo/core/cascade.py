@@ -0,0 +1,396 @@
+import json
+import time
+import uuid
+import queue
+import asyncio
+import threading
+import http.client
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+import cv2
+import numpy as np
+
+from core.postprocess import CLS, CONF, X1, X2, Y1, Y2, box_iou
+from core.scheduler import Priority, scheduler
+from utils.logger import setup_logger
+from config import SETTINGS
+
+logger = setup_logger()
+
+# Categories of the ResNet-34 classifier in apps/ml, by output index
+CATEGORIES = (
+    "Battery",
+    "Keyboard",
+    "Microwave",
+    "Mobile",
+    "Mouse",
+    "PCB",
+    "Player",
+    "Printer",
+    "Television",
+    "WashingMachine",
+)
+
+# Crops smaller than this on either side are not worth classifying
+MIN_CROP_SIZE = 8
+
+_IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+_IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+class IoUTracker:
+    """
+    Minimal tracker that links detections of the same class across frames
+    by greedy IoU matching against the previous frame's boxes. Tracks that
+    go unmatched for more than max_missed frames end.
+    """
+
+    def __init__(self, iou_threshold: float = 0.3, max_missed: int = 10):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed
+        self._boxes = np.zeros((0, 4), dtype=np.float32)
+        self._classes = np.zeros(0, dtype=np.int64)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._missed = np.zeros(0, dtype=np.int64)
+        self._next_id = 1
+
+    def update(self, detections: np.ndarray) -> Tuple[np.ndarray, List[int]]:
+        """Return the track id of every detection, and the ids of ended tracks."""
+        count = len(detections)
+        ids = np.zeros(count, dtype=np.int64)
+        matched = np.zeros(len(self._ids), dtype=bool)
+        classes = detections[:, CLS].astype(np.int64)
+
+        if count and len(self._ids):
+            iou = box_iou(self._boxes, detections[:, :4])
+            iou[self._classes[:, None] != classes[None, :]] = 0
+            assigned = np.zeros(count, dtype=bool)
+            # Highest overlaps claim their pairing first
+            for flat in np.argsort(iou, axis=None)[::-1]:
+                track, det = divmod(int(flat), count)
+                if iou[track, det] < self.iou_threshold:
+                    break
+                if matched[track] or assigned[det]:
+                    continue
+                matched[track] = assigned[det] = True
+                ids[det] = self._ids[track]
+
+        new = ids == 0
+        ids[new] = np.arange(self._next_id, self._next_id + int(new.sum()))
+        self._next_id += int(new.sum())
+
+        missed = self._missed[~matched] + 1
+        keep = missed <= self.max_missed
+        ended = self._ids[~matched][~keep].tolist()
+
+        self._boxes = np.concatenate(
+            [detections[:, :4].astype(np.float32), self._boxes[~matched][keep]]
+        )
+        self._classes = np.concatenate([classes, self._classes[~matched][keep]])
+        self._ids = np.concatenate([ids, self._ids[~matched][keep]])
+        self._missed = np.concatenate([np.zeros(count, dtype=np.int64), missed[keep]])
+        return ids, ended
+
+
+def _multipart(crops: List[np.ndarray]) -> Tuple[bytes, str]:
+    """Encode crops as JPEG parts of a multipart/form-data body."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for i, crop in enumerate(crops):
+        _, buffer = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        parts.append(
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="files"; filename="crop{i}.jpg"\r\n'
+            "Content-Type: image/jpeg\r\n\r\n".encode()
+        )
+        parts.append(buffer.tobytes())
+        parts.append(b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class HttpClassifier:
+    """
+    Sends crops to the ml service's /predict/batch/ endpoint, reusing
+    keep-alive connections from a small pool.
+    """
+
+    remote = True
+
+    def __init__(self, url: str, pool_size: int, timeout: float):
+        parts = urlsplit(url)
+        self._host = parts.hostname
+        self._port = parts.port
+        self._path = parts.path.rstrip("/") + "/predict/batch/"
+        self._timeout = timeout
+        self._pool: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue(
+            pool_size
+        )
+
+    def _post(self, conn: http.client.HTTPConnection, body: bytes, content_type: str):
+        conn.request("POST", self._path, body, {"Content-Type": content_type})
+        response = conn.getresponse()
+        return response.status, response.read()
+
+    def classify(self, crops: List[np.ndarray]) -> List[Dict[str, Any]]:
+        body, content_type = _multipart(crops)
+
+        try:
+            conn, reused = self._pool.get_nowait(), True
+        except queue.Empty:
+            conn, reused = None, False
+
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection(
+                    self._host, self._port, timeout=self._timeout
+                )
+            try:
+                status, data = self._post(conn, body, content_type)
+            except (http.client.RemoteDisconnected, ConnectionError):
+                if not reused:
+                    raise
+                # The server closed an idle pooled connection; retry on a fresh one
+                conn.close()
+                conn = http.client.HTTPConnection(
+                    self._host, self._port, timeout=self._timeout
+                )
+                status, data = self._post(conn, body, content_type)
+        except Exception:
+            if conn is not None:
+                conn.close()
+            raise
+
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+        if status != 200:
+            raise RuntimeError(f"Classifier returned {status}: {data[:200]!r}")
+        return json.loads(data)["predictions"]
+
+
+class LocalClassifier:
+    """Runs the ResNet-34 classifier in process from its state dict."""
+
+    remote = False
+
+    def __init__(self, weights_path: str):
+        import torch
+        from torch import nn
+        from torchvision.models import resnet34
+
+        self._torch = torch
+        self._device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+        model = resnet34(weights=None)
+        model.fc = nn.Linear(model.fc.in_features, len(CATEGORIES))
+        model.load_state_dict(torch.load(weights_path, map_location=self._device))
+        self._model = model.eval().to(self._device)
+        logger.info(f"Cascade classifier loaded from {weights_path}")
+
+    def classify(self, crops: List[np.ndarray]) -> List[Dict[str, Any]]:
+        batch = np.stack(
+            [
+                cv2.cvtColor(
+                    cv2.resize(crop, (224, 224), interpolation=cv2.INTER_LINEAR),
+                    cv2.COLOR_BGR2RGB,
+                )
+                for crop in crops
+            ]
+        )
+        batch = (batch.astype(np.float32) / 255.0 - _IMAGENET_MEAN) / _IMAGENET_STD
+
+        torch = self._torch
+        with torch.inference_mode():
+            tensor = torch.from_numpy(batch).permute(0, 3, 1, 2).to(self._device)
+            confidences, predicted = self._model(tensor).softmax(1).max(1)
+
+        return [
+            {
+                "class_id": class_id,
+                "class_name": CATEGORIES[class_id],
+                "confidence": confidence,
+            }
+            for class_id, confidence in zip(predicted.tolist(), confidences.tolist())
+        ]
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+# Classification is skipped until this time after a failure
+_retry_at = 0.0
+
+
+def get_classifier():
+    """
+    Return the configured cascade classifier, or None when cascade mode is
+    off or the classifier is unavailable.
+    """
+    global _classifier, _retry_at
+
+    backend = SETTINGS["cascade_backend"]
+    if not backend or time.monotonic() < _retry_at:
+        return None
+
+    with _classifier_lock:
+        if _classifier is None:
+            try:
+                if backend == "local":
+                    _classifier = LocalClassifier(SETTINGS["cascade_weights_path"])
+                elif backend == "http":
+                    _classifier = HttpClassifier(
+                        SETTINGS["cascade_url"],
+                        SETTINGS["cascade_pool_size"],
+                        SETTINGS["cascade_timeout_seconds"],
+                    )
+                else:
+                    raise ValueError(f"Unknown cascade backend {backend}")
+            except Exception as e:
+                logger.error(f"Could not set up cascade classifier: {e}")
+                _retry_at = time.monotonic() + SETTINGS["cascade_retry_seconds"]
+                return None
+    return _classifier
+
+
+async def get_classifier_async():
+    """Like get_classifier, setting the classifier up on a worker thread."""
+    if (
+        _classifier is not None
+        or not SETTINGS["cascade_backend"]
+        or time.monotonic() < _retry_at
+    ):
+        return get_classifier()
+    return await asyncio.to_thread(get_classifier)
+
+
+def _classification_failed(e: Exception) -> None:
+    global _retry_at
+    logger.error(
+        f"Cascade classification failed, retrying in {SETTINGS['cascade_retry_seconds']}s: {e}"
+    )
+    _retry_at = time.monotonic() + SETTINGS["cascade_retry_seconds"]
+
+
+def cascade_labels(serialized: List[Dict[str, Any]]) -> List[str]:
+    """
+    Names to draw for refined detections: the classifier's label where it
+    gave one, otherwise the detector's class name.
+    """
+    return [
+        detection.get("classifier_class_name") or detection["class_name"]
+        for detection in serialized
+    ]
+
+
+class CascadeSession:
+    """
+    Cascade state for one stream. Detections are linked into tracks, and
+    each track is classified once: crops of all tracks that have no label
+    yet are sent to the classifier in a single batch, and later frames
+    reuse the cached label for as long as the track lives.
+    """
+
+    def __init__(self):
+        self.tracker = IoUTracker(
+            SETTINGS["cascade_track_iou"], SETTINGS["cascade_track_max_missed"]
+        )
+        self._labels: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+
+    def _pending(
+        self, img: np.ndarray, detections: np.ndarray
+    ) -> Tuple[np.ndarray, List[int], List[np.ndarray]]:
+        ids, ended = self.tracker.update(detections)
+        for track_id in ended:
+            self._labels.pop(track_id, None)
+
+        height, width = img.shape[:2]
+        new_ids, crops = [], []
+        for track_id, det in zip(ids.tolist(), detections):
+            if track_id in self._labels:
+                self._labels.move_to_end(track_id)
+                continue
+            if det[CONF] < SETTINGS["cascade_min_confidence"]:
+                continue
+            x1, y1 = max(0, int(det[X1])), max(0, int(det[Y1]))
+            x2, y2 = min(width, int(det[X2])), min(height, int(det[Y2]))
+            if x2 - x1 < MIN_CROP_SIZE or y2 - y1 < MIN_CROP_SIZE:
+                continue
+            new_ids.append(track_id)
+            crops.append(img[y1:y2, x1:x2].copy())
+        return ids, new_ids, crops
+
+    def _store(self, new_ids: List[int], predictions: List[Dict[str, Any]]) -> None:
+        for track_id, prediction in zip(new_ids, predictions):
+            self._labels[track_id] = prediction
+        while len(self._labels) > SETTINGS["cascade_cache_size"]:
+            self._labels.popitem(last=False)
+
+    def _annotate(self, ids: np.ndarray, serialized: List[Dict[str, Any]]) -> None:
+        for track_id, detection in zip(ids.tolist(), serialized):
+            detection["track_id"] = track_id
+            label = self._labels.get(track_id)
+            if label is not None:
+                detection["classifier_class_name"] = label["class_name"]
+                detection["classifier_confidence"] = label["confidence"]
+
+    def refine(
+        self,
+        img: np.ndarray,
+        detections: np.ndarray,
+        serialized: List[Dict[str, Any]],
+        priority: Priority,
+        client: Any = None,
+    ) -> None:
+        """
+        Add track ids and classifier labels to serialized detections.
+        detections are in img coordinates, in the same order as serialized.
+        Blocks the calling thread.
+        """
+        classifier = get_classifier()
+        if classifier is None:
+            return
+
+        ids, new_ids, crops = self._pending(img, detections)
+        if crops:
+            try:
+                if classifier.remote:
+                    predictions = classifier.classify(crops)
+                else:
+                    predictions = scheduler.run(
+                        lambda: classifier.classify(crops), priority, client
+                    )
+                self._store(new_ids, predictions)
+            except Exception as e:
+                _classification_failed(e)
+        self._annotate(ids, serialized)
+
+    async def refine_async(
+        self,
+        img: np.ndarray,
+        detections: np.ndarray,
+        serialized: List[Dict[str, Any]],
+        priority: Priority,
+        client: Any = None,
+    ) -> None:
+        """Like refine, without blocking the event loop."""
+        classifier = await get_classifier_async()
+        if classifier is None:
+            return
+
+        ids, new_ids, crops = self._pending(img, detections)
+        if crops:
+            try:
+                if classifier.remote:
+                    predictions = await asyncio.to_thread(classifier.classify, crops)
+                else:
+                    predictions = await scheduler.infer(
+                        lambda: classifier.classify(crops), priority, client
+                    )
+                self._store(new_ids, predictions)
+            except Exception as e:
+                _classification_failed(e)
+        self._annotate(ids, serialized)
@@ -0,0 +1,121 @@
+from fractions import Fraction
+from typing import Optional
+
+import av
+import numpy as np
+from av import VideoFrame
+
+from utils.logger import setup_logger
+from config import SETTINGS
+
+logger = setup_logger()
+
+# Codecs that can be selected for processed videos; all of them mux into MP4
+SUPPORTED_CODECS = ("libx264", "libx265", "mpeg4")
+
+# Codecs that understand the x264 style preset/crf options
+_RATE_CONTROLLED_CODECS = ("libx264", "libx265")
+
+PRESETS = (
+    "ultrafast",
+    "superfast",
+    "veryfast",
+    "faster",
+    "fast",
+    "medium",
+    "slow",
+    "slower",
+    "veryslow",
+)
+
+# Used when the requested codec is missing from the local FFmpeg build
+FALLBACK_CODEC = "mpeg4"
+
+# FFmpeg's FF_QP2LAMBDA, the scale of global_quality
+_QP2LAMBDA = 118
+
+
+def _codec_available(name: str) -> bool:
+    try:
+        av.codec.Codec(name, "w")
+    except Exception:
+        return False
+    return True
+
+
+class VideoEncoder:
+    """
+    Encode BGR frames into a web friendly MP4 with PyAV.
+    The moov atom is written at the front of the file (faststart) so players
+    can start before the download completes, and the encoder runs its own
+    frame/slice threads. Frames with odd dimensions are scaled to the even
+    size yuv420p requires by the encoder.
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        width: int,
+        height: int,
+        fps: float,
+        codec: Optional[str] = None,
+        preset: Optional[str] = None,
+        crf: Optional[int] = None,
+    ):
+        codec = codec or SETTINGS["video_codec"]
+        if codec not in SUPPORTED_CODECS:
+            raise ValueError(
+                f"Unsupported codec {codec}, expected one of {', '.join(SUPPORTED_CODECS)}"
+            )
+        if preset is not None and preset not in PRESETS:
+            raise ValueError(
+                f"Unsupported preset {preset}, expected one of {', '.join(PRESETS)}"
+            )
+        if not _codec_available(codec):
+            logger.warning(
+                f"Codec {codec} is not available, falling back to {FALLBACK_CODEC}"
+            )
+            codec = FALLBACK_CODEC
+
+        options = {}
+        if codec in _RATE_CONTROLLED_CODECS:
+            options["preset"] = preset or SETTINGS["video_preset"]
+            options["crf"] = str(crf if crf is not None else SETTINGS["video_crf"])
+        elif codec == FALLBACK_CODEC:
+            # mpeg4 has no crf; a fixed quantizer (-q:v 4) keeps quality stable
+            options.update(flags="+qscale", global_quality=str(4 * _QP2LAMBDA))
+
+        rate = Fraction(fps if fps > 0 else 30).limit_denominator(1001)
+
+        self.codec = codec
+        self._container = av.open(
+            output_path, "w", format="mp4", options={"movflags": "+faststart"}
+        )
+        self._stream = self._container.add_stream(codec, rate=rate, options=options)
+        self._stream.width = max(2, width & ~1)
+        self._stream.height = max(2, height & ~1)
+        self._stream.pix_fmt = "yuv420p"
+        self._stream.thread_type = "AUTO"
+        self._stream.thread_count = SETTINGS["video_encode_threads"]
+        self._frame_index = 0
+
+    def write(self, img: np.ndarray) -> None:
+        """Encode one BGR frame."""
+        frame = VideoFrame.from_ndarray(img, format="bgr24")
+        frame.pts = self._frame_index
+        self._frame_index += 1
+        self._container.mux(self._stream.encode(frame))
+
+    def close(self) -> None:
+        """Flush the encoder and finalize the file."""
+        try:
+            self._container.mux(self._stream.encode())
+        finally:
+            self._container.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
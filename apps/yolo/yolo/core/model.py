@@ -1,26 +1,445 @@
-from ultralytics import YOLO
+import os
+import time
+import zlib
+import random
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import partial
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+from core.cascade import get_classifier
+from core.postprocess import CLS, box_iou, extract_detections
+from core.scheduler import Priority, scheduler
 from utils.logger import setup_logger
+from utils.metrics import SHADOW_BOXES, VARIANT_SELECTED
 from config import SETTINGS
 
 logger = setup_logger()
 
-_model = None
+# Boxes of the active and shadow model count as the same object above this IoU
+_SHADOW_MATCH_IOU = 0.5
+
+
+def _file_hash(path: str) -> Optional[str]:
+    """Return the sha256 of a weights file, or None if it cannot be read."""
+    if not os.path.isfile(path):
+        return None
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _model_backend(model, path: str) -> str:
+    """Describe the inference backend and device the model runs on."""
+    model_format = os.path.splitext(path)[1].lstrip(".") or "pt"
+    try:
+        device = str(model.device)
+    except Exception:
+        device = "unknown"
+    return f"{model_format}:{device}"
+
+
+def _warmup(model) -> Dict[str, float]:
+    """
+    Run the model on representative input shapes so that kernel selection and
+    memory allocation happen before the first real request. The runs go
+    through the scheduler as batch work, so warming up a new version never
+    delays live frames. Returns the warm latency per shape in milliseconds.
+    """
+
+    def timed(img, imgsz=SETTINGS["inference_size"]):
+        start = time.perf_counter()
+        model.predict(
+            source=img,
+            imgsz=imgsz,
+            conf=SETTINGS["detection_confidence"],
+            verbose=False,
+        )
+        return time.perf_counter() - start
+
+    iterations = max(1, SETTINGS["warmup_iterations"])
+    latencies = {}
+
+    for height, width in SETTINGS["warmup_shapes"]:
+        img = np.zeros((height, width, 3), dtype=np.uint8)
+        elapsed = 0.0
+        for _ in range(iterations):
+            elapsed = scheduler.run(partial(timed, img), Priority.BATCH, "warmup")
+        # Only the last iteration reflects the warm latency
+        latencies[f"{height}x{width}"] = round(elapsed * 1000, 2)
+
+    # Every variant input size gets its own kernels
+    for imgsz in sorted({variant.imgsz for variant in VARIANTS}):
+        img = np.zeros((imgsz * 9 // 16 // 32 * 32, imgsz, 3), dtype=np.uint8)
+        elapsed = 0.0
+        for _ in range(iterations):
+            elapsed = scheduler.run(
+                partial(timed, img, imgsz), Priority.BATCH, "warmup"
+            )
+        latencies[f"imgsz_{imgsz}"] = round(elapsed * 1000, 2)
+    return latencies
+
+
+class Variant:
+    """
+    A cheaper or better way to run a request: the model input size and,
+    optionally, a resident model version (e.g. a smaller model) to use
+    instead of the client's assigned one.
+    """
+
+    __slots__ = ("name", "imgsz", "version")
 
+    def __init__(self, name: str, imgsz: int, version: Optional[str] = None):
+        self.name = name
+        self.imgsz = imgsz
+        self.version = version
 
-def get_model():
+
+# Cheapest first
+VARIANTS = [Variant(**variant) for variant in SETTINGS["model_variants"]]
+
+
+def select_variant(priority: Priority, quality: Optional[str] = None) -> Variant:
     """
-    Get or initialize the YOLO model.
-    Returns a singleton instance of the loaded model.
+    Pick the variant a request runs at. quality names the best variant the
+    client wants, by default the best there is; every variant_queue_step
+    jobs the request would wait for in the scheduler step one variant
+    down, so under load requests get cheaper instead of waiting longer.
     """
-    global _model
+    best = len(VARIANTS) - 1
+    if quality is not None:
+        best = next((i for i, v in enumerate(VARIANTS) if v.name == quality), best)
+
+    backlog = scheduler.backlog(priority)
+    variant = VARIANTS[max(0, best - backlog // SETTINGS["variant_queue_step"])]
+    VARIANT_SELECTED.inc(variant=variant.name, priority=priority.name.lower())
+    return variant
+
 
-    if _model is None:
+class ModelVersion:
+    """A loaded and warmed up set of weights."""
+
+    __slots__ = ("version", "path", "model", "info")
+
+    def __init__(self, version: str, path: str, model, info: Dict[str, Any]):
+        self.version = version
+        self.path = path
+        self.model = model
+        self.info = info
+
+
+class ModelRegistry:
+    """
+    Keeps several model versions resident, one of them active.
+    New weights are loaded and warmed up in the background while the
+    active version keeps serving; activating a version then just swaps one
+    reference, so callers that already picked up the old model finish on
+    it and every later call gets the new one, without dropping streams.
+    A traffic split sends a stable share of clients to other versions for
+    A/B comparison, and a shadow version can rerun a sample of live frames
+    at batch priority to compare its boxes against the active version's.
+    """
+
+    def __init__(self):
+        self._versions: "OrderedDict[str, ModelVersion]" = OrderedDict()
+        self.active: Optional[ModelVersion] = None
+        # version -> share of clients, in [0, 1]
+        self._split: Dict[str, float] = {}
+        self._shadow: Optional[str] = None
+        # path -> state of background loads that have not finished
+        self._loads: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        # Loads run one at a time
+        self._load_lock = threading.Lock()
+
+    def versions(self) -> List[str]:
+        return list(self._versions)
+
+    def load(
+        self,
+        path: str,
+        version: Optional[str] = None,
+        activate: bool = False,
+        warmup: bool = True,
+    ) -> ModelVersion:
+        """
+        Load and warm up weights, blocking the calling thread. version
+        defaults to the start of the file hash. Loading a version that is
+        already resident does not load it again. Without warmup the model
+        is not run, so no inference threads are started; see warmup.
+        """
+        with self._lock:
+            self._loads[path] = {"version": version, "state": "loading"}
         try:
-            model_path = SETTINGS["model_path"]
-            _model = YOLO(model_path)
-            logger.info(f"YOLO model loaded from {model_path}")
+            with self._load_lock:
+                digest = _file_hash(path)
+                if version is None:
+                    version = digest[:12] if digest else os.path.basename(path)
+
+                entry = self._versions.get(version)
+                if entry is None:
+                    # Imported on first load, as it pulls in torch; the
+                    # server starts accepting connections without it
+                    from ultralytics import YOLO
+
+                    model = YOLO(path)
+                    logger.info(f"YOLO model {version} loaded from {path}")
+                    latencies = _warmup(model) if warmup else {}
+                    if latencies:
+                        logger.info(f"YOLO model {version} warmed up: {latencies}")
+                    entry = ModelVersion(
+                        version,
+                        path,
+                        model,
+                        {
+                            "model_path": path,
+                            "model_hash": digest,
+                            "backend": _model_backend(model, path),
+                            "warm_latency_ms": latencies,
+                            "loaded_at": time.time(),
+                        },
+                    )
+                    with self._lock:
+                        self._versions[version] = entry
+                        self._evict()
         except Exception as e:
-            logger.error(f"Failed to load YOLO model: {e}")
+            with self._lock:
+                self._loads[path] = {
+                    "version": version,
+                    "state": "failed",
+                    "error": str(e),
+                }
+            logger.error(f"Failed to load YOLO model from {path}: {e}")
             raise
 
-    return _model
+        with self._lock:
+            self._loads.pop(path, None)
+        if activate:
+            self.activate(version)
+        return entry
+
+    def warmup(self, version: str) -> Dict[str, float]:
+        """Warm up a version that was loaded without warmup."""
+        entry = self._versions[version]
+        latencies = _warmup(entry.model)
+        entry.info["warm_latency_ms"] = latencies
+        logger.info(f"YOLO model {version} warmed up: {latencies}")
+        return latencies
+
+    def _evict(self) -> None:
+        """Unload the oldest versions that are not in use beyond the limit."""
+        pinned = {self._shadow, *self._split}
+        if self.active is not None:
+            pinned.add(self.active.version)
+        for version in list(self._versions):
+            if len(self._versions) <= SETTINGS["model_max_versions"]:
+                break
+            if version not in pinned:
+                del self._versions[version]
+                logger.info(f"YOLO model {version} unloaded")
+
+    def activate(self, version: str) -> ModelVersion:
+        """Make a resident version the one new calls use."""
+        with self._lock:
+            entry = self._versions[version]
+            previous = self.active
+            self.active = entry
+            # Replaced rather than changed in place, as get reads it unlocked
+            self._split = {v: share for v, share in self._split.items() if v != version}
+        logger.info(
+            f"Active YOLO model is now {version}"
+            + (f" (was {previous.version})" if previous else "")
+        )
+        return entry
+
+    def unload(self, version: str) -> None:
+        """Drop a version that is neither active nor in use for comparison."""
+        with self._lock:
+            if self.active is not None and version == self.active.version:
+                raise ValueError("The active version cannot be unloaded")
+            if version == self._shadow or version in self._split:
+                raise ValueError(f"Version {version} is used by a split or shadow")
+            del self._versions[version]
+        logger.info(f"YOLO model {version} unloaded")
+
+    def set_split(self, split: Dict[str, float]) -> None:
+        """Send the given share of clients to each version, the rest to active."""
+        with self._lock:
+            # Checked under the lock so the versions cannot be unloaded
+            # before the split pins them
+            if any(version not in self._versions for version in split):
+                raise KeyError("Unknown version in split")
+            if any(share < 0 for share in split.values()) or sum(split.values()) > 1:
+                raise ValueError("Shares must be non-negative and add up to at most 1")
+            self._split = {version: share for version, share in split.items() if share}
+
+    def set_shadow(self, version: Optional[str]) -> None:
+        with self._lock:
+            if version is not None and version not in self._versions:
+                raise KeyError(version)
+            self._shadow = version
+
+    def get(
+        self, client: Any = None, variant: Optional[Variant] = None
+    ) -> ModelVersion:
+        """
+        Return the version a client's work runs on. A variant naming a
+        resident version takes precedence; otherwise clients are assigned
+        to split versions by a hash of their key, so a stream sticks to one
+        version for as long as the split is unchanged.
+        """
+        active = self.active
+        if active is None:
+            active = self.load(SETTINGS["model_path"], activate=True)
+
+        if variant is not None and variant.version is not None:
+            entry = self._versions.get(variant.version)
+            if entry is not None:
+                return entry
+
+        split = self._split
+        if split and client is not None:
+            point = zlib.crc32(str(client).encode()) / 0xFFFFFFFF
+            for version in sorted(split):
+                point -= split[version]
+                if point < 0:
+                    entry = self._versions.get(version)
+                    if entry is not None:
+                        return entry
+                    break
+        return active
+
+    def shadow(self, source: np.ndarray, conf: float, detections: np.ndarray) -> None:
+        """
+        Possibly rerun a model input on the shadow version and record how
+        its boxes agree with detections, the active version's result for
+        the same input. Returns immediately; the rerun is queued as batch
+        work and skipped when that queue is backed up.
+        """
+        version = self._shadow
+        if version is None or random.random() >= SETTINGS["model_shadow_sample"]:
+            return
+        entry = self._versions.get(version)
+        if (
+            entry is None
+            or scheduler.depth(Priority.BATCH) >= SETTINGS["model_shadow_queue"]
+        ):
+            return
+
+        future = scheduler.submit(
+            partial(
+                entry.model.predict, source=source.copy(), conf=conf, verbose=False
+            ),
+            Priority.BATCH,
+            "shadow",
+        )
+        future.add_done_callback(lambda done: self._compare(version, detections, done))
+
+    def _compare(self, version: str, primary: np.ndarray, done) -> None:
+        if done.cancelled() or done.exception() is not None:
+            return
+        shadow = extract_detections(done.result())
+
+        matched = 0
+        if len(primary) and len(shadow):
+            iou = box_iou(primary, shadow)
+            iou[primary[:, None, CLS] != shadow[None, :, CLS]] = 0
+            matched = int((iou.max(axis=1) >= _SHADOW_MATCH_IOU).sum())
+
+        SHADOW_BOXES.inc(matched, version=version, outcome="matched")
+        SHADOW_BOXES.inc(len(primary) - matched, version=version, outcome="active_only")
+        SHADOW_BOXES.inc(len(shadow) - matched, version=version, outcome="shadow_only")
+
+    def describe(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active": self.active.version if self.active else None,
+                "split": dict(self._split),
+                "shadow": self._shadow,
+                "versions": {
+                    version: entry.info for version, entry in self._versions.items()
+                },
+                "loading": dict(self._loads),
+            }
+
+
+registry = ModelRegistry()
+
+
+def get_model(client: Any = None):
+    """
+    Get the YOLO model a client's work runs on, loading the configured
+    weights on first use.
+    """
+    return registry.get(client).model
+
+
+def warmup_model() -> Dict[str, Any]:
+    """
+    Load and warm up the configured weights as the active version, and
+    set up the cascade classifier if it is enabled, so that no request
+    waits for either. Returns the model info reported by the readiness
+    endpoint.
+    """
+    entry = registry.load(SETTINGS["model_path"], activate=True)
+    if not entry.info["warm_latency_ms"]:
+        # Preloaded before the workers forked
+        registry.warmup(entry.version)
+    get_classifier()
+    return get_model_info()
+
+
+def preload_model() -> Dict[str, Any]:
+    """
+    Load the configured weights as the active version without running
+    them, for a parent process to share with the workers it forks. Each
+    worker still calls warmup_model: running the model starts scheduler
+    and torch threads, which must not exist when the process forks.
+    """
+    registry.load(SETTINGS["model_path"], activate=True, warmup=False)
+    return get_model_info()
+
+
+def load_in_background() -> Optional[threading.Thread]:
+    """
+    Load and warm up the configured weights on a background thread, unless
+    a model is already active (e.g. warmed up after the worker forked).
+    The server serves meanwhile; is_model_ready gates the work that needs
+    the model.
+    """
+    if registry.active is not None:
+        return None
+
+    def run():
+        try:
+            warmup_model()
+        except Exception:
+            # Already logged by the registry; the server stays not ready
+            pass
+
+    thread = threading.Thread(target=run, name="model-load", daemon=True)
+    thread.start()
+    return thread
+
+
+def is_model_ready() -> bool:
+    """Whether a model has been loaded, warmed up and activated."""
+    return registry.active is not None
+
+
+def get_model_info() -> Dict[str, Any]:
+    """Return the active model's version, hash, backend and warm latency."""
+    active = registry.active
+    if active is None:
+        return {"ready": False}
+    return {
+        "ready": True,
+        "model_version": active.version,
+        **active.info,
+        "resident_versions": registry.versions(),
+    }
@@ -0,0 +1,173 @@
+import weakref
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# Column layout of the N x 6 detection arrays returned by ultralytics
+X1, Y1, X2, Y2, CONF, CLS = range(6)
+
+EMPTY_DETECTIONS = np.zeros((0, 6), dtype=np.float32)
+
+# model -> class name table; entries go away with unloaded models
+_name_tables: "weakref.WeakKeyDictionary[Any, np.ndarray]" = weakref.WeakKeyDictionary()
+
+
+def class_names(model) -> np.ndarray:
+    """
+    Return the model's class names as an array indexable by class id, so a
+    whole column of ids can be mapped to names in one operation.
+    """
+    table = _name_tables.get(model)
+    if table is None:
+        names = model.names
+        table = np.empty(max(names) + 1, dtype=object)
+        for class_id, name in names.items():
+            table[class_id] = name
+        _name_tables[model] = table
+    return table
+
+
+def extract_detections(results) -> np.ndarray:
+    """Return the first result's boxes as an N x 6 float32 array."""
+    if not results:
+        return EMPTY_DETECTIONS
+    data = results[0].boxes.data
+    if len(data) == 0:
+        return EMPTY_DETECTIONS
+    return data.cpu().numpy().astype(np.float32, copy=False)
+
+
+def filter_detections(
+    detections: np.ndarray,
+    conf_threshold: Optional[float] = None,
+    classes: Optional[List[int]] = None,
+) -> np.ndarray:
+    """Drop detections below the confidence threshold or outside the classes."""
+    mask = np.ones(len(detections), dtype=bool)
+    if conf_threshold is not None:
+        mask &= detections[:, CONF] >= conf_threshold
+    if classes is not None:
+        mask &= np.isin(detections[:, CLS].astype(np.int64), classes)
+    return detections[mask]
+
+
+def scale_detections(
+    detections: np.ndarray,
+    scale_x: float,
+    scale_y: float,
+    offset_x: float = 0.0,
+    offset_y: float = 0.0,
+) -> np.ndarray:
+    """Map box coordinates with x' = (x - offset_x) * scale_x (same for y)."""
+    scaled = detections.copy()
+    scaled[:, [X1, X2]] = (scaled[:, [X1, X2]] - offset_x) * scale_x
+    scaled[:, [Y1, Y2]] = (scaled[:, [Y1, Y2]] - offset_y) * scale_y
+    return scaled
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU of every box in a against every box in b, as an N x M matrix."""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:4], b[None, :, 2:4])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:4] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:4] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def merge_detections(detections: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    Class aware greedy NMS over detections gathered from overlapping tiles.
+    Overlap is measured as intersection over the smaller box, so the clipped
+    part of an object cut by a tile edge is suppressed by the whole box from
+    the neighbouring tile even though their IoU is low. The overlap matrix
+    is computed in one vectorized pass; boxes of different classes are
+    shifted apart so they never overlap.
+    """
+    if len(detections) < 2:
+        return detections
+
+    ordered = detections[np.argsort(-detections[:, CONF], kind="stable")]
+    boxes = ordered[:, :4].astype(np.float64)
+    boxes += ordered[:, CLS : CLS + 1] * (boxes.max() + 1.0)
+
+    top_left = np.maximum(boxes[:, None, :2], boxes[None, :, :2])
+    bottom_right = np.minimum(boxes[:, None, 2:], boxes[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+    overlap = inter / np.maximum(np.minimum(area[:, None], area[None, :]), 1e-9)
+    # Only a higher confidence box may suppress a lower one
+    overlap = np.triu(overlap, k=1) > threshold
+
+    keep = np.ones(len(ordered), dtype=bool)
+    for i in range(len(ordered)):
+        if keep[i]:
+            keep &= ~overlap[i]
+    return ordered[keep]
+
+
+def best_per_class(detections: np.ndarray) -> Dict[int, np.ndarray]:
+    """Return the highest confidence detection row for each class id."""
+    if len(detections) == 0:
+        return {}
+    # Sorting by confidence means later rows overwrite weaker ones
+    ordered = detections[np.argsort(detections[:, CONF], kind="stable")]
+    return dict(zip(ordered[:, CLS].astype(np.int64).tolist(), ordered))
+
+
+def class_confidences(detections: np.ndarray, names: np.ndarray) -> Dict[str, float]:
+    """Return the highest confidence seen for each detected class name."""
+    if len(detections) == 0:
+        return {}
+    ordered = detections[np.argsort(detections[:, CONF], kind="stable")]
+    class_ids = ordered[:, CLS].astype(np.int64)
+    return dict(zip(names[class_ids].tolist(), ordered[:, CONF].tolist()))
+
+
+def serialize_detections(
+    detections: np.ndarray,
+    names: np.ndarray,
+    image_width: Optional[int] = None,
+    image_height: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Convert detections to the JSON payload used by the API.
+    All columns are converted with a single tolist() so no per-box NumPy
+    scalars are created.
+    """
+    if len(detections) == 0:
+        return []
+
+    class_ids = detections[:, CLS].astype(np.int64)
+    rows = zip(
+        detections[:, :5].tolist(), class_ids.tolist(), names[class_ids].tolist()
+    )
+
+    if image_width is None or image_height is None:
+        return [
+            {
+                "x1": x1,
+                "y1": y1,
+                "x2": x2,
+                "y2": y2,
+                "confidence": conf,
+                "class_id": class_id,
+                "class_name": class_name,
+            }
+            for (x1, y1, x2, y2, conf), class_id, class_name in rows
+        ]
+
+    return [
+        {
+            "x1": x1,
+            "y1": y1,
+            "x2": x2,
+            "y2": y2,
+            "confidence": conf,
+            "class_id": class_id,
+            "class_name": class_name,
+            "image_width": image_width,
+            "image_height": image_height,
+        }
+        for (x1, y1, x2, y2, conf), class_id, class_name in rows
+    ]
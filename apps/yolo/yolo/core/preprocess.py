@@ -0,0 +1,274 @@
+import math
+import threading
+from typing import Iterator, Optional, Tuple
+
+import av
+import cv2
+import numpy as np
+from av import VideoFrame
+
+from core.postprocess import scale_detections
+
+# Padding value ultralytics uses for letterboxing
+PAD_VALUE = 114
+
+# JPEG start-of-frame markers that carry the image dimensions
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD}
+
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+
+def jpeg_dimensions(data) -> Optional[Tuple[int, int]]:
+    """
+    Read (width, height) from a JPEG header without decoding the image.
+    Returns None if the data is not a JPEG or the header cannot be parsed.
+    """
+    view = memoryview(data)
+    if len(view) < 4 or view[0] != 0xFF or view[1] != 0xD8:
+        return None
+
+    pos = 2
+    while pos + 9 < len(view):
+        if view[pos] != 0xFF:
+            return None
+        marker = view[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        length = (view[pos + 2] << 8) | view[pos + 3]
+        if marker in _SOF_MARKERS:
+            height = (view[pos + 5] << 8) | view[pos + 6]
+            width = (view[pos + 7] << 8) | view[pos + 8]
+            return width, height
+        pos += 2 + length
+    return None
+
+
+def decode_image(
+    data, target_size: Optional[int] = None
+) -> Tuple[Optional[np.ndarray], Optional[Tuple[int, int]]]:
+    """
+    Decode encoded image bytes.
+    For JPEGs whose longest side is at least twice target_size, libjpeg
+    downscales during decoding (IMREAD_REDUCED_COLOR_*), which skips most
+    of the IDCT work. Returns the image and the original (width, height),
+    both after EXIF orientation is applied, or (None, None) if the data
+    cannot be decoded.
+    """
+    if len(data) == 0:
+        return None, None
+    buf = np.frombuffer(data, np.uint8)
+
+    dimensions = jpeg_dimensions(data) if target_size else None
+    if dimensions:
+        longest = max(dimensions)
+        for factor, flag in _REDUCED_FLAGS:
+            if longest // factor >= target_size:
+                img = cv2.imdecode(buf, flag)
+                if img is None:
+                    return None, None
+                # The header has the stored size; imdecode applies the EXIF
+                # orientation, which may turn the image by 90 degrees
+                width, height = dimensions
+                if (img.shape[1] > img.shape[0]) != (width > height):
+                    dimensions = (height, width)
+                return img, dimensions
+
+    img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    if img is None:
+        return None, None
+    return img, (img.shape[1], img.shape[0])
+
+
+def frame_to_bgr(frame: VideoFrame, width: int, height: int) -> np.ndarray:
+    """
+    Convert a decoded frame to BGR at the given size.
+    libav scales and converts in a single pass, so a full resolution BGR
+    copy of a frame that is only needed downscaled is never made.
+    """
+    if (width, height) != (frame.width, frame.height):
+        frame = frame.reformat(width=width, height=height, format="bgr24")
+        return frame.to_ndarray()
+    return frame.to_ndarray(format="bgr24")
+
+
+def sample_video_frames(
+    container, interval: float, min_seek_gap: float
+) -> Iterator[VideoFrame]:
+    """
+    Yield roughly one decoded frame every interval seconds from the first
+    video stream of an open PyAV container.
+    When the next sample is more than min_seek_gap seconds ahead, the
+    demuxer seeks to the keyframe before it instead of decoding every frame
+    in between. Frames are yielded in libav's native format; nothing is
+    converted until the caller asks for it.
+    """
+    stream = container.streams.video[0]
+    stream.thread_type = "AUTO"
+
+    rate = float(stream.average_rate or 30)
+    epsilon = 0.5 / rate
+    start = stream.start_time or 0
+
+    frames = container.decode(stream)
+    target = 0.0
+    seeked_for = None
+
+    while True:
+        try:
+            frame = next(frames)
+        except (StopIteration, av.EOFError):
+            return
+        if frame.time is None:
+            continue
+
+        if frame.time + epsilon < target:
+            # Seeking lands on the preceding keyframe, so only seek once per
+            # target in case that keyframe is still more than the gap away
+            if target - frame.time > min_seek_gap and seeked_for != target:
+                seeked_for = target
+                container.seek(
+                    start + int(target / stream.time_base),
+                    stream=stream,
+                    backward=True,
+                )
+                frames = container.decode(stream)
+            continue
+
+        yield frame
+        target = (math.floor((frame.time + epsilon) / interval) + 1) * interval
+
+
+class Letterbox:
+    """
+    Resize and pad images to the model input size into a preallocated buffer.
+    The image is scaled so its longest side matches the input size and padded
+    to a multiple of the model stride, like ultralytics' own rectangular
+    inference, so the model's internal letterbox becomes a no-op. One
+    instance is meant to be reused per stream so the buffer and its padding
+    only change when the input resolution does.
+    """
+
+    def __init__(self, size: int, stride: int = 32):
+        self.size = size
+        self.stride = stride
+        self.scale = 1.0
+        self.pad_x = 0
+        self.pad_y = 0
+        self._buffer: Optional[np.ndarray] = None
+        self._input_shape = None
+
+    def fit(self, width: int, height: int) -> Tuple[int, int]:
+        """Return the (width, height) an input is resized to before padding."""
+        scale = min(self.size / height, self.size / width)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def _layout(self, height: int, width: int) -> None:
+        self.scale = min(self.size / height, self.size / width)
+        self._resized = self.fit(width, height)
+        padded_w = math.ceil(self._resized[0] / self.stride) * self.stride
+        padded_h = math.ceil(self._resized[1] / self.stride) * self.stride
+        self.pad_x = (padded_w - self._resized[0]) // 2
+        self.pad_y = (padded_h - self._resized[1]) // 2
+
+        self._buffer = np.full((padded_h, padded_w, 3), PAD_VALUE, dtype=np.uint8)
+        self._view = self._buffer[
+            self.pad_y : self.pad_y + self._resized[1],
+            self.pad_x : self.pad_x + self._resized[0],
+        ]
+
+    def __call__(self, img: np.ndarray) -> np.ndarray:
+        """Letterbox an image, returning the shared buffer."""
+        shape = img.shape[:2]
+        if shape != self._input_shape:
+            self._layout(*shape)
+            self._input_shape = shape
+
+        if self._resized == (shape[1], shape[0]):
+            self._view[:] = img
+        else:
+            interpolation = cv2.INTER_AREA if self.scale < 1 else cv2.INTER_LINEAR
+            cv2.resize(img, self._resized, dst=self._view, interpolation=interpolation)
+        return self._buffer
+
+    def restore(self, detections: np.ndarray) -> np.ndarray:
+        """Map detections on the letterboxed buffer back to the input image."""
+        return scale_detections(
+            detections, 1 / self.scale, 1 / self.scale, self.pad_x, self.pad_y
+        )
+
+
+class FrameCanvas:
+    """
+    Full resolution BGR copy of a frame to draw on, held in a preallocated
+    buffer that is also the pixel data of the frame handed back, so
+    annotating a frame allocates neither an array nor a frame. yuv420p
+    frames are converted by OpenCV straight into the buffer; other formats
+    go through libav and one copy. One instance is meant to be reused per
+    stream, and the returned frame is only valid until the next call.
+    """
+
+    def __init__(self):
+        self._buffer: Optional[np.ndarray] = None
+        self._i420: Optional[np.ndarray] = None
+        self._frame: Optional[VideoFrame] = None
+
+    def _layout(self, width: int, height: int) -> None:
+        self._buffer = np.empty((height, width, 3), dtype=np.uint8)
+        self._i420 = np.empty((height * 3 // 2, width), dtype=np.uint8)
+        self._frame = VideoFrame.from_numpy_buffer(self._buffer, format="bgr24")
+
+    def _copy_i420(self, frame: VideoFrame) -> None:
+        """Pack the planes of a yuv420p frame without their row padding."""
+        flat = self._i420.reshape(-1)
+        offset = 0
+        for plane in frame.planes:
+            rows = np.frombuffer(plane, dtype=np.uint8).reshape(
+                plane.height, plane.line_size
+            )
+            size = plane.height * plane.width
+            flat[offset : offset + size].reshape(plane.height, plane.width)[:] = rows[
+                :, : plane.width
+            ]
+            offset += size
+
+    def draw(self, frame: VideoFrame) -> np.ndarray:
+        """Copy a frame into the buffer and return the buffer to draw on."""
+        if self._buffer is None or self._buffer.shape[:2] != (
+            frame.height,
+            frame.width,
+        ):
+            self._layout(frame.width, frame.height)
+
+        if (
+            frame.format.name == "yuv420p"
+            and frame.width % 2 == 0
+            and frame.height % 2 == 0
+        ):
+            self._copy_i420(frame)
+            cv2.cvtColor(self._i420, cv2.COLOR_YUV2BGR_I420, dst=self._buffer)
+        else:
+            self._buffer[:] = frame.to_ndarray(format="bgr24")
+        return self._buffer
+
+    def frame(self, source: VideoFrame) -> VideoFrame:
+        """The buffer as a frame with the timing of source."""
+        self._frame.pts = source.pts
+        self._frame.time_base = source.time_base
+        return self._frame
+
+
+_local = threading.local()
+
+
+def thread_letterbox(size: int) -> Letterbox:
+    """Return a letterbox buffer owned by the calling thread."""
+    letterbox = getattr(_local, "letterbox", None)
+    if letterbox is None or letterbox.size != size:
+        letterbox = Letterbox(size)
+        _local.letterbox = letterbox
+    return letterbox
@@ -0,0 +1,135 @@
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from core.postprocess import X1, Y1, X2, Y2, CONF, CLS
+from utils.metrics import record_cache_lookup
+
+BOX_COLOR = (0, 255, 0)
+BOX_THICKNESS = 2
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+FONT_SCALE = 0.5
+# Labels are drawn this many pixels above the top of the box
+LABEL_OFFSET = 10
+
+
+class DetectionRenderer:
+    """
+    Draws detection boxes and labels.
+    Label text is rasterized once per class and confidence bucket (the two
+    decimals shown in the label) and then blitted as a cached mask, instead
+    of running cv2.putText for every box on every frame.
+    """
+
+    def __init__(
+        self,
+        color: Tuple[int, int, int] = BOX_COLOR,
+        thickness: int = BOX_THICKNESS,
+        font_scale: float = FONT_SCALE,
+        max_glyphs: int = 4096,
+    ):
+        self.color = tuple(int(c) for c in color)
+        self.thickness = thickness
+        self.font_scale = font_scale
+        self._max_glyphs = max_glyphs
+        # (class name, confidence bucket) -> (mask, fill, origin x, origin y)
+        self._glyphs: Dict[
+            Tuple[str, int], Tuple[np.ndarray, np.ndarray, int, int]
+        ] = {}
+
+    def _glyph(self, class_name: str, bucket: int):
+        key = (class_name, bucket)
+        glyph = self._glyphs.get(key)
+        record_cache_lookup("label_glyph", glyph is not None)
+        if glyph is not None:
+            return glyph
+
+        label = f"{class_name} {bucket / 100:.2f}"
+        (width, height), baseline = cv2.getTextSize(
+            label, FONT, self.font_scale, self.thickness
+        )
+        pad = self.thickness
+        canvas = np.zeros(
+            (height + baseline + 2 * pad, width + 2 * pad), dtype=np.uint8
+        )
+        origin_x, origin_y = pad, height + pad
+        cv2.putText(
+            canvas,
+            label,
+            (origin_x, origin_y),
+            FONT,
+            self.font_scale,
+            255,
+            self.thickness,
+        )
+
+        if len(self._glyphs) >= self._max_glyphs:
+            self._glyphs.clear()
+        mask = (canvas > 127).astype(np.uint8)
+        fill = np.empty(canvas.shape + (3,), dtype=np.uint8)
+        fill[:] = self.color
+        glyph = (mask, fill, origin_x, origin_y)
+        self._glyphs[key] = glyph
+        return glyph
+
+    def _blit(self, img: np.ndarray, glyph, x: int, y: int) -> None:
+        """Paint a glyph so its text origin lands on (x, y)."""
+        mask, fill, origin_x, origin_y = glyph
+        img_h, img_w = img.shape[:2]
+        top, left = y - origin_y, x - origin_x
+        bottom, right = top + mask.shape[0], left + mask.shape[1]
+
+        if top >= 0 and left >= 0 and bottom <= img_h and right <= img_w:
+            cv2.copyTo(fill, mask, img[top:bottom, left:right])
+            return
+
+        # Clip the glyph to the image
+        src_top, src_left = max(0, -top), max(0, -left)
+        top, left = max(0, top), max(0, left)
+        bottom, right = min(img_h, bottom), min(img_w, right)
+        if top >= bottom or left >= right:
+            return
+
+        rows = slice(src_top, src_top + bottom - top)
+        cols = slice(src_left, src_left + right - left)
+        cv2.copyTo(fill[rows, cols], mask[rows, cols], img[top:bottom, left:right])
+
+    def draw(
+        self,
+        img: np.ndarray,
+        detections: np.ndarray,
+        names: np.ndarray,
+        labels: Optional[List[str]] = None,
+    ) -> None:
+        """
+        Draw all detections (N x 6 array) onto a BGR image in place.
+        labels, if given, are drawn instead of the class names, one per
+        detection.
+        """
+        if len(detections) == 0:
+            return
+
+        boxes = detections[:, [X1, Y1, X2, Y2]].astype(np.int32).tolist()
+        if labels is None:
+            class_names = names[detections[:, CLS].astype(np.int64)].tolist()
+        else:
+            class_names = labels
+        buckets = np.rint(detections[:, CONF] * 100).astype(np.int32).tolist()
+
+        for (x1, y1, x2, y2), class_name, bucket in zip(boxes, class_names, buckets):
+            cv2.rectangle(img, (x1, y1), (x2, y2), self.color, self.thickness)
+            self._blit(img, self._glyph(class_name, bucket), x1, y1 - LABEL_OFFSET)
+
+
+_renderer = DetectionRenderer()
+
+
+def draw_detections(
+    img: np.ndarray,
+    detections: np.ndarray,
+    names: np.ndarray,
+    labels: Optional[List[str]] = None,
+) -> None:
+    """Draw detections with the shared renderer and its glyph cache."""
+    _renderer.draw(img, detections, names, labels)
@@ -0,0 +1,243 @@
+import os
+import time
+import heapq
+import asyncio
+import threading
+from concurrent.futures import Future
+from enum import IntEnum
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.logger import setup_logger
+from config import SETTINGS
+
+logger = setup_logger()
+
+# Weight of the newest job in the moving average of service time
+_SERVICE_TIME_ALPHA = 0.1
+
+
+class Priority(IntEnum):
+    """Inference priority classes, most urgent first."""
+
+    LIVE = 0
+    UPLOAD = 1
+    BATCH = 2
+
+
+class DeadlineExceeded(Exception):
+    """Raised for a job that was still queued when its deadline passed."""
+
+
+class _Job:
+    __slots__ = ("fn", "priority", "client", "deadline", "images", "future")
+
+    def __init__(self, fn, priority, client, deadline, images):
+        self.fn = fn
+        self.priority = priority
+        self.client = client
+        self.deadline = deadline
+        self.images = images
+        self.future: Future = Future()
+
+
+class InferenceScheduler:
+    """
+    Runs model calls on a fixed pool of worker threads.
+    A free worker always takes the most urgent class that has work queued
+    and is below its concurrency limit, so live frames never wait behind
+    uploads. Within a class, clients share the workers by weighted fair
+    queueing: each job is tagged with a virtual finish time that grows by
+    1/weight per job of its client, and the smallest tag runs first, so a
+    client submitting many jobs cannot starve the others. Jobs whose
+    deadline passes while queued are dropped instead of run.
+    """
+
+    def __init__(self, workers: int, concurrency: Dict[str, int]):
+        self.workers = max(1, workers)
+        self._limits = {
+            priority: max(1, concurrency.get(priority.name.lower(), self.workers))
+            for priority in Priority
+        }
+        # Per class heap of (finish tag, sequence, job)
+        self._queues: Dict[Priority, List[Tuple[float, int, _Job]]] = {
+            priority: [] for priority in Priority
+        }
+        self._virtual_time = {priority: 0.0 for priority in Priority}
+        # (priority, client) -> [finish tag of its last job, jobs queued]
+        self._clients: Dict[Tuple[Priority, Any], list] = {}
+        self._running = {priority: 0 for priority in Priority}
+        self._sequence = 0
+        # Moving average of job duration per image, in seconds
+        self._service_time: Optional[float] = None
+        self._threads: List[threading.Thread] = []
+        self._condition = threading.Condition()
+
+    def depth(self, priority: Priority) -> int:
+        """Number of jobs waiting in a priority class."""
+        return len(self._queues[priority])
+
+    def running(self, priority: Priority) -> int:
+        return self._running[priority]
+
+    def backlog(self, priority: Priority) -> int:
+        """
+        Number of jobs a new job of a class would wait for: those queued in
+        it and in more urgent classes, plus one if no worker is free.
+        """
+        queued = sum(len(self._queues[p]) for p in Priority if p <= priority)
+        return queued + (sum(self._running.values()) >= self.workers)
+
+    def throughput(self) -> Optional[float]:
+        """
+        Jobs per second the workers can sustain, estimated from recent live
+        and upload jobs, or None before any has run.
+        """
+        if not self._service_time:
+            return None
+        return self.workers / self._service_time
+
+    def _start(self) -> None:
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker, name=f"inference-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(
+            f"Inference scheduler started with {self.workers} workers, "
+            f"limits { ({p.name.lower(): n for p, n in self._limits.items()}) }"
+        )
+
+    def _reset_after_fork(self) -> None:
+        """
+        Drop the worker threads and queued work of the parent, neither of
+        which exists in a forked child; its first job starts new workers.
+        """
+        self._condition = threading.Condition()
+        self._threads = []
+        self._queues = {priority: [] for priority in Priority}
+        self._clients = {}
+        self._running = {priority: 0 for priority in Priority}
+
+    def submit(
+        self,
+        fn: Callable[[], Any],
+        priority: Priority,
+        client: Any = None,
+        weight: float = 1.0,
+        deadline: Optional[float] = None,
+        images: int = 1,
+    ) -> Future:
+        """
+        Queue fn and return a future for its result. deadline is a
+        time.monotonic() value after which the job is dropped if it has not
+        started, failing the future with DeadlineExceeded. images is the
+        number of images fn runs the model on, for the service time estimate.
+        """
+        job = _Job(fn, priority, client, deadline, max(1, images))
+
+        with self._condition:
+            if not self._threads:
+                self._start()
+
+            state = self._clients.setdefault((priority, client), [0.0, 0])
+            start = max(self._virtual_time[priority], state[0])
+            state[0] = start + 1.0 / weight
+            state[1] += 1
+
+            self._sequence += 1
+            heapq.heappush(self._queues[priority], (state[0], self._sequence, job))
+            self._condition.notify()
+
+        return job.future
+
+    def run(
+        self,
+        fn: Callable[[], Any],
+        priority: Priority,
+        client: Any = None,
+        images: int = 1,
+    ):
+        """Run fn through the scheduler, blocking the calling thread."""
+        return self.submit(fn, priority, client, images=images).result()
+
+    async def infer(
+        self,
+        fn: Callable[[], Any],
+        priority: Priority,
+        client: Any = None,
+        deadline: Optional[float] = None,
+    ):
+        """Run fn through the scheduler without blocking the event loop."""
+        return await asyncio.wrap_future(
+            self.submit(fn, priority, client, deadline=deadline)
+        )
+
+    def _dequeue(self, priority: Priority) -> _Job:
+        tag, _, job = heapq.heappop(self._queues[priority])
+        self._virtual_time[priority] = max(self._virtual_time[priority], tag)
+
+        key = (priority, job.client)
+        state = self._clients[key]
+        state[1] -= 1
+        if state[1] == 0:
+            del self._clients[key]
+        return job
+
+    def _next_job(self) -> Optional[_Job]:
+        now = time.monotonic()
+        for priority in Priority:
+            if self._running[priority] >= self._limits[priority]:
+                continue
+            while self._queues[priority]:
+                job = self._dequeue(priority)
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                if job.deadline is not None and now > job.deadline:
+                    job.future.set_exception(DeadlineExceeded())
+                    continue
+                return job
+        return None
+
+    def _worker(self) -> None:
+        while True:
+            with self._condition:
+                job = self._next_job()
+                while job is None:
+                    self._condition.wait()
+                    job = self._next_job()
+                self._running[job.priority] += 1
+
+            start = time.perf_counter()
+            try:
+                job.future.set_result(job.fn())
+            except BaseException as e:
+                job.future.set_exception(e)
+            finally:
+                # Per image, as upload jobs may run several in one batch
+                elapsed = (time.perf_counter() - start) / job.images
+                with self._condition:
+                    # Batch jobs vary in image size, so they would skew the
+                    # per frame estimate
+                    if job.priority != Priority.BATCH:
+                        self._service_time = (
+                            elapsed
+                            if self._service_time is None
+                            else self._service_time
+                            + _SERVICE_TIME_ALPHA * (elapsed - self._service_time)
+                        )
+                    self._running[job.priority] -= 1
+                    # A class that was at its limit may have work queued
+                    self._condition.notify_all()
+
+
+scheduler = InferenceScheduler(
+    workers=SETTINGS["inference_workers"],
+    concurrency=SETTINGS["inference_concurrency"],
+)
+os.register_at_fork(after_in_child=scheduler._reset_after_fork)
+
+
+def live_deadline() -> float:
+    """Deadline for a live frame submitted now."""
+    return time.monotonic() + SETTINGS["live_frame_deadline_ms"] / 1000.0
@@ -0,0 +1,58 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from core.postprocess import EMPTY_DETECTIONS, X1, X2, Y1, Y2, merge_detections
+from config import SETTINGS
+
+
+def use_tiling(width: int, height: int, tiled: Optional[bool] = None) -> bool:
+    """
+    Whether an image should be run in tiles. tiled forces the choice;
+    otherwise images whose longest side reaches tiling_min_size are tiled.
+    """
+    if tiled is not None:
+        return tiled
+    return max(width, height) >= SETTINGS["tiling_min_size"]
+
+
+def _origins(length: int, tile: int, stride: int) -> np.ndarray:
+    """Tile start positions along one axis; the last tile ends at the edge."""
+    if length <= tile:
+        return np.zeros(1, dtype=np.int64)
+    origins = np.arange(0, length - tile, stride)
+    return np.append(origins, length - tile)
+
+
+def make_tiles(
+    img: np.ndarray, tile_size: int, overlap: float
+) -> Tuple[List[np.ndarray], np.ndarray]:
+    """
+    Slice an image into overlapping tile_size squares. Tiles are views into
+    img. Returns the tiles and their (x, y) origins as a K x 2 array.
+    """
+    height, width = img.shape[:2]
+    stride = max(1, int(tile_size * (1.0 - overlap)))
+    xs = _origins(width, tile_size, stride)
+    ys = _origins(height, tile_size, stride)
+    origins = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)
+    tiles = [img[y : y + tile_size, x : x + tile_size] for x, y in origins.tolist()]
+    return tiles, origins
+
+
+def merge_tiles(
+    tile_detections: List[np.ndarray], origins: np.ndarray, threshold: float
+) -> np.ndarray:
+    """
+    Shift per tile detections into image coordinates and merge the
+    duplicates found in overlapping tiles.
+    """
+    counts = [len(d) for d in tile_detections]
+    if not sum(counts):
+        return EMPTY_DETECTIONS
+
+    merged = np.concatenate(tile_detections)
+    offsets = np.repeat(origins.astype(np.float32), counts, axis=0)
+    merged[:, [X1, X2]] += offsets[:, :1]
+    merged[:, [Y1, Y2]] += offsets[:, 1:]
+    return merge_detections(merged, threshold)
@@ -1,12 +1,12 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+import importlib
 import uvicorn
 import os
 
 from utils.logger import setup_logger
-from core.model import get_model
-from routers import index, webrtc, websocket, localonly, file_upload
-from utils.webrtc_utils import cleanup_peer_connections
+from core.model import load_in_background
+from config import SETTINGS
 
 logger = setup_logger()
 
@@ -15,14 +15,10 @@ def create_application() -> FastAPI:
     """Create and configure the FastAPI application."""
     app = FastAPI(title="YOLO WebRTC Object Detection")
 
-    uploads_dir = os.path.join(os.getcwd(), "uploads")
     processed_dir = os.path.join(os.getcwd(), "processed")
-    os.makedirs(uploads_dir, exist_ok=True)
     os.makedirs(processed_dir, exist_ok=True)
 
-    logger.info(
-        f"File directories initialized: uploads={uploads_dir}, processed={processed_dir}"
-    )
+    logger.info(f"File directories initialized: processed={processed_dir}")
 
     # Add CORS middleware
     app.add_middleware(
@@ -31,22 +27,24 @@ def create_application() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
-        expose_headers=["Content-Disposition"],
+        expose_headers=["Content-Disposition", "Retry-After"],
     )
 
-    get_model()
+    # Routers, and the libraries they need, are imported only when mounted
+    for name in SETTINGS["routers"]:
+        module = importlib.import_module(f"routers.{name.strip()}")
+        app.include_router(module.router)
 
-    app.include_router(index.router)
-    app.include_router(webrtc.router)
-    app.include_router(websocket.router)
-    app.include_router(localonly.router)
-    app.include_router(file_upload.router)
+    # The model loads while the server already accepts connections;
+    # /ready and admission report it as not ready until it is warmed up
+    @app.on_event("startup")
+    async def on_startup():
+        load_in_background()
 
     # Shutdown event handler
     @app.on_event("shutdown")
     async def on_shutdown():
         logger.info("Application shutting down...")
-        await cleanup_peer_connections()
 
     return app
 
@@ -55,4 +53,11 @@ app = create_application()
 
 if __name__ == "__main__":
     logger.info("Starting server...")
-    uvicorn.run("main:app", host="0.0.0.0", port=5005, reload=True, log_level="warning")
+    # Development server; serve.py runs production workers
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=5005,
+        reload=os.environ.get("YOLO_RELOAD") == "1",
+        log_level="warning",
+    )
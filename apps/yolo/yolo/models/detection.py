@@ -1,6 +1,22 @@
-from typing import Dict, List
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
 from pydantic import BaseModel
 
+from core.postprocess import EMPTY_DETECTIONS, serialize_detections
+from utils.logger import DetectionLogLimiter, setup_logger
+from utils.metrics import SESSIONS_EVICTED
+from config import SETTINGS
+
+logger = setup_logger()
+
+# Rough per session memory besides the detection array, for the memory cap
+_SESSION_OVERHEAD = 600
+_LOGGED_CLASS_OVERHEAD = 150
+
 
 class Detection(BaseModel):
     """Detection data model."""
@@ -14,6 +30,10 @@ class Detection(BaseModel):
     class_name: str
     image_width: int = None
     image_height: int = None
+    # Set in cascade mode
+    track_id: Optional[int] = None
+    classifier_class_name: Optional[str] = None
+    classifier_confidence: Optional[float] = None
 
 
 class DetectionResponse(BaseModel):
@@ -30,13 +50,146 @@ class ClientIdResponse(BaseModel):
     client_id: str
 
 
-class ClientDetection(BaseModel):
-    """Store for client detection data."""
+class Session:
+    """
+    State kept for one live client: its latest detections as an N x 6 array
+    plus the shared class name table, and its detection log limiter.
+    """
+
+    __slots__ = (
+        "client_id",
+        "kind",
+        "boxes",
+        "names",
+        "width",
+        "height",
+        "log_limiter",
+        "touched",
+    )
+
+    def __init__(self, client_id: str, kind: str, now: float):
+        self.client_id = client_id
+        self.kind = kind
+        self.boxes = EMPTY_DETECTIONS
+        self.names: Optional[np.ndarray] = None
+        self.width: Optional[int] = None
+        self.height: Optional[int] = None
+        self.log_limiter = DetectionLogLimiter()
+        self.touched = now
+
+    def nbytes(self) -> int:
+        """Rough memory held by the session."""
+        return (
+            _SESSION_OVERHEAD
+            + self.boxes.nbytes
+            + len(self.log_limiter.last_logged) * _LOGGED_CLASS_OVERHEAD
+        )
+
+    def detections(self) -> List[Dict[str, Any]]:
+        """The latest detections in the API's JSON format."""
+        if self.names is None:
+            return []
+        return serialize_detections(self.boxes, self.names, self.width, self.height)
+
+
+class SessionStore:
+    """
+    Live client sessions, least recently updated first. Sessions are
+    closed by their owner when the client goes away; those that are never
+    closed (e.g. a peer connection that just stops sending frames) expire
+    after session_ttl_seconds, checked as sessions are used and by sweep,
+    and the least recently updated are evicted when the estimated memory
+    exceeds session_max_bytes. Only open creates sessions; updates to a
+    closed or evicted one are ignored.
+    """
+
+    def __init__(self):
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def count(self, kind: str) -> int:
+        return sum(1 for session in self._sessions.values() if session.kind == kind)
+
+    def get(self, client_id: str) -> Optional[Session]:
+        return self._sessions.get(client_id)
+
+    def open(self, client_id: str, kind: str) -> Session:
+        with self._lock:
+            now = time.monotonic()
+            session = self._sessions.get(client_id)
+            if session is None:
+                session = self._sessions[client_id] = Session(client_id, kind, now)
+                self.bytes += session.nbytes()
+            self._evict(now)
+            return session
+
+    def close(self, client_id: str) -> None:
+        with self._lock:
+            session = self._sessions.pop(client_id, None)
+            if session is not None:
+                self.bytes -= session.nbytes()
+
+    def update(
+        self,
+        session: Session,
+        boxes: np.ndarray,
+        names: np.ndarray,
+        width: int,
+        height: int,
+        detected_classes: Dict[str, float],
+    ) -> bool:
+        """
+        Store a client's latest detections and return whether they should
+        be logged (see DetectionLogLimiter).
+        """
+        with self._lock:
+            # A late frame of a stopped stream must not bring it back
+            if self._sessions.get(session.client_id) is not session:
+                return False
+
+            now = time.monotonic()
+            self.bytes -= session.nbytes()
+
+            session.boxes = boxes
+            session.names = names
+            session.width = width
+            session.height = height
+            session.touched = now
+            log = session.log_limiter.allow(detected_classes, now)
+
+            self._sessions.move_to_end(session.client_id)
+            self.bytes += session.nbytes()
+            self._evict(now)
+            return log
+
+    def sweep(self) -> None:
+        """Expire idle sessions now, e.g. while no client is sending frames."""
+        with self._lock:
+            self._evict(time.monotonic(), sweep=True)
+
+    def _evict(self, now: float, sweep: bool = False) -> None:
+        if sweep or now - self._last_sweep > SETTINGS["session_sweep_seconds"]:
+            self._last_sweep = now
+            ttl = SETTINGS["session_ttl_seconds"]
+            while self._sessions:
+                session = next(iter(self._sessions.values()))
+                if now - session.touched <= ttl:
+                    break
+                self._remove(session, "ttl")
+
+        while self.bytes > SETTINGS["session_max_bytes"] and len(self._sessions) > 1:
+            self._remove(next(iter(self._sessions.values())), "memory")
 
-    active: bool = True
-    detections: List[Detection] = []
+    def _remove(self, session: Session, reason: str) -> None:
+        del self._sessions[session.client_id]
+        self.bytes -= session.nbytes()
+        SESSIONS_EVICTED.inc(reason=reason)
+        logger.info(f"Evicted {session.kind} session {session.client_id} ({reason})")
 
 
-# Global storage for client detections and timing data
-client_detections: Dict[str, ClientDetection] = {}
-last_logged_predictions: Dict[str, Dict[str, float]] = {}
+sessions = SessionStore()
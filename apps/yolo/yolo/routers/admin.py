@@ -0,0 +1,179 @@
+import os
+import asyncio
+import secrets
+from typing import Dict, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from core.model import registry
+from utils.profiling import PROFILER
+from utils.logger import setup_logger
+from config import SETTINGS
+
+logger = setup_logger()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """
+    Reject admin requests without the configured token. Without a token
+    configured every admin request is rejected, as they can load weights.
+    """
+    token = SETTINGS["admin_token"]
+    if not token:
+        raise HTTPException(
+            status_code=403, detail="Admin API disabled, set YOLO_ADMIN_TOKEN"
+        )
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+class ProfilingSettings(BaseModel):
+    """Request model for toggling the profiler"""
+
+    enabled: bool
+    reset: bool = False
+
+
+@router.get("/profiling")
+async def get_profiling():
+    """Return the profiler state and the timing spans collected so far."""
+    return {"enabled": PROFILER.enabled, "spans": PROFILER.stats()}
+
+
+@router.post("/profiling")
+async def set_profiling(settings: ProfilingSettings):
+    """Enable or disable hot path timing spans at runtime."""
+    if settings.reset:
+        PROFILER.reset()
+    PROFILER.enabled = settings.enabled
+    logger.info(f"Profiling {'enabled' if settings.enabled else 'disabled'}")
+    return {"enabled": PROFILER.enabled, "spans": PROFILER.stats()}
+
+
+@router.post("/profiling/sample", response_class=PlainTextResponse)
+async def sample_profile(
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: float = Query(5.0, ge=1),
+):
+    """
+    Run the sampling profiler for the given number of seconds and return the
+    stacks in the folded flamegraph format. Runs are capped at
+    profiling_max_seconds and profiling_max_samples.
+    """
+    seconds = min(seconds, SETTINGS["profiling_max_seconds"])
+    logger.info(f"Running sampling profiler for {seconds}s")
+
+    try:
+        folded = await asyncio.to_thread(
+            PROFILER.sample,
+            seconds,
+            interval_ms / 1000.0,
+            SETTINGS["profiling_max_samples"],
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return PlainTextResponse(folded)
+
+
+class ModelLoad(BaseModel):
+    """Request model for loading a model version"""
+
+    # Relative to model_dir
+    path: str
+    version: Optional[str] = None
+    # Switch traffic to the version once it is warmed up
+    activate: bool = True
+
+
+class ShadowSettings(BaseModel):
+    """Request model for choosing the shadow version"""
+
+    version: Optional[str] = None
+
+
+def _load_in_background(load: ModelLoad, path: str) -> None:
+    try:
+        registry.load(path, load.version, load.activate)
+    except Exception:
+        # Logged and reported through GET /admin/models
+        pass
+
+
+@router.get("/models")
+async def get_models():
+    """Return the resident model versions, the active one and any split."""
+    return registry.describe()
+
+
+@router.post("/models", status_code=202)
+async def load_model(load: ModelLoad, background_tasks: BackgroundTasks):
+    """
+    Load and warm up a model version in the background while the current
+    one keeps serving. Progress is shown under "loading" in GET /admin/models.
+    """
+    model_dir = os.path.realpath(SETTINGS["model_dir"])
+    path = os.path.realpath(os.path.join(model_dir, load.path))
+    if os.path.commonpath([model_dir, path]) != model_dir:
+        raise HTTPException(
+            status_code=400, detail="Path is outside the model directory"
+        )
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Model file not found")
+
+    logger.info(f"Loading model version from {path}")
+    background_tasks.add_task(_load_in_background, load, path)
+    return {"status": "loading", "path": path}
+
+
+@router.post("/models/{version}/activate")
+async def activate_model(version: str):
+    """Switch all new inference to a resident version."""
+    try:
+        registry.activate(version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown model version")
+    return registry.describe()
+
+
+@router.delete("/models/{version}")
+async def unload_model(version: str):
+    try:
+        registry.unload(version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown model version")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return registry.describe()
+
+
+@router.put("/models/split")
+async def set_model_split(split: Dict[str, float]):
+    """
+    Send a share of clients to other versions, e.g. {"v2": 0.1} for 10%,
+    for A/B comparison. An empty object sends everyone to the active version.
+    """
+    try:
+        registry.set_split(split)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown model version")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return registry.describe()
+
+
+@router.put("/models/shadow")
+async def set_model_shadow(settings: ShadowSettings):
+    """
+    Rerun a sample of live frames on another version and count how its
+    boxes agree with the active version's (yolo_shadow_boxes_total).
+    """
+    try:
+        registry.set_shadow(settings.version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown model version")
+    return registry.describe()
@@ -1,25 +1,56 @@
 import os
+import json
+import mmap
+import asyncio
+import threading
 import uuid
 import time
-import shutil
-from typing import List, Dict, Any, Optional
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import FileResponse
+from contextlib import ExitStack, contextmanager
+from functools import partial
+from typing import Callable, List, Dict, Any, Optional
+from email.utils import formatdate
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+import av
 import cv2
+import numpy as np
 from pydantic import BaseModel
 
-from core.model import get_model
+from core.cascade import CascadeSession
+from core.model import ModelVersion, Variant, registry, select_variant
+from core.postprocess import (
+    CONF,
+    best_per_class,
+    class_names,
+    extract_detections,
+    scale_detections,
+    serialize_detections,
+)
+from core.encode import PRESETS, SUPPORTED_CODECS, VideoEncoder
+from core.preprocess import (
+    Letterbox,
+    decode_image,
+    frame_to_bgr,
+    sample_video_frames,
+    thread_letterbox,
+)
+from core.render import draw_detections
+from core.tiling import make_tiles, merge_tiles, use_tiling
+from core.scheduler import Priority, scheduler
+from models.detection import sessions
+from utils.admission import Rejected, admission
+from utils.artifacts import CONTENT_TYPES, Artifact, artifact_store
 from utils.logger import setup_logger
+from utils.profiling import span
+from utils.metrics import time_stage, observe_prediction
 from config import SETTINGS
 
 logger = setup_logger()
 
 router = APIRouter()
 
-UPLOAD_DIR = os.path.join(os.getcwd(), "uploads")
 PROCESSED_DIR = os.path.join(os.getcwd(), "processed")
 
-os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(PROCESSED_DIR, exist_ok=True)
 
 
@@ -34,6 +65,17 @@ class DetectionResult(BaseModel):
     y2: float
     image_width: int
     image_height: int
+    # Set in cascade mode when the classifier labelled the box
+    classifier_class_name: Optional[str] = None
+    classifier_confidence: Optional[float] = None
+
+
+class FrameDetections(BaseModel):
+    """Model for the detections on one sampled video frame"""
+
+    frame_index: int
+    timestamp: float
+    detections: List[DetectionResult]
 
 
 class ProcessingResponse(BaseModel):
@@ -45,253 +87,622 @@ class ProcessingResponse(BaseModel):
     height: int
     is_video: bool
     duration: Optional[float] = None
+    # False for detections-only uploads, which have nothing to download
+    has_output: bool = True
+    timeline: Optional[List[FrameDetections]] = None
+    # Model version and variant that produced the detections
+    model_version: Optional[str] = None
+    variant: Optional[str] = None
 
 
-def process_image(
-    img_path: str, output_path: str, conf_threshold: float = None
+def _sampling_step(fps: int, frame_count: int) -> int:
+    """Number of frames between the frames that are run through the model"""
+    frames_per_second = max(1, int(fps / 4))
+    min_total_frames = 15
+
+    if frame_count < min_total_frames * frames_per_second:
+        # For very short videos, process more frames
+        frames_per_second = max(1, int(frame_count / min_total_frames))
+
+    return frames_per_second
+
+
+def _update_best_detections(
+    best_detections: Dict[int, np.ndarray], detections: np.ndarray
+) -> List[int]:
+    """Keep the highest confidence row per class id, returning the frame's class ids"""
+    frame_best = best_per_class(detections)
+    for class_id, row in frame_best.items():
+        best = best_detections.get(class_id)
+        if best is None or row[CONF] > best[CONF]:
+            best_detections[class_id] = row
+    return list(frame_best)
+
+
+def _serialize_best(
+    best_detections: Dict[int, np.ndarray], names: np.ndarray, width: int, height: int
 ) -> List[Dict[str, Any]]:
-    """Process an image with YOLO object detection"""
+    if not best_detections:
+        return []
+    return serialize_detections(
+        np.stack(list(best_detections.values())), names, width, height
+    )
+
+
+def _open_video(source):
+    """Open a video path or file-like object with PyAV"""
+    try:
+        container = av.open(source)
+    except av.FFmpegError:
+        raise HTTPException(status_code=400, detail="Could not open video file")
+
+    if not container.streams.video:
+        container.close()
+        raise HTTPException(status_code=400, detail="Could not open video file")
+    return container
+
+
+def _video_properties(container) -> tuple:
+    """Return the first video stream with its fps, size, frame count and duration"""
+    stream = container.streams.video[0]
+    fps = float(stream.average_rate or 0)
+    if stream.duration is not None:
+        duration = float(stream.duration * stream.time_base)
+    elif container.duration is not None:
+        duration = container.duration / av.time_base
+    else:
+        duration = 0
+    frame_count = stream.frames or int(duration * fps)
+    return (
+        stream,
+        fps,
+        stream.codec_context.width,
+        stream.codec_context.height,
+        frame_count,
+        duration,
+    )
+
+
+@contextmanager
+def _mapped_upload(file: UploadFile):
+    """
+    Memory map a spooled upload so the decoder reads it in place.
+    Small uploads that are still held in memory are moved to their temporary
+    file first.
+    """
+    fileobj = file.file
+    fileno = fileobj.fileno()
+    fileobj.flush()
+    try:
+        mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Empty upload")
+
+    with mapped:
+        yield mapped
+
+
+# Receives (event, data) for streamed progress; may raise to stop processing
+EventCallback = Callable[[str, Dict[str, Any]], None]
+
+
+def _stream_info(
+    fps: float, width: int, height: int, frame_count: int, duration: float
+) -> Dict[str, Any]:
+    return {
+        "fps": round(fps, 3),
+        "width": width,
+        "height": height,
+        "frame_count": frame_count,
+        "duration": duration,
+    }
+
+
+def _progress(done: float, total: float) -> float:
+    """Percentage of done out of total, clamped to 0-100"""
+    return round(min(100.0, done / total * 100), 1) if total > 0 else 0.0
+
+
+def _predict(model, img, conf_threshold: float, client: Any, imgsz: int):
+    """
+    Run the model as upload work, behind any live frames. img may also be
+    a list of images, which are run as one batch.
+    """
+    return scheduler.run(
+        partial(
+            model.predict,
+            source=img,
+            imgsz=imgsz,
+            conf=conf_threshold,
+            verbose=False,
+        ),
+        Priority.UPLOAD,
+        client,
+        images=len(img) if isinstance(img, list) else 1,
+    )
+
+
+def _detect(
+    model,
+    img: np.ndarray,
+    conf_threshold: float,
+    client: Any,
+    tiled: bool,
+    imgsz: int,
+) -> np.ndarray:
+    """
+    Run detection on a decoded image and return boxes in its coordinates.
+    Tiled, the image is also sliced into overlapping tiles at native model
+    resolution so small objects survive, and the boxes of all tiles and of
+    the downscaled whole image are merged. Tiling asks for full quality, so
+    imgsz only applies to untiled images.
+    """
+    if tiled:
+        imgsz = SETTINGS["inference_size"]
+
+    letterbox = thread_letterbox(imgsz)
+    with time_stage("resize"), span("Letterbox"):
+        inference_img = letterbox(img)
+
+    if not tiled:
+        with span("model.predict"):
+            results = _predict(model, inference_img, conf_threshold, client, imgsz)
+        observe_prediction(results)
+        return letterbox.restore(extract_detections(results))
+
+    tiles, origins = make_tiles(
+        img, SETTINGS["tiling_tile_size"], SETTINGS["tiling_overlap"]
+    )
+    # The whole image still catches objects larger than a tile
+    images = [inference_img, *tiles]
+    batch_size = SETTINGS["tiling_batch_size"]
+
+    results = []
+    with span("model.predict"):
+        # One scheduler job per batch, so live frames can run in between
+        for start in range(0, len(images), batch_size):
+            results.extend(
+                _predict(
+                    model,
+                    images[start : start + batch_size],
+                    conf_threshold,
+                    client,
+                    imgsz,
+                )
+            )
+    observe_prediction(results)
+
+    per_image = [extract_detections([result]) for result in results]
+    per_image[0] = letterbox.restore(per_image[0])
+    origins = np.concatenate([np.zeros((1, 2), dtype=origins.dtype), origins])
+    logger.info(
+        "Tiled inference: %dx%d in %d tiles", img.shape[1], img.shape[0], len(tiles)
+    )
+    return merge_tiles(per_image, origins, SETTINGS["tiling_merge_threshold"])
+
+
+def detect_image(
+    data: bytes,
+    conf_threshold: float = None,
+    client: Any = None,
+    tiled: Optional[bool] = None,
+    version: Optional[ModelVersion] = None,
+    variant: Optional[Variant] = None,
+) -> tuple:
+    """
+    Run detection on encoded image bytes without producing an annotated copy.
+    Large JPEGs are decoded straight at reduced resolution unless they are
+    run in tiles; tiled is passed to use_tiling. version defaults to the
+    model version assigned to client, variant to one picked for the current
+    upload load.
+    """
     if conf_threshold is None:
         conf_threshold = SETTINGS["detection_confidence"]
 
-    img = cv2.imread(img_path)
+    with time_stage("decode"), span("cv2.imdecode"):
+        img, dimensions = decode_image(data, SETTINGS["inference_size"])
     if img is None:
         raise HTTPException(status_code=400, detail="Could not read image file")
 
-    img_height, img_width = img.shape[:2]
-
-    model = get_model()
-    results = model.predict(
-        source=img,
-        conf=conf_threshold,
-        verbose=False,
+    img_width, img_height = dimensions
+
+    tiled = use_tiling(img_width, img_height, tiled)
+    if tiled and img.shape[1] != img_width:
+        # Tiles need the full resolution pixels
+        with time_stage("decode"), span("cv2.imdecode"):
+            img, _ = decode_image(data)
+
+    variant = variant or select_variant(Priority.UPLOAD)
+    model = (version or registry.get(client, variant)).model
+    decoded_boxes = _detect(model, img, conf_threshold, client, tiled, variant.imgsz)
+    boxes = scale_detections(
+        decoded_boxes,
+        img_width / img.shape[1],
+        img_height / img.shape[0],
     )
+    detections = serialize_detections(boxes, class_names(model), img_width, img_height)
+    CascadeSession().refine(img, decoded_boxes, detections, Priority.UPLOAD, client)
 
-    detections = []
-
-    if results and len(results) > 0:
-        boxes = results[0].boxes.data.cpu().numpy()
-
-        for box in boxes:
-            x1, y1, x2, y2, conf, class_id = box
-            class_name = model.names[int(class_id)]
-
-            detections.append(
-                DetectionResult(
-                    x1=float(x1),
-                    y1=float(y1),
-                    x2=float(x2),
-                    y2=float(y2),
-                    confidence=float(conf),
-                    class_name=class_name,
-                    class_id=int(class_id),
-                    image_width=img_width,
-                    image_height=img_height,
-                )
+    return detections, img_width, img_height
+
+
+def detect_video(
+    video_source,
+    conf_threshold: float = None,
+    sample_interval: float = None,
+    on_event: Optional[EventCallback] = None,
+    client: Any = None,
+    version: Optional[ModelVersion] = None,
+    variant: Optional[Variant] = None,
+) -> tuple:
+    """
+    Run detection on sampled video frames without re-encoding anything.
+    Only sampled frames are converted, and long gaps between samples are
+    skipped by seeking. Returns the best detection per class, a per-frame
+    timeline, the duration and the frame size. on_event, if given, receives
+    a "start" event and then a "frame" event for each sampled frame.
+    version defaults to the model version assigned to client, variant to
+    one picked for the current upload load.
+    """
+    if conf_threshold is None:
+        conf_threshold = SETTINGS["detection_confidence"]
+
+    with _open_video(video_source) as container:
+        _, fps, frame_width, frame_height, frame_count, duration = _video_properties(
+            container
+        )
+
+        if sample_interval is None:
+            sample_interval = (
+                _sampling_step(int(fps), frame_count) / fps if fps > 0 else 0.25
             )
 
-            cv2.rectangle(img, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
-
-            label = f"{class_name} {conf:.2f}"
-            cv2.putText(
-                img,
-                label,
-                (int(x1), int(y1) - 10),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.5,
-                (0, 255, 0),
-                2,
+        logger.info(
+            f"Video detection: fps={fps:.2f}, total frames={frame_count}, sampling every {sample_interval:.2f}s"
+        )
+        if on_event:
+            on_event(
+                "start",
+                _stream_info(fps, frame_width, frame_height, frame_count, duration),
             )
 
-    cv2.imwrite(output_path, img)
+        variant = variant or select_variant(Priority.UPLOAD)
+        model = (version or registry.get(client, variant)).model
+        names = class_names(model)
+        letterbox = Letterbox(variant.imgsz)
+        width, height = letterbox.fit(frame_width, frame_height)
+        scale_x, scale_y = frame_width / width, frame_height / height
 
-    return detections
+        best_detections: Dict[int, np.ndarray] = {}
+        timeline = []
+        # Tracks objects across samples, so each is classified once
+        cascade = CascadeSession()
 
+        frames = sample_video_frames(
+            container, sample_interval, SETTINGS["seek_min_gap_seconds"]
+        )
+        while True:
+            with time_stage("decode"), span("av.decode"):
+                frame = next(frames, None)
+            if frame is None:
+                break
 
-def process_video(
-    video_path: str, output_path: str, conf_threshold: float = None
+            try:
+                with time_stage("decode"), span("VideoFrame.to_ndarray"):
+                    img = frame_to_bgr(frame, width, height)
+                with time_stage("resize"), span("Letterbox"):
+                    inference_img = letterbox(img)
+                with span("model.predict"):
+                    results = _predict(
+                        model, inference_img, conf_threshold, client, variant.imgsz
+                    )
+                observe_prediction(results)
+
+                view_detections = letterbox.restore(extract_detections(results))
+                detections = scale_detections(view_detections, scale_x, scale_y)
+                if len(detections) > 0:
+                    _update_best_detections(best_detections, detections)
+
+                serialized = serialize_detections(
+                    detections, names, frame_width, frame_height
+                )
+                # Crops come from the downscaled frame the model ran on
+                cascade.refine(
+                    img, view_detections, serialized, Priority.UPLOAD, client
+                )
+                entry = {
+                    "frame_index": round(frame.time * fps),
+                    "timestamp": round(frame.time, 3),
+                    "detections": serialized,
+                }
+                timeline.append(entry)
+            except Exception as e:
+                logger.error("Error processing video frame at %.2fs: %s", frame.time, e)
+                continue
+
+            if on_event:
+                on_event(
+                    "frame",
+                    {**entry, "progress": _progress(frame.time, duration)},
+                )
+
+    logger.info(
+        f"Video detection complete. Processed {len(timeline)} frames. Found {len(best_detections)} unique classes."
+    )
+
+    return (
+        _serialize_best(best_detections, names, frame_width, frame_height),
+        timeline,
+        duration,
+        frame_width,
+        frame_height,
+    )
+
+
+def process_image(
+    data: bytes,
+    ext: str,
+    conf_threshold: float = None,
+    client: Any = None,
+    tiled: Optional[bool] = None,
+    version: Optional[ModelVersion] = None,
+    variant: Optional[Variant] = None,
 ) -> tuple:
-    """Process a video with YOLO object detection"""
+    """
+    Process encoded image bytes with YOLO object detection.
+    Returns the detections, the image size and the annotated image encoded
+    in the format given by ext. tiled is passed to use_tiling. version
+    defaults to the model version assigned to client, variant to one
+    picked for the current upload load.
+    """
     if conf_threshold is None:
         conf_threshold = SETTINGS["detection_confidence"]
 
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        raise HTTPException(status_code=400, detail="Could not open video file")
+    with time_stage("decode"), span("cv2.imdecode"):
+        img, _ = decode_image(data)
+    if img is None:
+        raise HTTPException(status_code=400, detail="Could not read image file")
 
-    fps = int(cap.get(cv2.CAP_PROP_FPS))
-    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    duration = frame_count / fps if fps > 0 else 0
+    img_height, img_width = img.shape[:2]
 
-    frames_per_second = max(1, int(fps / 4))
-    min_total_frames = 15
+    # The annotated output is drawn at full resolution, so only the model
+    # input is downscaled
+    variant = variant or select_variant(Priority.UPLOAD)
+    model = (version or registry.get(client, variant)).model
+    boxes = _detect(
+        model,
+        img,
+        conf_threshold,
+        client,
+        use_tiling(img_width, img_height, tiled),
+        variant.imgsz,
+    )
+    names = class_names(model)
+    detections = serialize_detections(boxes, names, img_width, img_height)
+    # Crops are taken before the boxes are drawn over them
+    CascadeSession().refine(img, boxes, detections, Priority.UPLOAD, client)
 
-    if frame_count < min_total_frames * frames_per_second:
-        # For very short videos, process more frames
-        frames_per_second = max(1, int(frame_count / min_total_frames))
+    with time_stage("draw"):
+        draw_detections(img, boxes, names)
 
-    logger.info(
-        f"Video processing: fps={fps}, total frames={frame_count}, processing 1 frame every {frames_per_second} frames"
-    )
+    with time_stage("encode"), span("cv2.imencode"):
+        try:
+            ok, encoded = cv2.imencode(ext, img)
+        except cv2.error:
+            ok = False
+    if not ok:
+        raise HTTPException(status_code=400, detail=f"Could not encode image as {ext}")
 
-    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-    out = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
+    return detections, img_width, img_height, encoded.tobytes()
 
-    model = get_model()
 
-    all_detections = {}
+def process_video(
+    video_source,
+    output_path: str,
+    conf_threshold: float = None,
+    codec: str = None,
+    preset: str = None,
+    crf: int = None,
+    on_event: Optional[EventCallback] = None,
+    client: Any = None,
+    version: Optional[ModelVersion] = None,
+    variant: Optional[Variant] = None,
+) -> tuple:
+    """
+    Process a video (a path or file-like object) with YOLO object detection,
+    writing an MP4 to output_path. on_event, if given, receives a "start"
+    event and then a "frame" event with the detections of each processed
+    frame as soon as it is done. version defaults to the model version
+    assigned to client, variant to one picked for the current upload load.
+    """
+    if conf_threshold is None:
+        conf_threshold = SETTINGS["detection_confidence"]
 
-    frame_detections = {}
+    container = _open_video(video_source)
+    stream, source_fps, frame_width, frame_height, frame_count, duration = (
+        _video_properties(container)
+    )
+    stream.thread_type = "AUTO"
+    fps = int(source_fps)
 
-    frame_idx = 0
-    processed_frames = 0
+    frames_per_second = _sampling_step(fps, frame_count)
 
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
+    logger.info(
+        f"Video processing: fps={fps}, total frames={frame_count}, processing 1 frame every {frames_per_second} frames"
+    )
+    if on_event:
+        on_event(
+            "start",
+            _stream_info(source_fps, frame_width, frame_height, frame_count, duration),
+        )
 
-        # Only run detection on every nth frame to improve performance
-        should_process = frame_idx % frames_per_second == 0
+    out = VideoEncoder(
+        output_path, frame_width, frame_height, source_fps, codec, preset, crf
+    )
 
-        if should_process:
-            processed_frames += 1
-            try:
-                results = model.predict(
-                    source=frame, conf=conf_threshold, verbose=False
-                )
+    variant = variant or select_variant(Priority.UPLOAD)
+    model = (version or registry.get(client, variant)).model
+    names = class_names(model)
+    letterbox = Letterbox(variant.imgsz)
 
-                if results and len(results) > 0:
-                    detections = results[0].boxes.data.cpu().numpy()
-
-                    frame_classes = set()  # Track classes detected in this frame
-
-                    for detection in detections:
-                        x1, y1, x2, y2, conf, class_id = detection
-                        class_name = model.names[int(class_id)]
-                        frame_classes.add(class_name)
-
-                        if (
-                            class_name not in all_detections
-                            or conf > all_detections[class_name].confidence
-                        ):
-                            all_detections[class_name] = DetectionResult(
-                                x1=float(x1),
-                                y1=float(y1),
-                                x2=float(x2),
-                                y2=float(y2),
-                                confidence=float(conf),
-                                class_id=int(class_id),
-                                class_name=class_name,
-                                image_width=frame_width,
-                                image_height=frame_height,
-                            )
-
-                    if frame_classes:
-                        has_detections = True
-                        frame_detections[frame_idx] = frame_classes
-
-                        for detection in detections:
-                            x1, y1, x2, y2, conf, class_id = detection
-                            class_name = model.names[int(class_id)]
-
-                            cv2.rectangle(
-                                frame,
-                                (int(x1), int(y1)),
-                                (int(x2), int(y2)),
-                                (0, 255, 0),
-                                2,
-                            )
-
-                            label = f"{class_name} {conf:.2f}"
-                            cv2.putText(
-                                frame,
-                                label,
-                                (int(x1), int(y1) - 10),
-                                cv2.FONT_HERSHEY_SIMPLEX,
-                                0.5,
-                                (0, 255, 0),
-                                2,
-                            )
+    # Highest confidence detection row seen so far for each class id
+    best_detections: Dict[int, np.ndarray] = {}
 
-            except Exception as e:
-                logger.error(f"Error processing video frame {frame_idx}: {e}")
-
-        elif frame_detections:
-            nearest_frame = None
-            min_distance = frames_per_second // 2
-
-            for processed_frame_idx in frame_detections:
-                distance = abs(processed_frame_idx - frame_idx)
-                if distance < min_distance:
-                    nearest_frame = processed_frame_idx
-                    min_distance = distance
-
-            if nearest_frame is not None:
-                has_detections = True
-
-                for class_name in frame_detections[nearest_frame]:
-                    if class_name in all_detections:
-                        detection = all_detections[class_name]
-
-                        cv2.rectangle(
-                            frame,
-                            (int(detection.x1), int(detection.y1)),
-                            (int(detection.x2), int(detection.y2)),
-                            (0, 255, 0),
-                            2,
-                        )
+    # Class ids found on the most recent processed frame with detections
+    last_detection_frame = None
+    last_detection_classes = []
+    # Labels the frame events of streamed uploads; the drawn boxes keep
+    # the detector's class names, like the held boxes between samples
+    cascade = CascadeSession() if on_event else None
+
+    with container, out:
+        frame_idx = 0
+        processed_frames = 0
+        frames = container.decode(stream)
 
-                        label = f"{detection.class_name} {detection.confidence:.2f}"
-                        cv2.putText(
-                            frame,
-                            label,
-                            (int(detection.x1), int(detection.y1) - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX,
-                            0.5,
-                            (0, 255, 0),
-                            2,
+        while True:
+            try:
+                with time_stage("decode"), span("av.decode"):
+                    video_frame = next(frames, None)
+            except av.FFmpegError as e:
+                logger.error("Error decoding video frame %d: %s", frame_idx, e)
+                break
+            if video_frame is None:
+                break
+
+            with time_stage("decode"), span("VideoFrame.to_ndarray"):
+                frame = video_frame.to_ndarray(format="bgr24")
+
+            # Only run detection on every nth frame to improve performance
+            should_process = frame_idx % frames_per_second == 0
+
+            if should_process:
+                processed_frames += 1
+                frame_event = None
+                try:
+                    with time_stage("resize"), span("Letterbox"):
+                        inference_img = letterbox(frame)
+                    with span("model.predict"):
+                        results = _predict(
+                            model, inference_img, conf_threshold, client, variant.imgsz
                         )
+                    observe_prediction(results)
 
-        out.write(frame)
-        frame_idx += 1
+                    detections = letterbox.restore(extract_detections(results))
 
-        if frame_idx % 100 == 0:
-            progress = (frame_idx / frame_count) * 100 if frame_count > 0 else 0
-            logger.info(
-                f"Video processing progress: {progress:.1f}% ({frame_idx}/{frame_count})"
-            )
+                    if on_event:
+                        serialized = serialize_detections(
+                            detections, names, frame_width, frame_height
+                        )
+                        # Crops are taken before the boxes are drawn over them
+                        cascade.refine(
+                            frame, detections, serialized, Priority.UPLOAD, client
+                        )
+                        frame_event = {
+                            "frame_index": frame_idx,
+                            "timestamp": round(video_frame.time or 0.0, 3),
+                            "detections": serialized,
+                            "progress": _progress(frame_idx + 1, frame_count),
+                        }
+
+                    if len(detections) > 0:
+                        last_detection_frame = frame_idx
+                        last_detection_classes = _update_best_detections(
+                            best_detections, detections
+                        )
 
-    cap.release()
-    out.release()
+                        with time_stage("draw"):
+                            draw_detections(frame, detections, names)
+                except Exception as e:
+                    logger.error("Error processing video frame %d: %s", frame_idx, e)
+
+                # Outside the try so a callback can abort processing
+                if frame_event:
+                    on_event("frame", frame_event)
+
+            elif (
+                last_detection_frame is not None
+                and frame_idx - last_detection_frame < frames_per_second // 2
+            ):
+                # Frames are read in order, so the nearest processed frame is
+                # always the most recent one; hold its best boxes on screen
+                held = np.stack([best_detections[c] for c in last_detection_classes])
+                with time_stage("draw"):
+                    draw_detections(frame, held, names)
+
+            with time_stage("encode"), span("VideoEncoder.write"):
+                out.write(frame)
+            frame_idx += 1
+
+            if frame_idx % 100 == 0:
+                progress = (frame_idx / frame_count) * 100 if frame_count > 0 else 0
+                logger.info(
+                    "Video processing progress: %.1f%% (%d/%d)",
+                    progress,
+                    frame_idx,
+                    frame_count,
+                )
 
     logger.info(
-        f"Video processing complete. Processed {processed_frames} frames. Found {len(all_detections)} unique classes."
+        f"Video processing complete. Processed {processed_frames} frames. Found {len(best_detections)} unique classes."
     )
 
-    detections_list = list(all_detections.values())
+    detections_list = _serialize_best(best_detections, names, frame_width, frame_height)
 
     return detections_list, duration, frame_width, frame_height
 
 
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png", ".bmp"]
+VIDEO_EXTENSIONS = [".mp4", ".avi", ".mov", ".mkv"]
+
+
+def _validate_encoder_options(codec: Optional[str], preset: Optional[str]) -> None:
+    if codec is not None and codec not in SUPPORTED_CODECS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported codec. Choose one of: {', '.join(SUPPORTED_CODECS)}",
+        )
+    if preset is not None and preset not in PRESETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported preset. Choose one of: {', '.join(PRESETS)}",
+        )
+
+
 @router.post("/upload", response_model=ProcessingResponse)
-async def upload_file(file: UploadFile = File(...), confidence: float = Form(None)):
-    """Upload an image or video file, process it with YOLO detection, and return the metadata"""
+async def upload_file(
+    request: Request,
+    file: UploadFile = File(...),
+    confidence: float = Form(None),
+    codec: str = Form(None),
+    preset: str = Form(None),
+    crf: int = Form(None, ge=0, le=51),
+    detections_only: bool = Form(False),
+    sample_interval: float = Form(None, gt=0),
+    tiled: bool = Form(None),
+    quality: str = Form(None),
+):
+    """
+    Upload an image or video file, process it with YOLO detection, and return the metadata.
+    With detections_only, no annotated file is written and videos also return
+    a per-frame timeline sampled every sample_interval seconds. tiled forces
+    tiled inference on or off for images; by default large images are tiled.
+    quality names the best model variant to run at.
+    """
     if confidence is None:
         confidence = SETTINGS["detection_confidence"]
 
+    _validate_encoder_options(codec, preset)
+
     logger.info(f"Received file upload: {file.filename} (confidence: {confidence})")
 
     file_id = str(uuid.uuid4())
     file_ext = os.path.splitext(file.filename)[1].lower()
+    # Uploads from the same client share one fair queueing slot
+    client = request.client.host if request.client else None
 
-    image_extensions = [".jpg", ".jpeg", ".png", ".bmp"]
-    video_extensions = [".mp4", ".avi", ".mov", ".mkv"]
-
-    is_image = file_ext in image_extensions
-    is_video = file_ext in video_extensions
+    is_image = file_ext in IMAGE_EXTENSIONS
+    is_video = file_ext in VIDEO_EXTENSIONS
 
     if not (is_image or is_video):
         raise HTTPException(
@@ -299,26 +710,58 @@ async def upload_file(file: UploadFile = File(...), confidence: float = Form(Non
             detail="Unsupported file type. Please upload an image (jpg, png) or video (mp4, avi, mov)",
         )
 
-    upload_path = os.path.join(UPLOAD_DIR, f"{file_id}{file_ext}")
-    output_path = os.path.join(PROCESSED_DIR, f"{file_id}_processed{file_ext}")
+    # Processed videos are always re-encoded to MP4 on disk; annotated
+    # images are kept in the artifact store
+    output_path = (
+        None
+        if detections_only or is_image
+        else os.path.join(PROCESSED_DIR, f"{file_id}_processed.mp4")
+    )
 
     try:
-        with open(upload_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
-        logger.error(f"Error saving uploaded file: {e}")
-        raise HTTPException(status_code=500, detail=f"Error saving file: {str(e)}")
-    finally:
+        admission.begin_upload(client)
+    except Rejected as e:
+        logger.warning(f"Rejected upload from {client}: {e.reason}")
         await file.close()
+        raise e.http_exception()
 
     try:
+        # Resolved once so the whole upload runs on, and reports, one
+        # version and variant
+        variant = select_variant(Priority.UPLOAD, quality)
+        version = registry.get(client, variant)
         logger.info(f"Processing {'image' if is_image else 'video'}: {file.filename}")
 
         if is_image:
-            detections = process_image(upload_path, output_path, confidence)
-
-            img = cv2.imread(output_path)
-            height, width = img.shape[:2]
+            # Decoded straight from the spooled upload, never written to disk
+            data = await file.read()
+            if not data:
+                raise HTTPException(status_code=400, detail="Empty upload")
+            # Processing runs on a worker thread so the event loop keeps
+            # serving live streams while the model is busy with uploads
+            if detections_only:
+                detections, width, height = await asyncio.to_thread(
+                    detect_image, data, confidence, client, tiled, version, variant
+                )
+            else:
+                detections, width, height, encoded = await asyncio.to_thread(
+                    process_image,
+                    data,
+                    file_ext,
+                    confidence,
+                    client,
+                    tiled,
+                    version,
+                    variant,
+                )
+                # Storing may spill or evict files, so keep it off the event loop
+                await asyncio.to_thread(
+                    artifact_store.put,
+                    file_id,
+                    encoded,
+                    CONTENT_TYPES[file_ext],
+                    f"processed{file_ext}",
+                )
 
             response = ProcessingResponse(
                 detections=detections,
@@ -326,10 +769,56 @@ async def upload_file(file: UploadFile = File(...), confidence: float = Form(Non
                 width=width,
                 height=height,
                 is_video=False,
+                has_output=not detections_only,
+                model_version=version.version,
+                variant=variant.name,
+            )
+        elif detections_only:
+            with _mapped_upload(file) as source:
+                detections, timeline, duration, width, height = await asyncio.to_thread(
+                    detect_video,
+                    source,
+                    confidence,
+                    sample_interval,
+                    None,
+                    client,
+                    version,
+                    variant,
+                )
+
+            response = ProcessingResponse(
+                detections=detections,
+                file_id=file_id,
+                width=width,
+                height=height,
+                is_video=True,
+                duration=duration,
+                has_output=False,
+                timeline=timeline,
+                model_version=version.version,
+                variant=variant.name,
             )
         else:
-            detections, duration, width, height = process_video(
-                upload_path, output_path, confidence
+            with _mapped_upload(file) as source:
+                detections, duration, width, height = await asyncio.to_thread(
+                    process_video,
+                    source,
+                    output_path,
+                    confidence,
+                    codec,
+                    preset,
+                    crf,
+                    None,
+                    client,
+                    version,
+                    variant,
+                )
+            await asyncio.to_thread(
+                artifact_store.add_file,
+                file_id,
+                output_path,
+                CONTENT_TYPES[".mp4"],
+                "processed.mp4",
             )
 
             response = ProcessingResponse(
@@ -339,93 +828,337 @@ async def upload_file(file: UploadFile = File(...), confidence: float = Form(Non
                 height=height,
                 is_video=True,
                 duration=duration,
+                model_version=version.version,
+                variant=variant.name,
             )
 
         # Log detection results
         class_counts = {}
         for det in detections:
-            class_name = det.class_name
+            class_name = det["class_name"]
             class_counts[class_name] = class_counts.get(class_name, 0) + 1
 
         logger.info(f"File processed successfully. Detected classes: {class_counts}")
 
-        try:
-            if os.path.exists(upload_path):
-                os.remove(upload_path)
-        except Exception as e:
-            logger.warning(f"Could not remove uploaded file {upload_path}: {e}")
-
         return response
 
     except Exception as e:
         logger.error(f"Error processing file: {e}")
-        for path in [upload_path, output_path]:
-            try:
-                if os.path.exists(path):
-                    os.remove(path)
-            except Exception:
-                pass
+        try:
+            if output_path and os.path.exists(output_path):
+                os.remove(output_path)
+        except Exception:
+            pass
 
+        if isinstance(e, HTTPException):
+            raise
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
+    finally:
+        admission.end_upload(client)
+        await file.close()
 
 
-@router.get("/download/{file_id}")
-async def download_processed_file(file_id: str):
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class StreamClosed(Exception):
+    """Raised from an event callback once the streaming client has gone away"""
+
+
+# Keeps streaming workers referenced until they finish
+_stream_workers = set()
+
+
+@router.post("/upload/stream")
+async def upload_file_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    confidence: float = Form(None),
+    codec: str = Form(None),
+    preset: str = Form(None),
+    crf: int = Form(None, ge=0, le=51),
+    detections_only: bool = Form(False),
+    sample_interval: float = Form(None, gt=0),
+    quality: str = Form(None),
+):
+    """
+    Upload a video and stream results as server-sent events while it is
+    processed: a "start" event with the video metadata, a "frame" event
+    with detections and progress for every processed frame, and finally a
+    "complete" event with the same body as /upload (or an "error" event).
+    """
+    if confidence is None:
+        confidence = SETTINGS["detection_confidence"]
+
+    _validate_encoder_options(codec, preset)
+
+    file_ext = os.path.splitext(file.filename)[1].lower()
+    if file_ext not in VIDEO_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail="Streaming is only supported for videos (mp4, avi, mov, mkv)",
+        )
+
+    logger.info(
+        f"Received streaming upload: {file.filename} (confidence: {confidence})"
+    )
+
+    file_id = str(uuid.uuid4())
+    client = request.client.host if request.client else None
+    output_path = (
+        None
+        if detections_only
+        else os.path.join(PROCESSED_DIR, f"{file_id}_processed.mp4")
+    )
+
+    # The mapping stays valid after FastAPI closes the upload
+    mapping = ExitStack()
+    source = mapping.enter_context(_mapped_upload(file))
+
+    try:
+        admission.begin_upload(client)
+    except Rejected as e:
+        logger.warning(f"Rejected streaming upload from {client}: {e.reason}")
+        mapping.close()
+        raise e.http_exception()
+
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    closed = threading.Event()
+
+    def emit(event: Optional[str], data: Optional[Dict[str, Any]] = None) -> None:
+        loop.call_soon_threadsafe(events.put_nowait, (event, data))
+
+    def on_event(event: str, data: Dict[str, Any]) -> None:
+        if closed.is_set():
+            raise StreamClosed()
+        emit(event, data)
+
+    def run() -> None:
+        try:
+            with mapping:
+                # Resolved once so the whole upload runs on, and reports,
+                # one version and variant
+                variant = select_variant(Priority.UPLOAD, quality)
+                version = registry.get(client, variant)
+                if detections_only:
+                    detections, _, duration, width, height = detect_video(
+                        source,
+                        confidence,
+                        sample_interval,
+                        on_event,
+                        client,
+                        version,
+                        variant,
+                    )
+                else:
+                    detections, duration, width, height = process_video(
+                        source,
+                        output_path,
+                        confidence,
+                        codec,
+                        preset,
+                        crf,
+                        on_event,
+                        client,
+                        version,
+                        variant,
+                    )
+                    artifact_store.add_file(
+                        file_id, output_path, CONTENT_TYPES[".mp4"], "processed.mp4"
+                    )
+
+            response = ProcessingResponse(
+                detections=detections,
+                file_id=file_id,
+                width=width,
+                height=height,
+                is_video=True,
+                duration=duration,
+                has_output=not detections_only,
+                model_version=version.version,
+                variant=variant.name,
+            )
+            emit("complete", response.model_dump())
+        except StreamClosed:
+            logger.info(f"Streaming client for {file_id} disconnected")
+        except Exception as e:
+            logger.error(f"Error processing streamed file: {e}")
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            emit("error", {"detail": detail})
+        finally:
+            admission.end_upload(client)
+            if output_path and artifact_store.get(file_id) is None:
+                try:
+                    os.remove(output_path)
+                except OSError:
+                    pass
+            emit(None)
+
+    worker = asyncio.create_task(asyncio.to_thread(run))
+    _stream_workers.add(worker)
+    worker.add_done_callback(_stream_workers.discard)
+
+    async def event_stream():
+        try:
+            yield _sse("upload", {"file_id": file_id})
+            while True:
+                event, data = await events.get()
+                if event is None:
+                    break
+                yield _sse(event, data)
+        finally:
+            # Stops the worker at its next event if the client went away
+            closed.set()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _parse_range(header: str, size: int) -> Optional[tuple]:
     """
-    Download the processed file directly
+    Parse a single "bytes=start-end" range into an inclusive (start, end).
+    Returns None for ranges that should be ignored (multiple ranges or
+    other units) and raises ValueError for unsatisfiable ones.
     """
-    for ext in [".jpg", ".jpeg", ".png", ".mp4", ".avi", ".mov"]:
-        file_path = os.path.join(PROCESSED_DIR, f"{file_id}_processed{ext}")
-        if os.path.exists(file_path):
-            logger.info(f"Serving file for download: {file_path}")
-
-            content_type = None
-            if ext in [".jpg", ".jpeg"]:
-                content_type = "image/jpeg"
-            elif ext == ".png":
-                content_type = "image/png"
-            elif ext == ".mp4":
-                content_type = "video/mp4"
-            elif ext == ".avi":
-                content_type = "video/x-msvideo"
-            elif ext == ".mov":
-                content_type = "video/quicktime"
-
-            return FileResponse(
-                path=file_path, media_type=content_type, filename=f"processed{ext}"
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    start, sep, end = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if start:
+            first = int(start)
+            last = int(end) if end else size - 1
+        else:
+            # Suffix range: the last n bytes
+            first = size - int(end)
+            last = size - 1
+    except ValueError:
+        return None
+
+    first = max(0, first)
+    last = min(last, size - 1)
+    if first > last or first >= size:
+        raise ValueError("Unsatisfiable range")
+    return first, last
+
+
+def _artifact_response(artifact: Artifact, request: Request) -> Response:
+    """
+    Serve an artifact with ETag validation and byte ranges.
+    Range requests on disk artifacts are handled by FileResponse.
+    """
+    headers = {
+        "ETag": artifact.etag,
+        "Last-Modified": formatdate(artifact.created, usegmt=True),
+        "Cache-Control": f"private, max-age={max(0, int(artifact.expires - time.time()))}",
+        "Accept-Ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (
+        if_none_match.strip() == "*"
+        or artifact.etag in (tag.strip() for tag in if_none_match.split(","))
+    ):
+        return Response(status_code=304, headers=headers)
+
+    # Read data before path: spilling sets the path before dropping data
+    data = artifact.data
+    if data is None:
+        return FileResponse(
+            path=artifact.path,
+            media_type=artifact.content_type,
+            filename=artifact.filename,
+            headers=headers,
+        )
+
+    headers["Content-Disposition"] = f'attachment; filename="{artifact.filename}"'
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range == artifact.etag):
+        try:
+            byte_range = _parse_range(range_header, artifact.size)
+        except ValueError:
+            return Response(
+                status_code=416,
+                headers={"Content-Range": f"bytes */{artifact.size}"},
             )
+        if byte_range is not None:
+            first, last = byte_range
+            headers["Content-Range"] = f"bytes {first}-{last}/{artifact.size}"
+            return Response(
+                content=data[first : last + 1],
+                status_code=206,
+                media_type=artifact.content_type,
+                headers=headers,
+            )
+
+    return Response(content=data, media_type=artifact.content_type, headers=headers)
+
+
+@router.get("/download/{file_id}")
+async def download_processed_file(file_id: str, request: Request):
+    """
+    Download the processed file directly, with support for conditional and
+    byte range requests so players can seek in processed videos
+    """
+    artifact = artifact_store.get(file_id)
+    if artifact is None or artifact.expires <= time.time():
+        raise HTTPException(status_code=404, detail="Processed file not found")
+
+    artifact_store.touch(file_id)
+    return _artifact_response(artifact, request)
 
-    raise HTTPException(status_code=404, detail="Processed file not found")
+
+# Upper bound on how long the expiry task sleeps when nothing is due
+EXPIRY_MAX_SLEEP = 300
 
 
 # Cleanup job to remove old processed files
 @router.on_event("startup")
 def start_cleanup_task():
-    """Start background task to clean up old files"""
-    import asyncio
+    """
+    Start background task that removes processed files as they expire.
+    It sleeps until the next expiry instead of polling, and all filesystem
+    work runs in a worker thread. It also expires idle client sessions at
+    least every session_sweep_seconds, which otherwise only happens as
+    sessions are used.
+    """
 
     async def cleanup_old_files():
+        # Index files processed before a restart
+        try:
+            loaded = await asyncio.to_thread(artifact_store.load_directory)
+            if loaded:
+                logger.info(f"Indexed {loaded} existing processed files")
+        except Exception as e:
+            logger.error(f"Error indexing processed files: {e}")
+
         while True:
             try:
-                current_time = time.time()
-                max_age = 3600  # 1 hour in seconds
-
-                for dir_path in [UPLOAD_DIR, PROCESSED_DIR]:
-                    for filename in os.listdir(dir_path):
-                        file_path = os.path.join(dir_path, filename)
-                        try:
-                            file_age = current_time - os.path.getmtime(file_path)
-
-                            if file_age > max_age:
-                                os.remove(file_path)
-                                logger.info(f"Removed old file: {file_path}")
-                        except Exception as e:
-                            logger.error(
-                                f"Error checking/removing file {file_path}: {e}"
-                            )
+                expired = await asyncio.to_thread(artifact_store.expire)
+                if expired:
+                    logger.info(f"Removed {expired} expired processed files")
             except Exception as e:
                 logger.error(f"Error in cleanup task: {e}")
+            sessions.sweep()
 
-            await asyncio.sleep(900)  # 15 minutes
+            next_expiry = artifact_store.next_expiry()
+            delay = (
+                EXPIRY_MAX_SLEEP
+                if next_expiry is None
+                else min(EXPIRY_MAX_SLEEP, max(0.0, next_expiry - time.time()))
+            )
+            delay = min(delay, SETTINGS["session_sweep_seconds"])
+            await asyncio.sleep(delay)
 
     asyncio.create_task(cleanup_old_files())
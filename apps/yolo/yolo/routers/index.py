@@ -1,4 +1,7 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from core.model import is_model_ready, get_model_info
 
 router = APIRouter()
 
@@ -7,3 +10,15 @@ router = APIRouter()
 async def index():
     """Root endpoint that confirms the API is running."""
     return {"message": "YOLO WebRTC API is running"}
+
+
+@router.get("/ready")
+async def ready():
+    """
+    Readiness endpoint for the load balancer.
+    Returns 503 until the model has been loaded and warmed up.
+    """
+    if not is_model_ready():
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+
+    return {"status": "ready", **get_model_info()}
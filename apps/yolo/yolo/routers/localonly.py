@@ -1,14 +1,32 @@
 import json
 import uuid
-import time
 import base64
-import numpy as np
-import cv2
+from typing import Dict
+from functools import partial
+
 from fastapi import APIRouter, WebSocket
 
-from core.model import get_model
-from models.detection import client_detections, last_logged_predictions
-from utils.logger import setup_logger
+from core.cascade import CascadeSession
+from core.model import registry, select_variant
+from core.postprocess import (
+    class_names,
+    class_confidences,
+    extract_detections,
+    scale_detections,
+    serialize_detections,
+)
+from core.preprocess import Letterbox, decode_image
+from core.scheduler import DeadlineExceeded, Priority, live_deadline, scheduler
+from models.detection import sessions
+from utils.admission import Rejected, admission
+from utils.logger import setup_logger, summarize_classes
+from utils.profiling import span
+from utils.metrics import (
+    time_stage,
+    observe_prediction,
+    FRAMES_PROCESSED,
+    FRAMES_DROPPED,
+)
 from config import SETTINGS
 
 logger = setup_logger()
@@ -24,15 +42,32 @@ async def localonly_websocket_detections(websocket: WebSocket):
     await websocket.accept()
     logger.info("LocalOnly WebSocket connection ACCEPTED")
 
+    client = websocket.client.host if websocket.client else None
+    try:
+        admission.open_connection(client)
+    except Rejected as e:
+        logger.warning("LocalOnly: Rejected connection from %s: %s", client, e.reason)
+        # 1013: try again later
+        await websocket.close(code=1013, reason=e.reason)
+        return
+
     # Generate unique client ID
     client_id = str(uuid.uuid4())
-    client_detections[client_id] = {"active": True, "detections": []}
+    session = sessions.open(client_id, "localonly")
 
-    logger.info(f"LocalOnly: Assigned client_id: {client_id}")
+    logger.info("LocalOnly: Assigned client_id: %s", client_id)
 
     # Send client ID to the frontend
     await websocket.send_json({"type": "client_id", "client_id": client_id})
 
+    # Frames from one client share a resolution, so the buffer of each
+    # variant input size is reused
+    letterboxes: Dict[int, Letterbox] = {}
+    # Tracks and classifier labels of this client's objects
+    cascade = CascadeSession()
+    # Frames in a row refused for exceeding the client's own rate
+    rate_limited = 0
+
     try:
         while True:
             message = await websocket.receive_text()
@@ -41,114 +76,142 @@ async def localonly_websocket_detections(websocket: WebSocket):
                 data = json.loads(message)
 
                 if data.get("type") == "video_frame":
+                    # Rejected before decoding so flooding stays cheap
+                    rejected = admission.admit_frame(client)
+                    if rejected:
+                        FRAMES_DROPPED.inc(track="localonly", reason=rejected)
+                        if rejected == "rate_limited":
+                            rate_limited += 1
+                        if rate_limited >= SETTINGS["admission_ws_violation_limit"]:
+                            logger.warning(
+                                "LocalOnly: Closing client %s, frame rate limit exceeded",
+                                client_id,
+                            )
+                            # 1008: policy violation
+                            await websocket.close(code=1008, reason="rate_limited")
+                            return
+                        # Every frame gets a reply, so clients can pair them
+                        await websocket.send_json(
+                            {"type": "dropped", "reason": rejected}
+                        )
+                        continue
+                    rate_limited = 0
+
                     frame_data_url = data.get("frame")
-                    header, encoded = frame_data_url.split(",", 1)
-                    binary = base64.b64decode(encoded)
-                    nparr = np.frombuffer(binary, np.uint8)
-                    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+                    with time_stage("decode"):
+                        header, encoded = frame_data_url.split(",", 1)
+                        binary = base64.b64decode(encoded)
+                        with span("cv2.imdecode"):
+                            img, dimensions = decode_image(
+                                binary, SETTINGS["inference_size"]
+                            )
 
                     if img is not None:
-                        img_height, img_width = img.shape[:2]
-
-                        model = get_model()
-                        results = model.predict(
-                            source=img,
-                            conf=SETTINGS["detection_confidence"],
-                            verbose=False,
-                        )
-
-                        detections = []
-                        current_classes = set()
-
-                        if results and len(results) > 0:
-                            boxes = results[0].boxes.data.cpu().numpy()
-
-                            should_log = False
-                            current_time = time.time()
-
-                            detected_classes = {}
-
-                            for box in boxes:
-                                x1, y1, x2, y2, conf, class_id = box
-                                class_name = model.names[int(class_id)]
-                                detected_classes[class_name] = conf
-                                current_classes.add(class_name)
-
-                                detections.append(
-                                    {
-                                        "x1": float(x1),
-                                        "y1": float(y1),
-                                        "x2": float(x2),
-                                        "y2": float(y2),
-                                        "confidence": float(conf),
-                                        "class_id": int(class_id),
-                                        "class_name": class_name,
-                                        "image_width": img_width,
-                                        "image_height": img_height,
-                                    }
-                                )
-
-                            client_last_logged = last_logged_predictions.setdefault(
-                                client_id, {}
+                        # Report boxes against the frame the client sent
+                        img_width, img_height = dimensions
+
+                        # The client may cap quality with a variant name
+                        variant = select_variant(Priority.LIVE, data.get("quality"))
+                        letterbox = letterboxes.get(variant.imgsz)
+                        if letterbox is None:
+                            letterbox = letterboxes[variant.imgsz] = Letterbox(
+                                variant.imgsz
                             )
+                        with time_stage("resize"), span("Letterbox"):
+                            inference_img = letterbox(img)
+
+                        entry = registry.get(client_id, variant)
+                        model = entry.model
+                        with span("model.predict"):
+                            results = await scheduler.infer(
+                                partial(
+                                    model.predict,
+                                    source=inference_img,
+                                    imgsz=variant.imgsz,
+                                    conf=SETTINGS["detection_confidence"],
+                                    verbose=False,
+                                ),
+                                Priority.LIVE,
+                                client=client_id,
+                                deadline=live_deadline(),
+                            )
+                        observe_prediction(results)
+                        FRAMES_PROCESSED.inc(track="localonly")
 
-                            previous_classes = set(client_last_logged.keys())
-                            if current_classes != previous_classes:
-                                should_log = True
-
-                            for class_name in current_classes:
-                                if (
-                                    class_name not in client_last_logged
-                                    or (current_time - client_last_logged[class_name])
-                                    > SETTINGS["log_interval"]
-                                ):
-                                    should_log = True
-                                    break
-
-                            # Log if needed
-                            if should_log and len(detected_classes) > 0:
-                                if len(detected_classes) > 0:
-                                    logger.info(
-                                        f"LocalOnly Client {client_id}: Found {len(detections)} detections: {', '.join([f'{c} ({v:.2f})' for c, v in detected_classes.items()])}"
-                                    )
-
-                                for class_name in current_classes:
-                                    client_last_logged[class_name] = current_time
-
-                            # Clear out classes that are no longer detected
-                            for class_name in list(client_last_logged.keys()):
-                                if class_name not in current_classes:
-                                    del client_last_logged[class_name]
+                        view_boxes = extract_detections(results)
+                        registry.shadow(
+                            inference_img, SETTINGS["detection_confidence"], view_boxes
+                        )
+                        decoded_boxes = letterbox.restore(view_boxes)
+                        boxes = scale_detections(
+                            decoded_boxes,
+                            img_width / img.shape[1],
+                            img_height / img.shape[0],
+                        )
+                        names = class_names(model)
+                        detections = serialize_detections(
+                            boxes, names, img_width, img_height
+                        )
+                        await cascade.refine_async(
+                            img, decoded_boxes, detections, Priority.LIVE, client_id
+                        )
 
+                        detected_classes = class_confidences(boxes, names)
                         # Store latest detections for this client
-                        client_detections[client_id]["detections"] = detections
+                        if sessions.update(
+                            session,
+                            boxes,
+                            names,
+                            img_width,
+                            img_height,
+                            detected_classes,
+                        ):
+                            logger.info(
+                                "LocalOnly Client %s: Found %d detections: %s",
+                                client_id,
+                                len(detections),
+                                summarize_classes(detected_classes),
+                                extra={
+                                    "client_id": client_id,
+                                    "classes": detected_classes,
+                                },
+                            )
 
                         await websocket.send_json(
-                            {"type": "detections", "data": detections}
+                            {
+                                "type": "detections",
+                                "data": detections,
+                                "model_version": entry.version,
+                                "variant": variant.name,
+                            }
                         )
                     else:
+                        FRAMES_DROPPED.inc(track="localonly", reason="decode_error")
                         logger.warning(
-                            f"LocalOnly: Failed to decode image for client {client_id}"
+                            "LocalOnly: Failed to decode image for client %s", client_id
                         )
 
                         await websocket.send_json({"type": "detections", "data": []})
+            except DeadlineExceeded:
+                # The client keeps its previous boxes until a newer frame
+                # gets through
+                FRAMES_DROPPED.inc(track="localonly", reason="deadline")
+                await websocket.send_json({"type": "dropped", "reason": "deadline"})
             except json.JSONDecodeError:
                 logger.error(
-                    f"LocalOnly: Failed to parse message from client {client_id}"
+                    "LocalOnly: Failed to parse message from client %s", client_id
                 )
             except Exception as e:
+                FRAMES_DROPPED.inc(track="localonly", reason="error")
                 logger.error(
-                    f"LocalOnly: Error processing frame from client {client_id}: {str(e)}"
+                    "LocalOnly: Error processing frame from client %s: %s", client_id, e
                 )
 
                 await websocket.send_json({"type": "detections", "data": []})
 
     except Exception as e:
-        logger.error(f"LocalOnly WebSocket error for client {client_id}: {e}")
+        logger.error("LocalOnly WebSocket error for client %s: %s", client_id, e)
     finally:
-        logger.info(f"LocalOnly WebSocket connection closed for client {client_id}")
-        if client_id in client_detections:
-            client_detections[client_id]["active"] = False
-            del client_detections[client_id]
-        if client_id in last_logged_predictions:
-            del last_logged_predictions[client_id]
+        logger.info("LocalOnly WebSocket connection closed for client %s", client_id)
+        admission.close_connection(client)
+        sessions.close(client_id)
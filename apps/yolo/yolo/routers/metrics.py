@@ -0,0 +1,34 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from core.scheduler import Priority, scheduler
+from models.detection import sessions
+from utils.artifacts import artifact_store
+from utils.metrics import (
+    REGISTRY,
+    WEBSOCKET_CLIENTS,
+    ARTIFACT_BYTES,
+    QUEUE_DEPTH,
+    SESSIONS,
+    SESSION_BYTES,
+)
+
+router = APIRouter()
+
+WEBSOCKET_CLIENTS.set_function(lambda: sessions.count("localonly"))
+for _kind in ("localonly", "client_drawing"):
+    SESSIONS.set_function(lambda kind=_kind: sessions.count(kind), kind=_kind)
+SESSION_BYTES.set_function(lambda: sessions.bytes)
+ARTIFACT_BYTES.set_function(lambda: artifact_store.memory_bytes, storage="memory")
+ARTIFACT_BYTES.set_function(lambda: artifact_store.disk_bytes, storage="disk")
+for _priority in Priority:
+    QUEUE_DEPTH.set_function(
+        lambda priority=_priority: scheduler.depth(priority),
+        queue=f"inference_{_priority.name.lower()}",
+    )
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Expose metrics in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
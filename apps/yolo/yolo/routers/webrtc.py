@@ -1,10 +1,18 @@
-from fastapi import APIRouter, Request
-from aiortc import RTCPeerConnection, RTCSessionDescription
+import uuid
+
+from fastapi import APIRouter, HTTPException, Request
+from aiortc import RTCSessionDescription
 from aiortc.contrib.media import MediaRelay
 
+from models.detection import sessions
 from tracks.yolo_track import YOLOVideoStreamTrack
 from tracks.client_track import ClientDrawingYOLOVideoStreamTrack
-from utils.webrtc_utils import peer_connections, pc_cleanup
+from utils.admission import Rejected
+from utils.webrtc_utils import (
+    cleanup_peer_connections,
+    open_peer_connection,
+    pc_cleanup,
+)
 from utils.logger import setup_logger
 
 logger = setup_logger()
@@ -12,6 +20,20 @@ logger = setup_logger()
 router = APIRouter()
 
 
+def _client_address(request: Request):
+    return request.client.host if request.client else None
+
+
+async def _negotiate(pc, offer: RTCSessionDescription) -> None:
+    """Answer an offer, releasing the connection's admission slot on failure."""
+    try:
+        await pc.setRemoteDescription(offer)
+        await pc.setLocalDescription(await pc.createAnswer())
+    except Exception:
+        await pc_cleanup(pc)
+        raise
+
+
 @router.post("/offer")
 async def offer(request: Request):
     """
@@ -19,9 +41,15 @@ async def offer(request: Request):
     """
     params = await request.json()
     offer = RTCSessionDescription(sdp=params["sdp"], type=params["type"])
+    # Optional model variant name to cap detection quality at
+    quality = params.get("quality")
+    client = _client_address(request)
 
-    pc = RTCPeerConnection()
-    peer_connections.add(pc)
+    try:
+        pc = open_peer_connection(client)
+    except Rejected as e:
+        logger.warning(f"Rejected offer from {client}: {e.reason}")
+        raise e.http_exception()
 
     @pc.on("connectionstatechange")
     async def on_connectionstatechange():
@@ -36,17 +64,14 @@ async def offer(request: Request):
         logger.info(f"Track {track.kind} received")
 
         if track.kind == "video":
-            yolo_track = YOLOVideoStreamTrack(relay.subscribe(track))
+            yolo_track = YOLOVideoStreamTrack(relay.subscribe(track), client, quality)
             pc.addTrack(yolo_track)
 
         @track.on("ended")
         async def on_ended():
             logger.info(f"Track {track.kind} ended")
 
-    await pc.setRemoteDescription(offer)
-    answer = await pc.createAnswer()
-    await pc.setLocalDescription(answer)
-
+    await _negotiate(pc, offer)
     return {"sdp": pc.localDescription.sdp, "type": pc.localDescription.type}
 
 
@@ -54,15 +79,22 @@ async def offer(request: Request):
 async def client_drawing_offer(request: Request):
     """
     Handle WebRTC offer with client-side drawing of detection boxes.
+    The client opens a "detections" data channel in its offer, and the
+    detections for each processed frame are sent over it.
     """
     params = await request.json()
     offer = RTCSessionDescription(sdp=params["sdp"], type=params["type"])
-    client_id = params.get("client_id")
+    client_id = params.get("client_id") or str(uuid.uuid4())
+    quality = params.get("quality")
+    client = _client_address(request)
 
     logger.info(f"Received client-drawing-offer with client_id: {client_id}")
 
-    pc = RTCPeerConnection()
-    peer_connections.add(pc)
+    try:
+        pc = open_peer_connection(client)
+    except Rejected as e:
+        logger.warning(f"Rejected client-drawing-offer from {client}: {e.reason}")
+        raise e.http_exception()
 
     @pc.on("connectionstatechange")
     async def on_connectionstatechange():
@@ -71,9 +103,23 @@ async def client_drawing_offer(request: Request):
             await pc_cleanup(pc)
 
     relay = MediaRelay()
+    # The track and the data channel can arrive in either order
+    yolo_track = None
+    channel = None
+
+    @pc.on("datachannel")
+    def on_datachannel(dc):
+        nonlocal channel
+        if dc.label != "detections":
+            return
+        logger.info(f"Client {client_id}: Detections data channel received")
+        channel = dc
+        if yolo_track is not None:
+            yolo_track.channel = dc
 
     @pc.on("track")
     def on_track(track):
+        nonlocal yolo_track
         logger.info(f"Client {client_id}: Track {track.kind} received")
 
         if track.kind == "video":
@@ -81,8 +127,9 @@ async def client_drawing_offer(request: Request):
                 f"Creating ClientDrawingYOLOVideoStreamTrack for client {client_id}"
             )
             yolo_track = ClientDrawingYOLOVideoStreamTrack(
-                relay.subscribe(track), client_id
+                relay.subscribe(track), client_id, client, quality
             )
+            yolo_track.channel = channel
             pc.addTrack(yolo_track)
             logger.info(f"Track added to peer connection for client {client_id}")
 
@@ -90,9 +137,7 @@ async def client_drawing_offer(request: Request):
         async def on_ended():
             logger.info(f"Client {client_id}: Track {track.kind} ended")
 
-    await pc.setRemoteDescription(offer)
-    answer = await pc.createAnswer()
-    await pc.setLocalDescription(answer)
+    await _negotiate(pc, offer)
 
     logger.info(f"Sending answer to client {client_id}")
     return {"sdp": pc.localDescription.sdp, "type": pc.localDescription.type}
@@ -104,4 +149,13 @@ async def get_detections(client_id: str):
     Optional endpoint to retrieve the latest detection results.
     This can be used if you want to handle drawing boxes on the client side.
     """
-    return {"error": "Detection retrieval by client ID not implemented yet"}
+    session = sessions.get(client_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown client")
+    return {"type": "detections", "data": session.detections()}
+
+
+@router.on_event("shutdown")
+async def on_shutdown():
+    """Close the peer connections this process holds on shutdown."""
+    await cleanup_peer_connections()
@@ -0,0 +1,131 @@
+"""
+Production server: loads and warms up the model once, then forks workers.
+
+    python -m serve --port 5005 --workers 2
+
+The parent binds the listening socket, imports the application and loads
+the weights before forking, so workers share them copy-on-write instead of
+loading their own copy. The parent never runs the model: each worker warms
+it up after the fork, as inference starts threads that a forked child would
+inherit in an unknown state. A worker that dies is replaced by a new fork
+that only has to warm up.
+
+Processed outputs are kept on disk, where every worker finds them. WebRTC
+sessions live in the worker that negotiated them, so more than one worker
+requires the webrtc router to be disabled (YOLO_ROUTERS). Metrics and admin
+changes apply to the worker that serves the request.
+"""
+
+import gc
+import os
+import sys
+import signal
+import socket
+import argparse
+
+import uvicorn
+
+from utils.logger import setup_logger
+from config import SETTINGS
+
+logger = setup_logger()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5005)
+    parser.add_argument("--workers", type=int, default=SETTINGS["serve_workers"])
+    return parser.parse_args(argv)
+
+
+def _bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _serve(app, sock: socket.socket, workers: int) -> None:
+    """Warm up and run one worker on the shared socket until it is told to stop."""
+    # uvicorn installs its own handlers; until then, not the parent's
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    # Already imported by the model; workers split the cores between them
+    # instead of each running a thread per core
+    import torch
+
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // workers))
+
+    from core.model import warmup_model
+
+    warmup_model()
+    config = uvicorn.Config(app, log_level="warning")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    workers = max(1, args.workers)
+    routers = [name.strip() for name in SETTINGS["routers"]]
+    if workers > 1 and "webrtc" in routers:
+        sys.exit(
+            "WebRTC sessions are kept per worker; remove webrtc from "
+            "YOLO_ROUTERS to run more than one worker"
+        )
+    # Read by the modules imported below, e.g. to keep outputs on disk
+    SETTINGS["serve_workers"] = workers
+    sock = _bind(args.host, args.port)
+
+    from main import app
+    from core.model import preload_model
+
+    info = preload_model()
+    logger.info(
+        f"Model {info['model_version']} loaded, starting {workers} workers "
+        f"on {args.host}:{args.port}"
+    )
+    # Keep the collector from writing to objects that already exist, which
+    # would copy the pages they are on into every worker
+    gc.freeze()
+
+    children = set()
+    stopping = False
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            _serve(app, sock, workers)
+            sys.exit(0)
+        children.add(pid)
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    for _ in range(workers):
+        spawn()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        pid, status = os.wait()
+        children.discard(pid)
+        if not stopping:
+            logger.warning(
+                f"Worker {pid} exited with code {os.waitstatus_to_exitcode(status)}, "
+                f"starting a new one"
+            )
+            spawn()
+
+    sock.close()
+    logger.info("All workers stopped")
+
+
+if __name__ == "__main__":
+    main()
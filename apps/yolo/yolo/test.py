@@ -2,6 +2,9 @@ from ultralytics import YOLO
 import cv2
 import os
 
+from core.postprocess import class_names, extract_detections
+from core.render import draw_detections
+
 model = YOLO(os.path.join(os.getcwd(), "best.pt"))
 
 
@@ -12,22 +15,7 @@ def image(path, out_path=None):
         print("Image not found")
 
     results = model.predict(source=img, save=False, conf=0.25)
-    detections = results[0].boxes.data.cpu().numpy()
-
-    for detection in detections:
-        x1, y1, x2, y2, conf, classname = detection
-        label = f"{model.names[int(classname)]} {conf:.2f}"
-
-        cv2.rectangle(img, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
-        cv2.putText(
-            img,
-            label,
-            (int(x1), int(y1) - 10),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.5,
-            (0, 255, 0),
-            2,
-        )
+    draw_detections(img, extract_detections(results), class_names(model))
 
     # cv2.imwrite(output_image_path, image)
     cv2.imshow("Detections", img)
@@ -51,20 +39,7 @@ def vid(video_path, output_path):
 
         results = model.predict(source=frame, save=False, save_txt=False, conf=0.25)
 
-        detections = results[0].boxes.data.cpu().numpy()
-        for detection in detections:
-            x1, y1, x2, y2, conf, cls = detection
-            label = f"{model.names[int(cls)]} {conf:.2f}"
-            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2)
-            cv2.putText(
-                frame,
-                label,
-                (int(x1), int(y1) - 10),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.5,
-                (0, 255, 0),
-                2,
-            )
+        draw_detections(frame, extract_detections(results), class_names(model))
 
         out.write(frame)
 
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Modules import each other relative to the app directory, as when the
+# server is started from it
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,38 @@
+import pytest
+
+from utils.admission import TokenBucket
+
+
+def test_token_bucket_starts_full_and_refills():
+    bucket = TokenBucket(rate=10.0, burst=5.0)
+    now = bucket.updated
+    assert all(bucket.try_acquire(now) for _ in range(5))
+    assert not bucket.try_acquire(now)
+
+    # One token every 100ms
+    assert bucket.retry_after(now) == pytest.approx(0.1)
+    assert not bucket.try_acquire(now + 0.05)
+    assert bucket.try_acquire(now + 0.1)
+
+
+def test_token_bucket_caps_at_burst():
+    bucket = TokenBucket(rate=10.0, burst=2.0)
+    now = bucket.updated + 60.0
+    assert bucket.try_acquire(now, 2.0)
+    assert not bucket.try_acquire(now, 1.0)
+
+
+def test_token_bucket_weighted_acquire():
+    bucket = TokenBucket(rate=1.0, burst=3.0)
+    now = bucket.updated
+    assert not bucket.try_acquire(now, 4.0)
+    # A failed acquire takes nothing
+    assert bucket.try_acquire(now, 3.0)
+    assert bucket.retry_after(now, 2.0) == pytest.approx(2.0)
+
+
+def test_token_bucket_without_rate():
+    bucket = TokenBucket(rate=0.0, burst=1.0)
+    now = bucket.updated
+    assert bucket.try_acquire(now)
+    assert not bucket.try_acquire(now + 3600.0)
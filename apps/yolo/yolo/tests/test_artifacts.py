@@ -0,0 +1,103 @@
+import os
+import time
+
+import pytest
+
+from utils.artifacts import ArtifactStore
+
+
+def _store(tmp_path, **overrides) -> ArtifactStore:
+    options = dict(memory_limit=1000, spill_size=500, disk_quota=10_000, ttl=3600.0)
+    options.update(overrides)
+    return ArtifactStore(str(tmp_path), **options)
+
+
+def _put(store: ArtifactStore, file_id: str, size: int):
+    return store.put(file_id, b"x" * size, "image/jpeg", "processed.jpg")
+
+
+def test_small_outputs_stay_in_memory(tmp_path):
+    store = _store(tmp_path)
+    artifact = _put(store, "a", 100)
+    assert artifact.data is not None and artifact.path is None
+    assert store.memory_bytes == 100 and store.disk_bytes == 0
+    assert os.listdir(tmp_path) == []
+
+
+def test_large_outputs_go_to_disk(tmp_path):
+    store = _store(tmp_path)
+    artifact = _put(store, "a", 600)
+    assert artifact.data is None
+    assert artifact.path == os.path.join(tmp_path, "a_processed.jpg")
+    assert os.path.getsize(artifact.path) == 600
+    # The file keeps the creation time, so the ETag survives a restart
+    assert os.stat(artifact.path).st_mtime == pytest.approx(artifact.created, abs=1e-3)
+    assert store.memory_bytes == 0 and store.disk_bytes == 600
+
+
+def test_memory_limit_spills_oldest(tmp_path):
+    store = _store(tmp_path)
+    for file_id in ("a", "b", "c"):
+        _put(store, file_id, 400)
+    assert store.get("a").path is not None
+    assert store.get("b").data is not None and store.get("c").data is not None
+    assert store.memory_bytes == 800 and store.disk_bytes == 400
+
+
+def test_disk_quota_evicts_least_recently_used(tmp_path):
+    store = _store(tmp_path, disk_quota=1500)
+    for file_id in ("a", "b"):
+        _put(store, file_id, 600)
+    store.touch("a")
+    _put(store, "c", 600)
+
+    assert store.get("b") is None
+    assert store.get("a") is not None and store.get("c") is not None
+    assert store.disk_bytes == 1200
+    assert sorted(os.listdir(tmp_path)) == ["a_processed.jpg", "c_processed.jpg"]
+
+
+def test_expiry_removes_artifacts_and_files(tmp_path):
+    store = _store(tmp_path, ttl=0.05)
+    _put(store, "a", 100)
+    _put(store, "b", 600)
+    assert store.next_expiry() <= time.time() + 0.05
+    assert store.expire() == 0
+
+    time.sleep(0.1)
+    assert store.expire() == 2
+    assert len(store) == 0 and store.next_expiry() is None
+    assert store.memory_bytes == 0 and store.disk_bytes == 0
+    assert os.listdir(tmp_path) == []
+
+
+def test_replacing_an_artifact_frees_the_old_one(tmp_path):
+    store = _store(tmp_path)
+    _put(store, "a", 600)
+    _put(store, "a", 100)
+    assert store.get("a").size == 100
+    assert store.memory_bytes == 100 and store.disk_bytes == 0
+    assert os.listdir(tmp_path) == []
+
+
+def test_load_directory_indexes_existing_files(tmp_path):
+    first = _store(tmp_path)
+    artifact = _put(first, "a", 600)
+    (tmp_path / "unrelated.txt").write_text("x")
+
+    second = _store(tmp_path)
+    assert second.load_directory() == 1
+    assert second.get("a").etag == artifact.etag
+
+
+def test_shared_stores_find_each_others_outputs(tmp_path):
+    first = _store(tmp_path, shared=True)
+    second = _store(tmp_path, shared=True)
+    artifact = _put(first, "a", 100)
+
+    # Shared stores keep everything on disk
+    assert first.memory_bytes == 0
+    found = second.get("a")
+    assert found is not None and found.etag == artifact.etag
+    assert second.get("missing") is None
+    assert second.get("../a") is None
@@ -0,0 +1,50 @@
+import pytest
+
+from routers.file_upload import _parse_range
+from utils.artifacts import Artifact
+
+
+def test_parse_range_forms():
+    assert _parse_range("bytes=0-99", 1000) == (0, 99)
+    assert _parse_range("bytes=900-", 1000) == (900, 999)
+    # Suffix ranges count from the end, past-the-end ends are clamped
+    assert _parse_range("bytes=-100", 1000) == (900, 999)
+    assert _parse_range("bytes=-5000", 1000) == (0, 999)
+    assert _parse_range("bytes=500-5000", 1000) == (500, 999)
+
+
+def test_parse_range_ignored():
+    assert _parse_range("items=0-1", 1000) is None
+    assert _parse_range("bytes=0-1,5-6", 1000) is None
+    assert _parse_range("bytes=abc-", 1000) is None
+    assert _parse_range("bytes=100", 1000) is None
+
+
+def test_parse_range_unsatisfiable():
+    for header in ("bytes=1000-", "bytes=500-100", "bytes=-0"):
+        with pytest.raises(ValueError):
+            _parse_range(header, 1000)
+
+
+def _artifact(**overrides) -> Artifact:
+    fields = dict(
+        file_id="abc",
+        content_type="image/jpeg",
+        filename="processed.jpg",
+        size=1000,
+        created=1700000000.0,
+        expires=1700003600.0,
+    )
+    fields.update(overrides)
+    return Artifact(**fields)
+
+
+def test_etag_identifies_content():
+    etag = _artifact().etag
+    assert etag.startswith('"') and etag.endswith('"')
+    assert _artifact().etag == etag
+    # Where the bytes are held does not matter
+    assert _artifact(path="/tmp/abc_processed.jpg").etag == etag
+    assert _artifact(size=1001).etag != etag
+    assert _artifact(created=1700000001.0).etag != etag
+    assert _artifact(file_id="abd").etag != etag
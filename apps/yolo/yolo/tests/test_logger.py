@@ -0,0 +1,31 @@
+from utils.logger import DetectionLogLimiter, summarize_classes
+
+
+def test_logs_when_classes_change():
+    limiter = DetectionLogLimiter(interval=10.0)
+    assert limiter.allow({"battery": 0.9}, now=0.0)
+    assert not limiter.allow({"battery": 0.8}, now=1.0)
+    assert limiter.allow({"battery": 0.8, "pcb": 0.5}, now=2.0)
+    assert limiter.allow({"pcb": 0.5}, now=3.0)
+
+
+def test_logs_again_after_interval():
+    limiter = DetectionLogLimiter(interval=10.0)
+    assert limiter.allow({"battery": 0.9}, now=0.0)
+    assert not limiter.allow({"battery": 0.9}, now=10.0)
+    assert limiter.allow({"battery": 0.9}, now=10.5)
+
+
+def test_empty_results_are_never_logged():
+    limiter = DetectionLogLimiter(interval=10.0)
+    assert not limiter.allow({}, now=0.0)
+    assert limiter.allow({"battery": 0.9}, now=1.0)
+    assert not limiter.allow({}, now=2.0)
+    # The class was forgotten while nothing was detected
+    assert limiter.allow({"battery": 0.9}, now=3.0)
+
+
+def test_summarize_classes():
+    assert summarize_classes({"Battery": 0.912, "PCB": 0.55}) == (
+        "Battery (0.91), PCB (0.55)"
+    )
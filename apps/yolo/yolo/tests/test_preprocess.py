@@ -0,0 +1,77 @@
+import io
+from fractions import Fraction
+
+import numpy as np
+from av import VideoFrame
+from PIL import Image
+
+from core.preprocess import FrameCanvas, decode_image, jpeg_dimensions
+
+# EXIF orientation tag
+_ORIENTATION = 0x0112
+
+
+def _jpeg(width: int, height: int, orientation: int = 1) -> bytes:
+    exif = Image.Exif()
+    exif[_ORIENTATION] = orientation
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), (40, 120, 200)).save(
+        out, format="JPEG", exif=exif.tobytes()
+    )
+    return out.getvalue()
+
+
+def test_jpeg_dimensions_reads_header():
+    assert jpeg_dimensions(_jpeg(400, 300)) == (400, 300)
+    assert jpeg_dimensions(b"not a jpeg") is None
+
+
+def test_reduced_decode_reports_original_size():
+    img, dimensions = decode_image(_jpeg(4000, 3000), target_size=640)
+    assert img.shape[:2] == (750, 1000)
+    assert dimensions == (4000, 3000)
+
+
+def test_reduced_decode_follows_exif_rotation():
+    for orientation in (6, 8):
+        img, dimensions = decode_image(_jpeg(4000, 3000, orientation), 640)
+        assert img.shape[:2] == (1000, 750)
+        assert dimensions == (3000, 4000)
+
+
+def test_full_decode_follows_exif_rotation():
+    img, dimensions = decode_image(_jpeg(400, 300, 6))
+    assert img.shape[:2] == (400, 300)
+    assert dimensions == (300, 400)
+
+
+def test_undecodable_data():
+    assert decode_image(b"\xff\xd8\xff\xc0" + bytes(20), 640) == (None, None)
+    assert decode_image(np.zeros(10, np.uint8).tobytes()) == (None, None)
+    assert decode_image(b"") == (None, None)
+    assert decode_image(b"", 640) == (None, None)
+
+
+def test_frame_canvas_reuses_its_buffer():
+    rng = np.random.default_rng(0)
+    img = rng.integers(0, 256, (90, 160, 3), dtype=np.uint8)
+    frame = VideoFrame.from_ndarray(img, format="bgr24").reformat(format="yuv420p")
+    frame.pts = 3000
+    frame.time_base = Fraction(1, 90000)
+
+    canvas = FrameCanvas()
+    buffer = canvas.draw(frame)
+    expected = frame.to_ndarray(format="bgr24").astype(int)
+    assert np.abs(buffer.astype(int) - expected).mean() < 3
+    assert canvas.draw(frame) is buffer
+
+    buffer[:10, :10] = (0, 255, 0)
+    out = canvas.frame(frame)
+    assert out.pts == 3000
+    assert (out.to_ndarray()[:10, :10] == (0, 255, 0)).all()
+
+
+def test_frame_canvas_converts_other_formats():
+    img = np.full((45, 81, 3), (10, 20, 30), dtype=np.uint8)
+    frame = VideoFrame.from_ndarray(img, format="bgr24")
+    assert (FrameCanvas().draw(frame) == img).all()
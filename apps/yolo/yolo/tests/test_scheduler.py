@@ -0,0 +1,85 @@
+import time
+import threading
+
+import pytest
+
+from core.scheduler import DeadlineExceeded, InferenceScheduler, Priority
+
+
+def _blocked_scheduler():
+    """A one worker scheduler whose worker is busy until the event is set."""
+    scheduler = InferenceScheduler(1, {})
+    release = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    blocker = scheduler.submit(block, Priority.BATCH)
+    assert started.wait(5)
+    return scheduler, release, blocker
+
+
+def _run_in_order(scheduler, release, jobs):
+    order = []
+    futures = [
+        scheduler.submit(lambda name=name: order.append(name), priority, client)
+        for name, priority, client in jobs
+    ]
+    release.set()
+    for future in futures:
+        future.result(5)
+    return order
+
+
+def test_more_urgent_classes_run_first():
+    scheduler, release, _ = _blocked_scheduler()
+    order = _run_in_order(
+        scheduler,
+        release,
+        [
+            ("batch", Priority.BATCH, None),
+            ("upload", Priority.UPLOAD, None),
+            ("live", Priority.LIVE, None),
+        ],
+    )
+    assert order == ["live", "upload", "batch"]
+
+
+def test_clients_share_a_class_fairly():
+    scheduler, release, _ = _blocked_scheduler()
+    jobs = [(f"a{i}", Priority.UPLOAD, "a") for i in range(3)]
+    jobs.append(("b0", Priority.UPLOAD, "b"))
+    order = _run_in_order(scheduler, release, jobs)
+    # b's single job does not wait behind all of a's
+    assert order == ["a0", "b0", "a1", "a2"]
+
+
+def test_expired_jobs_are_dropped():
+    scheduler, release, _ = _blocked_scheduler()
+    ran = []
+    expired = scheduler.submit(
+        lambda: ran.append("expired"),
+        Priority.LIVE,
+        deadline=time.monotonic() - 1.0,
+    )
+    on_time = scheduler.submit(
+        lambda: ran.append("on_time"),
+        Priority.LIVE,
+        deadline=time.monotonic() + 60.0,
+    )
+    release.set()
+
+    with pytest.raises(DeadlineExceeded):
+        expired.result(5)
+    on_time.result(5)
+    assert ran == ["on_time"]
+
+
+def test_throughput_is_per_image():
+    scheduler = InferenceScheduler(1, {})
+    assert scheduler.throughput() is None
+    scheduler.run(lambda: time.sleep(0.02), Priority.UPLOAD, images=4)
+    # 5ms per image
+    assert scheduler.throughput() == pytest.approx(200, rel=0.5)
@@ -0,0 +1,58 @@
+import numpy as np
+
+from config import SETTINGS
+from models.detection import SessionStore
+
+NAMES = np.array(["battery", "pcb"])
+
+
+def _update(store, session, classes=None) -> bool:
+    boxes = np.array([[0, 0, 10, 10, 0.9, 0]], dtype=np.float32)
+    classes = {"battery": 0.9} if classes is None else classes
+    return store.update(session, boxes, NAMES, 640, 480, classes)
+
+
+def test_sweep_expires_idle_sessions(monkeypatch):
+    monkeypatch.setitem(SETTINGS, "session_ttl_seconds", 10)
+    store = SessionStore()
+    idle = store.open("idle", "localonly")
+    store.open("active", "client_drawing")
+    idle.touched -= 11
+
+    store.sweep()
+    assert store.get("idle") is None
+    assert store.get("active") is not None
+    assert store.count("localonly") == 0 and store.count("client_drawing") == 1
+
+
+def test_updates_do_not_revive_closed_sessions():
+    store = SessionStore()
+    session = store.open("a", "localonly")
+    assert _update(store, session)
+    assert store.get("a").detections()[0]["class_name"] == "battery"
+
+    store.close("a")
+    assert not _update(store, session)
+    assert store.get("a") is None and len(store) == 0
+    assert store.bytes == 0
+
+
+def test_memory_cap_evicts_least_recently_updated(monkeypatch):
+    store = SessionStore()
+    first = store.open("first", "localonly")
+    store.open("second", "localonly")
+    _update(store, first)
+    monkeypatch.setitem(SETTINGS, "session_max_bytes", store.bytes)
+
+    store.open("third", "localonly")
+    assert store.get("second") is None
+    assert store.get("first") is not None and store.get("third") is not None
+
+
+def test_detection_logs_are_rate_limited():
+    store = SessionStore()
+    session = store.open("a", "localonly")
+    assert _update(store, session)
+    # Same classes again within log_interval
+    assert not _update(store, session)
+    assert _update(store, session, {"battery": 0.9, "pcb": 0.5})
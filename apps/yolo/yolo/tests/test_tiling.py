@@ -0,0 +1,63 @@
+import numpy as np
+
+from core.postprocess import merge_detections
+from core.tiling import make_tiles, merge_tiles
+
+
+def _detections(*rows) -> np.ndarray:
+    return np.array(rows, dtype=np.float32).reshape(-1, 6)
+
+
+def test_tiles_cover_the_image():
+    img = np.zeros((1000, 1500, 3), dtype=np.uint8)
+    tiles, origins = make_tiles(img, 640, 0.25)
+
+    assert all(tile.shape == (640, 640, 3) for tile in tiles)
+    assert sorted(set(origins[:, 0].tolist())) == [0, 480, 860]
+    assert sorted(set(origins[:, 1].tolist())) == [0, 360]
+    # Tiles are views, not copies
+    assert all(np.shares_memory(tile, img) for tile in tiles)
+
+
+def test_small_image_is_one_tile():
+    tiles, origins = make_tiles(np.zeros((300, 400, 3), dtype=np.uint8), 640, 0.25)
+    assert len(tiles) == 1 and origins.tolist() == [[0, 0]]
+
+
+def test_merge_keeps_the_most_confident_duplicate():
+    merged = merge_detections(
+        _detections(
+            [0, 0, 100, 100, 0.6, 0],
+            [10, 10, 100, 100, 0.9, 0],
+            # Another class in the same place is kept
+            [0, 0, 100, 100, 0.5, 1],
+            # Far away
+            [300, 300, 400, 400, 0.4, 0],
+        ),
+        0.5,
+    )
+    assert merged[:, 4].tolist() == np.float32([0.9, 0.5, 0.4]).tolist()
+
+
+def test_merge_suppresses_boxes_clipped_by_a_tile_edge():
+    whole = [100, 100, 300, 200, 0.9, 0]
+    # The part of the same object seen by the neighbouring tile: low IoU,
+    # but it lies inside the whole box
+    clipped = [250, 100, 300, 200, 0.7, 0]
+    merged = merge_detections(_detections(whole, clipped), 0.5)
+    assert merged.tolist() == _detections(whole).tolist()
+
+
+def test_merge_tiles_shifts_into_image_coordinates():
+    origins = np.array([[0, 0], [480, 0]])
+    merged = merge_tiles(
+        [
+            _detections([500, 10, 600, 110, 0.8, 2]),
+            # The same object found by the second tile
+            _detections([20, 10, 120, 110, 0.7, 2]),
+        ],
+        origins,
+        0.5,
+    )
+    assert merged.tolist() == _detections([500, 10, 600, 110, 0.8, 2]).tolist()
+    assert len(merge_tiles([_detections(), _detections()], origins, 0.5)) == 0
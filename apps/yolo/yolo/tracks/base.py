@@ -1,5 +1,13 @@
+from typing import Dict, Optional
+
+import numpy as np
 from aiortc import VideoStreamTrack
+from core.postprocess import scale_detections
+from core.preprocess import Letterbox, frame_to_bgr
+from utils.admission import admission
 from utils.logger import setup_logger
+from utils.metrics import time_stage
+from utils.profiling import span
 from config import SETTINGS
 
 logger = setup_logger()
@@ -10,13 +18,24 @@ class BaseVideoStreamTrack(VideoStreamTrack):
     Base class for video stream tracks with YOLO processing.
     """
 
-    def __init__(self, track):
+    def __init__(self, track, client=None, quality=None):
         super().__init__()
         self.track = track
+        # Address the stream's frames are rate limited against
+        self.client = client
+        # Best model variant the client asked for, None for the best there is
+        self.quality = quality
         self.detection_results = []
+        # Model version and variant that produced detection_results
+        self.model_version = None
+        self.variant = None
         self._last_detection_time = 0
         self._frame_count = 0
         self._detection_interval = SETTINGS["detection_interval"]
+        # One per variant input size, reused for every frame of this stream
+        self._letterboxes: Dict[int, Letterbox] = {}
+        self._letterbox = None
+        self._frame_scale = (1.0, 1.0)
 
     def should_process_frame(self) -> bool:
         """
@@ -24,3 +43,33 @@ class BaseVideoStreamTrack(VideoStreamTrack):
         """
         self._frame_count += 1
         return self._frame_count % self._detection_interval == 0
+
+    def admit_frame(self) -> Optional[str]:
+        """
+        Check a frame due for detection against the admission limits.
+        Returns None if it may be run, otherwise the reason it was rejected.
+        """
+        return admission.admit_frame(self.client)
+
+    def inference_view(self, frame, size: int) -> np.ndarray:
+        """
+        Convert a frame to a letterboxed BGR image with size as its longest
+        side, padded into this track's preallocated letterbox buffer.
+        """
+        self._letterbox = self._letterboxes.get(size)
+        if self._letterbox is None:
+            self._letterbox = self._letterboxes[size] = Letterbox(size)
+
+        width, height = self._letterbox.fit(frame.width, frame.height)
+
+        with time_stage("decode"), span("VideoFrame.to_ndarray"):
+            img = frame_to_bgr(frame, width, height)
+
+        self._frame_scale = (frame.width / width, frame.height / height)
+
+        with time_stage("resize"), span("Letterbox"):
+            return self._letterbox(img)
+
+    def restore_detections(self, detections: np.ndarray) -> np.ndarray:
+        """Map detections on the last inference view back onto the frame."""
+        return scale_detections(self._letterbox.restore(detections), *self._frame_scale)
@@ -1,114 +1,162 @@
+import json
 import time
-from av import VideoFrame
+from functools import partial
+
+from aiortc.mediastreams import VIDEO_TIME_BASE, convert_timebase
 
 from tracks.base import BaseVideoStreamTrack
-from core.model import get_model
-from models.detection import last_logged_predictions
-from utils.logger import setup_logger
+from core.cascade import CascadeSession
+from core.model import registry, select_variant
+from core.scheduler import DeadlineExceeded, Priority, live_deadline, scheduler
+from core.postprocess import (
+    class_names,
+    class_confidences,
+    extract_detections,
+    serialize_detections,
+)
+from models.detection import sessions
+from utils.logger import setup_logger, summarize_classes
+from utils.profiling import span
+from utils.metrics import (
+    observe_prediction,
+    FRAMES_PROCESSED,
+    FRAMES_DROPPED,
+)
 from config import SETTINGS
 
 logger = setup_logger()
 
+# Results are dropped rather than queued once this much is waiting to be sent,
+# since the next frame's detections supersede them anyway
+MAX_CHANNEL_BUFFER = 256 * 1024
+
 
 class ClientDrawingYOLOVideoStreamTrack(BaseVideoStreamTrack):
     """
     A video track that performs YOLO object detection on incoming frames
-    but doesn't draw bounding boxes (client will do that)
+    but doesn't draw bounding boxes (client will do that).
+    Detections are pushed over the "detections" data channel of the same
+    peer connection as soon as a frame has been processed.
     """
 
-    def __init__(self, track, client_id=None):
-        super().__init__(track)
+    def __init__(self, track, client_id=None, client=None, quality=None):
+        super().__init__(track, client, quality)
         self.client_id = client_id
+        # Set when the client's data channel arrives
+        self.channel = None
+        self.cascade = CascadeSession()
+        self.session = sessions.open(client_id, "client_drawing")
         logger.info(
-            f"Initialized ClientDrawingYOLOVideoStreamTrack with client_id: {client_id}"
+            "Initialized ClientDrawingYOLOVideoStreamTrack with client_id: %s",
+            client_id,
+        )
+
+    def stop(self):
+        super().stop()
+        sessions.close(self.client_id)
+
+    def send_detections(self, frame) -> None:
+        """
+        Send the latest detections tagged with the frame's pts on the 90 kHz
+        RTP clock. The frame is forwarded unchanged, so the pts only differs
+        from the RTP timestamp the client sees by a constant offset, which
+        lets the client match boxes to the exact frame they came from.
+        """
+        channel = self.channel
+        if channel is None or channel.readyState != "open":
+            return
+        if channel.bufferedAmount > MAX_CHANNEL_BUFFER:
+            return
+
+        channel.send(
+            json.dumps(
+                {
+                    "type": "detections",
+                    "pts": convert_timebase(
+                        frame.pts, frame.time_base, VIDEO_TIME_BASE
+                    ),
+                    "data": self.detection_results,
+                    "model_version": self.model_version,
+                    "variant": self.variant,
+                }
+            )
         )
 
     async def recv(self):
         frame = await self.track.recv()
 
-        img = frame.to_ndarray(format="bgr24")
-
-        # Process detection on specified frames
-        if self.should_process_frame():
-            try:
-                model = get_model()
-                results = model.predict(
-                    source=img, conf=SETTINGS["detection_confidence"], verbose=False
+        # Nothing is drawn server side, so the frame is always passed through
+        # as is
+        if not self.should_process_frame():
+            FRAMES_DROPPED.inc(track="client_drawing", reason="interval")
+            return frame
+
+        rejected = self.admit_frame()
+        if rejected:
+            FRAMES_DROPPED.inc(track="client_drawing", reason=rejected)
+            return frame
+
+        try:
+            variant = select_variant(Priority.LIVE, self.quality)
+            img = self.inference_view(frame, variant.imgsz)
+
+            entry = registry.get(self, variant)
+            model = entry.model
+            with span("model.predict"):
+                results = await scheduler.infer(
+                    partial(
+                        model.predict,
+                        source=img,
+                        imgsz=variant.imgsz,
+                        conf=SETTINGS["detection_confidence"],
+                        verbose=False,
+                    ),
+                    Priority.LIVE,
+                    client=self,
+                    deadline=live_deadline(),
+                )
+            observe_prediction(results)
+            FRAMES_PROCESSED.inc(track="client_drawing")
+            self._last_detection_time = time.time()
+            self.model_version = entry.version
+            self.variant = variant.name
+
+            # Extract detection results without drawing
+            view_detections = extract_detections(results)
+            registry.shadow(img, SETTINGS["detection_confidence"], view_detections)
+            detections = self.restore_detections(view_detections)
+            names = class_names(model)
+
+            detected_classes = class_confidences(detections, names)
+            if sessions.update(
+                self.session,
+                detections,
+                names,
+                frame.width,
+                frame.height,
+                detected_classes,
+            ):
+                logger.info(
+                    "[Client-Drawing] Client %s: Found %d detections: %s",
+                    self.client_id,
+                    len(detections),
+                    summarize_classes(detected_classes),
+                    extra={"client_id": self.client_id, "classes": detected_classes},
                 )
-                self._last_detection_time = time.time()
-
-                # Extract detection results without drawing
-                self.detection_results = []
-                current_classes = set()
-
-                if results and len(results) > 0:
-                    detections = results[0].boxes.data.cpu().numpy()
-                    img_height, img_width = img.shape[:2]
-
-                    should_log = False
-                    current_time = time.time()
-
-                    detected_classes = {}
-                    for detection in detections:
-                        x1, y1, x2, y2, conf, class_id = detection
-                        class_name = model.names[int(class_id)]
-                        detected_classes[class_name] = conf
-                        current_classes.add(class_name)
-
-                    client_last_logged = last_logged_predictions.setdefault(
-                        self.client_id, {}
-                    )
-
-                    previous_classes = set(client_last_logged.keys())
-                    if current_classes != previous_classes:
-                        should_log = True
-
-                    for class_name in current_classes:
-                        if (
-                            class_name not in client_last_logged
-                            or (current_time - client_last_logged[class_name])
-                            > SETTINGS["log_interval"]
-                        ):
-                            should_log = True
-                            break
-
-                    if should_log and detected_classes:
-                        logger.info(
-                            f"[Client-Drawing] Client {self.client_id}: Found {len(detections)} detections: {', '.join([f'{c} ({v:.2f})' for c, v in detected_classes.items()])}"
-                        )
-
-                        for class_name in current_classes:
-                            client_last_logged[class_name] = current_time
-
-                    for class_name in list(client_last_logged.keys()):
-                        if class_name not in current_classes:
-                            del client_last_logged[class_name]
-
-                    # Process detections normally
-                    for detection in detections:
-                        x1, y1, x2, y2, conf, class_id = detection
-                        class_name = model.names[int(class_id)]
-
-                        self.detection_results.append(
-                            {
-                                "x1": float(x1),
-                                "y1": float(y1),
-                                "x2": float(x2),
-                                "y2": float(y2),
-                                "confidence": float(conf),
-                                "class_id": int(class_id),
-                                "class_name": class_name,
-                                "image_width": img_width,
-                                "image_height": img_height,
-                            }
-                        )
-
-            except Exception as e:
-                logger.error(f"[Client-Drawing] Error in YOLO detection: {e}")
-
-        # Convert frame back to VideoFrame without drawing boxes
-        new_frame = VideoFrame.from_ndarray(img, format="bgr24")
-        new_frame.pts = frame.pts
-        new_frame.time_base = frame.time_base
-
-        return new_frame
+
+            self.detection_results = serialize_detections(
+                detections, names, frame.width, frame.height
+            )
+            # Crops come from the inference view, which holds this frame
+            # until the next recv
+            await self.cascade.refine_async(
+                img, view_detections, self.detection_results, Priority.LIVE, self
+            )
+            self.send_detections(frame)
+        except DeadlineExceeded:
+            FRAMES_DROPPED.inc(track="client_drawing", reason="deadline")
+        except Exception as e:
+            FRAMES_DROPPED.inc(track="client_drawing", reason="error")
+            logger.error("[Client-Drawing] Error in YOLO detection: %s", e)
+
+        return frame
@@ -1,10 +1,26 @@
-import cv2
 import time
-from av import VideoFrame
+from functools import partial
 
 from tracks.base import BaseVideoStreamTrack
-from core.model import get_model
-from utils.logger import setup_logger
+from core.cascade import CascadeSession, cascade_labels
+from core.model import registry, select_variant
+from core.preprocess import FrameCanvas
+from core.postprocess import (
+    class_confidences,
+    class_names,
+    extract_detections,
+    serialize_detections,
+)
+from core.render import draw_detections
+from core.scheduler import DeadlineExceeded, Priority, live_deadline, scheduler
+from utils.logger import DetectionLogLimiter, setup_logger, summarize_classes
+from utils.profiling import span
+from utils.metrics import (
+    time_stage,
+    observe_prediction,
+    FRAMES_PROCESSED,
+    FRAMES_DROPPED,
+)
 from config import SETTINGS
 
 logger = setup_logger()
@@ -16,63 +32,92 @@ class YOLOVideoStreamTrack(BaseVideoStreamTrack):
     and returns frames with bounding boxes drawn on them.
     """
 
+    def __init__(self, track, client=None, quality=None):
+        super().__init__(track, client, quality)
+        self.log_limiter = DetectionLogLimiter()
+        # Annotated frames are drawn into and sent from this buffer
+        self.canvas = FrameCanvas()
+        self.cascade = CascadeSession()
+
     async def recv(self):
         frame = await self.track.recv()
 
-        img = frame.to_ndarray(format="bgr24")
+        if not self.should_process_frame():
+            FRAMES_DROPPED.inc(track="server_drawing", reason="interval")
+            return frame
+
+        rejected = self.admit_frame()
+        if rejected:
+            FRAMES_DROPPED.inc(track="server_drawing", reason=rejected)
+            return frame
+
+        try:
+            variant = select_variant(Priority.LIVE, self.quality)
+            img = self.inference_view(frame, variant.imgsz)
+
+            entry = registry.get(self, variant)
+            model = entry.model
+            with span("model.predict"):
+                results = await scheduler.infer(
+                    partial(
+                        model.predict,
+                        source=img,
+                        imgsz=variant.imgsz,
+                        conf=SETTINGS["detection_confidence"],
+                        verbose=False,
+                    ),
+                    Priority.LIVE,
+                    client=self,
+                    deadline=live_deadline(),
+                )
+            observe_prediction(results)
+            FRAMES_PROCESSED.inc(track="server_drawing")
+            self._last_detection_time = time.time()
+            self.model_version = entry.version
+            self.variant = variant.name
+
+            # Extract detection results in original frame coordinates
+            view_detections = extract_detections(results)
+            registry.shadow(img, SETTINGS["detection_confidence"], view_detections)
+            detections = self.restore_detections(view_detections)
+            names = class_names(model)
 
-        if self.should_process_frame():
-            try:
-                model = get_model()
-                results = model.predict(
-                    source=img, conf=SETTINGS["detection_confidence"], verbose=False
+            self.detection_results = serialize_detections(detections, names)
+            detected_classes = class_confidences(detections, names)
+            if self.log_limiter.allow(detected_classes):
+                logger.info(
+                    "Client %s: Found %d detections: %s",
+                    self.client,
+                    len(detections),
+                    summarize_classes(detected_classes),
+                    extra={"client_id": self.client, "classes": detected_classes},
                 )
-                self._last_detection_time = time.time()
-
-                # Extract detection results
-                self.detection_results = []
-                if results and len(results) > 0:
-                    detections = results[0].boxes.data.cpu().numpy()
-                    for detection in detections:
-                        x1, y1, x2, y2, conf, class_id = detection
-                        class_name = model.names[int(class_id)]
-
-                        logger.info(
-                            f"Detected: {class_name} (Confidence: {conf:.2f}), "
-                            f"Coordinates: ({x1:.2f}, {y1:.2f}), ({x2:.2f}, {y2:.2f})"
-                        )
-
-                        # Draw bounding box and label
-                        cv2.rectangle(
-                            img, (int(x1), int(y1)), (int(x2), int(y2)), (0, 255, 0), 2
-                        )
-                        label = f"{class_name} {conf:.2f}"
-                        cv2.putText(
-                            img,
-                            label,
-                            (int(x1), int(y1) - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX,
-                            0.5,
-                            (0, 255, 0),
-                            2,
-                        )
-
-                        self.detection_results.append(
-                            {
-                                "x1": float(x1),
-                                "y1": float(y1),
-                                "x2": float(x2),
-                                "y2": float(y2),
-                                "confidence": float(conf),
-                                "class_id": int(class_id),
-                                "class_name": class_name,
-                            }
-                        )
-            except Exception as e:
-                logger.error(f"Error in YOLO detection: {e}")
-
-        new_frame = VideoFrame.from_ndarray(img, format="bgr24")
-        new_frame.pts = frame.pts
-        new_frame.time_base = frame.time_base
-
-        return new_frame
+
+            # Crops come from the inference view, which holds this frame
+            # until the next recv
+            await self.cascade.refine_async(
+                img, view_detections, self.detection_results, Priority.LIVE, self
+            )
+
+            if len(detections) == 0:
+                return frame
+
+            # Only frames that get annotated are converted at full resolution
+            with time_stage("decode"), span("FrameCanvas.draw"):
+                canvas = self.canvas.draw(frame)
+
+            with time_stage("draw"):
+                draw_detections(
+                    canvas, detections, names, cascade_labels(self.detection_results)
+                )
+
+            # The sender encodes each frame before asking for the next one,
+            # so the buffer is free again by the next recv
+            return self.canvas.frame(frame)
+        except DeadlineExceeded:
+            FRAMES_DROPPED.inc(track="server_drawing", reason="deadline")
+            return frame
+        except Exception as e:
+            FRAMES_DROPPED.inc(track="server_drawing", reason="error")
+            logger.error("Error in YOLO detection: %s", e)
+            return frame
@@ -0,0 +1,213 @@
+import math
+import time
+import threading
+import statistics
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+from core.model import get_model_info, is_model_ready
+from core.scheduler import Priority, scheduler
+from utils.logger import setup_logger
+from config import SETTINGS
+
+logger = setup_logger()
+
+# Per client state is dropped after this long without activity
+_IDLE_SECONDS = 600.0
+_SWEEP_INTERVAL = 60.0
+
+
+def _exempt(client: Optional[str]) -> bool:
+    """Whether a client skips the per client limits."""
+    return client in SETTINGS["admission_exempt_clients"]
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate tokens per second."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, now: float, tokens: float = 1.0) -> bool:
+        self._refill(now)
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def retry_after(self, now: float, tokens: float = 1.0) -> float:
+        """Seconds until the given number of tokens will be available."""
+        self._refill(now)
+        if self.tokens >= tokens or self.rate <= 0:
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+
+class _ClientState:
+    __slots__ = ("frames", "uploads", "connections", "active_uploads", "seen")
+
+    def __init__(self, now: float):
+        self.frames = TokenBucket(
+            SETTINGS["admission_client_fps"], SETTINGS["admission_client_burst"]
+        )
+        self.uploads = TokenBucket(
+            SETTINGS["admission_uploads_per_minute"] / 60.0,
+            SETTINGS["admission_uploads_per_minute"],
+        )
+        self.connections = 0
+        self.active_uploads = 0
+        self.seen = now
+
+
+class Rejected(Exception):
+    """An admission request that was refused, with a hint for when to retry."""
+
+    def __init__(self, reason: str, retry_after: float = 1.0, status_code: int = 429):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+    def http_exception(self) -> HTTPException:
+        return HTTPException(
+            status_code=self.status_code,
+            detail=f"Request rejected: {self.reason}",
+            headers={"Retry-After": str(max(1, math.ceil(self.retry_after)))},
+        )
+
+
+class AdmissionController:
+    """
+    Decides up front whether work is accepted, so overload turns into fast
+    rejections instead of queues that grow without bound.
+    Every client (keyed by IP) gets its own frame and upload token buckets
+    and a cap on concurrent live connections and uploads. Live frames also
+    draw from a global bucket whose rate follows the throughput the
+    inference scheduler actually measures, so the server never admits more
+    frames per second than it can run.
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, _ClientState] = {}
+        self._connections = 0
+        self._lock = threading.Lock()
+        self._global = TokenBucket(self._global_rate(), self._global_rate())
+        self._last_sweep = time.monotonic()
+
+    def _global_rate(self) -> float:
+        configured = SETTINGS["admission_global_fps"]
+        if configured:
+            return configured
+
+        throughput = scheduler.throughput()
+        if throughput is None:
+            # Nothing has run through the scheduler yet; use warm-up timings
+            latencies = get_model_info().get("warm_latency_ms")
+            if latencies:
+                throughput = (
+                    scheduler.workers * 1000.0 / statistics.median(latencies.values())
+                )
+        if throughput is None:
+            return SETTINGS["admission_client_fps"]
+        return throughput * SETTINGS["admission_capacity_headroom"]
+
+    def _client(self, client: Optional[str], now: float) -> _ClientState:
+        if now - self._last_sweep > _SWEEP_INTERVAL:
+            self._sweep(now)
+
+        state = self._clients.get(client)
+        if state is None:
+            state = self._clients[client] = _ClientState(now)
+        state.seen = now
+        return state
+
+    def _sweep(self, now: float) -> None:
+        self._last_sweep = now
+        idle = [
+            client
+            for client, state in self._clients.items()
+            if not state.connections
+            and not state.active_uploads
+            and now - state.seen > _IDLE_SECONDS
+        ]
+        for client in idle:
+            del self._clients[client]
+
+    def _require_model(self) -> None:
+        # The model loads in the background after startup
+        if not is_model_ready():
+            raise Rejected("model_loading", retry_after=5.0, status_code=503)
+
+    def open_connection(self, client: Optional[str]) -> None:
+        """Admit a live connection (peer connection or websocket)."""
+        self._require_model()
+        with self._lock:
+            state = self._client(client, time.monotonic())
+            if self._connections >= SETTINGS["admission_max_connections"]:
+                raise Rejected("server_busy", retry_after=5.0)
+            if state.connections >= SETTINGS[
+                "admission_connections_per_client"
+            ] and not _exempt(client):
+                raise Rejected("too_many_connections", retry_after=5.0)
+            state.connections += 1
+            self._connections += 1
+
+    def close_connection(self, client: Optional[str]) -> None:
+        with self._lock:
+            state = self._clients.get(client)
+            if state is not None and state.connections > 0:
+                state.connections -= 1
+                self._connections -= 1
+
+    def admit_frame(self, client: Optional[str]) -> Optional[str]:
+        """
+        Take a token for a live frame. Returns None when the frame may be
+        run, or the reason it was rejected ("rate_limited" when the client
+        is over its own rate, "overloaded" when the server is at capacity).
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._client(client, now)
+            if not state.frames.try_acquire(now) and not _exempt(client):
+                return "rate_limited"
+
+            rate = self._global_rate()
+            self._global.rate = rate
+            self._global.burst = max(1.0, rate)
+            if not self._global.try_acquire(now):
+                return "overloaded"
+            return None
+
+    def begin_upload(self, client: Optional[str]) -> None:
+        """Admit an upload; end_upload must be called once it is finished."""
+        self._require_model()
+        with self._lock:
+            now = time.monotonic()
+            state = self._client(client, now)
+            if scheduler.depth(Priority.UPLOAD) >= SETTINGS["admission_upload_queue"]:
+                raise Rejected("server_busy", retry_after=5.0)
+            if not _exempt(client):
+                if state.active_uploads >= SETTINGS["admission_concurrent_uploads"]:
+                    raise Rejected("too_many_uploads", retry_after=5.0)
+                if not state.uploads.try_acquire(now):
+                    raise Rejected("rate_limited", state.uploads.retry_after(now))
+            state.active_uploads += 1
+
+    def end_upload(self, client: Optional[str]) -> None:
+        with self._lock:
+            state = self._clients.get(client)
+            if state is not None and state.active_uploads > 0:
+                state.active_uploads -= 1
+
+
+admission = AdmissionController()
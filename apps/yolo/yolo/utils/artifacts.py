@@ -0,0 +1,347 @@
+import os
+import time
+import heapq
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from utils.logger import setup_logger
+from config import SETTINGS
+
+logger = setup_logger()
+
+CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".bmp": "image/bmp",
+    ".mp4": "video/mp4",
+    ".avi": "video/x-msvideo",
+    ".mov": "video/quicktime",
+}
+
+
+@dataclass
+class Artifact:
+    """A processed output, held either in memory or in a file"""
+
+    file_id: str
+    content_type: str
+    filename: str
+    size: int
+    created: float
+    expires: float
+    data: Optional[bytes] = None
+    path: Optional[str] = None
+
+    @property
+    def etag(self) -> str:
+        # Outputs are never modified once stored, so id, size and creation
+        # time identify the content
+        return f'"{self.file_id}-{self.size:x}-{int(self.created * 1000):x}"'
+
+
+class ArtifactStore:
+    """
+    Index of processed outputs keyed by file_id, populated when they are
+    written, so downloads never have to probe the filesystem.
+    Small outputs stay in memory up to memory_limit bytes in total; the
+    oldest ones are spilled to spill_dir when the limit is exceeded, and
+    anything larger than spill_size goes straight to disk. Files on disk are
+    kept under disk_quota bytes by evicting the least recently downloaded.
+    The quota counts stored and spilling artifacts, not outputs that are
+    still being encoded straight to disk, so it can be exceeded by the
+    size of those until they are added.
+    Every artifact expires ttl seconds after it was created; expiry times
+    are kept in a heap so expiring never scans the whole index.
+    Files are written and deleted without holding the lock, so lookups by
+    downloads never wait for disk I/O. A file's modification time is set to
+    its artifact's creation time, so the ETag of a file indexed from disk
+    matches the one it was served with before.
+    With shared set, other processes store outputs in spill_dir as well:
+    every output is written to disk, and ids missing from the index are
+    looked up there. Quota and expiry are then enforced per process.
+    """
+
+    def __init__(
+        self,
+        spill_dir: str,
+        memory_limit: int,
+        spill_size: int,
+        disk_quota: int,
+        ttl: float,
+        shared: bool = False,
+    ):
+        self.spill_dir = spill_dir
+        self.memory_limit = memory_limit
+        self.spill_size = spill_size
+        self.disk_quota = disk_quota
+        self.ttl = ttl
+        self.shared = shared
+        self._artifacts: Dict[str, Artifact] = {}
+        # In memory artifacts in insertion order, for spilling the oldest
+        self._in_memory: "OrderedDict[str, None]" = OrderedDict()
+        # Artifacts on disk from least to most recently used
+        self._on_disk: "OrderedDict[str, None]" = OrderedDict()
+        # Artifacts being written to spill_dir; still served from memory
+        self._spilling: Dict[str, Artifact] = {}
+        # (expires, file_id); entries for removed artifacts are skipped lazily
+        self._expiry: List[Tuple[float, str]] = []
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._memory_bytes
+
+    @property
+    def disk_bytes(self) -> int:
+        return self._disk_bytes
+
+    def __len__(self) -> int:
+        return len(self._artifacts)
+
+    def _spill_path(self, artifact: Artifact) -> str:
+        ext = os.path.splitext(artifact.filename)[1]
+        return os.path.join(self.spill_dir, f"{artifact.file_id}_processed{ext}")
+
+    def _spill(self, artifact: Artifact) -> None:
+        """
+        Mark an artifact for spilling; _write_spills writes its file after
+        the lock is released. Its size counts against the disk quota from
+        now on.
+        """
+        self._spilling[artifact.file_id] = artifact
+        self._disk_bytes += artifact.size
+
+    def _write_spills(self, artifacts: List[Artifact]) -> None:
+        for artifact in artifacts:
+            path = self._spill_path(artifact)
+            try:
+                with open(path, "wb") as f:
+                    f.write(artifact.data)
+                os.utime(path, (artifact.created, artifact.created))
+            except OSError as e:
+                logger.error(f"Error spilling artifact {artifact.file_id}: {e}")
+                with self._lock:
+                    # Kept in memory instead
+                    if self._spilling.pop(artifact.file_id, None) is artifact:
+                        self._disk_bytes -= artifact.size
+                        self._in_memory[artifact.file_id] = None
+                        self._memory_bytes += artifact.size
+                continue
+
+            with self._lock:
+                if self._spilling.pop(artifact.file_id, None) is artifact:
+                    # Path first: downloads read data before path
+                    artifact.path = path
+                    artifact.data = None
+                    self._on_disk[artifact.file_id] = None
+                    removed = self._enforce_quota(keep=artifact.file_id)
+                else:
+                    # Replaced or expired while it was written
+                    artifact.path = path
+                    removed = [artifact]
+            self._delete_files(removed)
+
+    def _add(self, artifact: Artifact) -> List[Artifact]:
+        """Index an artifact, returning the one it replaced, if any."""
+        replaced = self._remove(artifact.file_id)
+        self._artifacts[artifact.file_id] = artifact
+        heapq.heappush(self._expiry, (artifact.expires, artifact.file_id))
+        if replaced is None or (replaced.path and replaced.path == artifact.path):
+            # Nothing to delete when the same file is indexed again
+            return []
+        return [replaced]
+
+    def _enforce_quota(self, keep: str) -> List[Artifact]:
+        """Evict the least recently used files until disk usage fits the quota."""
+        evicted = []
+        while self._disk_bytes > self.disk_quota and len(self._on_disk) > 1:
+            file_id = next(iter(self._on_disk))
+            if file_id == keep:
+                self._on_disk.move_to_end(file_id)
+                continue
+            evicted.append(self._remove(file_id))
+        return evicted
+
+    def put(
+        self, file_id: str, data: bytes, content_type: str, filename: str
+    ) -> Artifact:
+        """Store encoded output bytes."""
+        created = time.time()
+        artifact = Artifact(
+            file_id=file_id,
+            content_type=content_type,
+            filename=filename,
+            size=len(data),
+            created=created,
+            expires=created + self.ttl,
+            data=data,
+        )
+
+        spills = []
+        with self._lock:
+            removed = self._add(artifact)
+
+            if artifact.size > self.spill_size or self.shared:
+                spills.append(artifact)
+            else:
+                self._in_memory[file_id] = None
+                self._memory_bytes += artifact.size
+
+                while self._memory_bytes > self.memory_limit and self._in_memory:
+                    oldest_id, _ = self._in_memory.popitem(last=False)
+                    oldest = self._artifacts[oldest_id]
+                    self._memory_bytes -= oldest.size
+                    spills.append(oldest)
+                    logger.info(f"Spilling artifact {oldest_id} ({oldest.size} bytes)")
+
+            for spilled in spills:
+                self._spill(spilled)
+            removed.extend(self._enforce_quota(keep=file_id))
+
+        self._delete_files(removed)
+        self._write_spills(spills)
+        return artifact
+
+    def add_file(
+        self,
+        file_id: str,
+        path: str,
+        content_type: str,
+        filename: str,
+        created: Optional[float] = None,
+    ) -> Artifact:
+        """Register output that was written straight to disk."""
+        stat = os.stat(path)
+        if created is None:
+            created = time.time()
+            os.utime(path, (created, created))
+        artifact = Artifact(
+            file_id=file_id,
+            content_type=content_type,
+            filename=filename,
+            size=stat.st_size,
+            created=created,
+            expires=created + self.ttl,
+            path=path,
+        )
+        with self._lock:
+            removed = self._add(artifact)
+            self._on_disk[file_id] = None
+            self._disk_bytes += artifact.size
+            removed.extend(self._enforce_quota(keep=file_id))
+
+        self._delete_files(removed)
+        return artifact
+
+    def get(self, file_id: str) -> Optional[Artifact]:
+        with self._lock:
+            artifact = self._artifacts.get(file_id)
+        if artifact is None and self.shared:
+            artifact = self._find(file_id)
+        return artifact
+
+    def _find(self, file_id: str) -> Optional[Artifact]:
+        """Index the output another process stored for file_id, if any."""
+        if not file_id or os.path.basename(file_id) != file_id:
+            return None
+        for ext, content_type in CONTENT_TYPES.items():
+            path = os.path.join(self.spill_dir, f"{file_id}_processed{ext}")
+            try:
+                created = os.stat(path).st_mtime
+                return self.add_file(
+                    file_id, path, content_type, f"processed{ext}", created=created
+                )
+            except FileNotFoundError:
+                continue
+        return None
+
+    def touch(self, file_id: str) -> None:
+        """Mark an artifact as recently downloaded so it is evicted last."""
+        with self._lock:
+            if file_id in self._on_disk:
+                self._on_disk.move_to_end(file_id)
+
+    def _remove(self, file_id: str) -> Optional[Artifact]:
+        artifact = self._artifacts.pop(file_id, None)
+        if artifact is None:
+            return None
+        if file_id in self._in_memory:
+            del self._in_memory[file_id]
+            self._memory_bytes -= artifact.size
+        if file_id in self._on_disk:
+            del self._on_disk[file_id]
+            self._disk_bytes -= artifact.size
+        if self._spilling.pop(file_id, None) is not None:
+            # _write_spills deletes the file once it is written
+            self._disk_bytes -= artifact.size
+        return artifact
+
+    def _delete_files(self, artifacts: List[Artifact]) -> None:
+        for artifact in artifacts:
+            if not artifact.path:
+                continue
+            try:
+                os.remove(artifact.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Error removing file {artifact.path}: {e}")
+
+    def load_directory(self) -> int:
+        """Index processed files left in spill_dir, e.g. from before a restart."""
+        loaded = 0
+        with os.scandir(self.spill_dir) as entries:
+            for entry in entries:
+                file_id, sep, ext = entry.name.rpartition("_processed")
+                if not sep or ext not in CONTENT_TYPES or not entry.is_file():
+                    continue
+                if self.get(file_id) is None:
+                    self.add_file(
+                        file_id,
+                        entry.path,
+                        CONTENT_TYPES[ext],
+                        f"processed{ext}",
+                        created=entry.stat().st_mtime,
+                    )
+                    loaded += 1
+        return loaded
+
+    def next_expiry(self) -> Optional[float]:
+        """Time at which the next artifact expires, if any."""
+        with self._lock:
+            while self._expiry:
+                expires, file_id = self._expiry[0]
+                artifact = self._artifacts.get(file_id)
+                if artifact is not None and artifact.expires == expires:
+                    return expires
+                heapq.heappop(self._expiry)
+            return None
+
+    def expire(self) -> int:
+        """Drop expired artifacts, deleting their files."""
+        now = time.time()
+        expired = []
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires, file_id = heapq.heappop(self._expiry)
+                artifact = self._artifacts.get(file_id)
+                if artifact is not None and artifact.expires == expires:
+                    expired.append(self._remove(file_id))
+
+        self._delete_files(expired)
+        return len(expired)
+
+
+artifact_store = ArtifactStore(
+    spill_dir=os.path.join(os.getcwd(), "processed"),
+    memory_limit=SETTINGS["artifact_memory_bytes"],
+    spill_size=SETTINGS["artifact_spill_bytes"],
+    disk_quota=SETTINGS["artifact_disk_quota_bytes"],
+    ttl=SETTINGS["artifact_ttl_seconds"],
+    shared=SETTINGS["serve_workers"] > 1,
+)
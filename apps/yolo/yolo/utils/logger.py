@@ -1,8 +1,161 @@
+import os
+import json
+import time
+import queue
+import atexit
 import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
 
+from utils.metrics import LOG_RECORDS_DROPPED
+from config import SETTINGS
 
-def setup_logger():
-    """Configure and return the application logger."""
-    logging.basicConfig(level=logging.INFO)
-    logger = logging.getLogger("yolo_webrtc")
-    return logger
+_TEXT_FORMAT = "%(levelname)s:%(name)s:%(message)s"
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_setup_lock = threading.Lock()
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line, including extra fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread as they are. The stock handler
+    formats the message in the calling thread; here formatting, like the
+    I/O, happens on the listener, and records are dropped instead of
+    blocking when the queue is full.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+def setup_logger() -> logging.Logger:
+    """
+    Configure logging on first use and return the application logger.
+    Every record, including those of libraries, goes through a bounded
+    queue to a listener thread that formats and writes it, as text or,
+    with log_format "json", as JSON lines.
+    """
+    global _listener
+
+    with _setup_lock:
+        if _listener is None:
+            output = logging.StreamHandler()
+            output.setFormatter(
+                JsonFormatter()
+                if SETTINGS["log_format"] == "json"
+                else logging.Formatter(_TEXT_FORMAT)
+            )
+
+            records: queue.Queue = queue.Queue(SETTINGS["log_queue_size"])
+            _listener = QueueListener(records, output, respect_handler_level=True)
+            _listener.start()
+            # Flush what is still queued on exit
+            atexit.register(_stop_listener)
+
+            logging.basicConfig(
+                level=SETTINGS["log_level"],
+                handlers=[_NonBlockingQueueHandler(records)],
+                force=True,
+            )
+
+    return logging.getLogger("yolo_webrtc")
+
+
+def _stop_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_after_fork() -> None:
+    """
+    Give a forked child its own queue and listener thread: the parent's
+    listener does not exist in the child, and its queue lock may be held.
+    """
+    global _listener, _setup_lock
+
+    _setup_lock = threading.Lock()
+    if _listener is None:
+        return
+
+    records: queue.Queue = queue.Queue(SETTINGS["log_queue_size"])
+    _listener = QueueListener(records, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, _NonBlockingQueueHandler):
+            handler.queue = records
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+class DetectionLogLimiter:
+    """
+    Rate limits detection logs of one client, per class: a result is worth
+    logging when the set of detected classes changed or a class was last
+    logged more than interval seconds ago. Check before building the
+    message so suppressed logs cost nothing.
+    """
+
+    __slots__ = ("interval", "last_logged")
+
+    def __init__(self, interval: Optional[float] = None):
+        self.interval = SETTINGS["log_interval"] if interval is None else interval
+        # class name -> time it was last logged
+        self.last_logged: Dict[str, float] = {}
+
+    def allow(
+        self, detected_classes: Dict[str, float], now: Optional[float] = None
+    ) -> bool:
+        """Whether to log detections with these class confidences."""
+        if now is None:
+            now = time.monotonic()
+
+        current = detected_classes.keys()
+        log = current != self.last_logged.keys() or any(
+            now - self.last_logged.get(class_name, float("-inf")) > self.interval
+            for class_name in current
+        )
+        if log and detected_classes:
+            self.last_logged = dict.fromkeys(current, now)
+        else:
+            # Classes that are no longer detected are forgotten
+            self.last_logged = {
+                class_name: logged
+                for class_name, logged in self.last_logged.items()
+                if class_name in current
+            }
+        return log and bool(detected_classes)
+
+
+def summarize_classes(detected_classes: Dict[str, float]) -> str:
+    """Render class confidences as "Battery (0.91), PCB (0.55)"."""
+    return ", ".join(f"{c} ({v:.2f})" for c, v in detected_classes.items())
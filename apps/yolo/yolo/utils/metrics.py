@@ -0,0 +1,279 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Latency buckets in seconds, tuned for per-frame work (sub-millisecond
+# conversions up to multi-second video uploads)
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key)
+    if extra:
+        items.append(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class _Metric:
+    """Base class for a named metric with optional labels."""
+
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """
+    Value that can go up and down. Label sets can either be set explicitly or
+    backed by a callback evaluated at scrape time.
+    """
+
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+        self._callbacks: Dict[LabelKey, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, func: Callable[[], float], **labels) -> None:
+        with self._lock:
+            self._callbacks[_label_key(labels)] = func
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+            callbacks = list(self._callbacks.items())
+        samples = [f"{self.name}{_format_labels(k)} {v}" for k, v in items]
+        for key, func in callbacks:
+            try:
+                samples.append(f"{self.name}{_format_labels(key)} {float(func())}")
+            except Exception:
+                continue
+        return samples
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets."""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self._buckets = tuple(sorted(buckets))
+        # label key -> [bucket counts..., sum, count]
+        self._values: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [0.0] * (len(self._buckets) + 2)
+                self._values[key] = state
+            for i, bound in enumerate(self._buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        samples = []
+        for key, state in items:
+            cumulative = 0.0
+            for bound, count in zip(self._buckets, state):
+                cumulative += count
+                samples.append(
+                    f"{self.name}_bucket{_format_labels(key, ('le', str(bound)))} {cumulative}"
+                )
+            samples.append(
+                f"{self.name}_bucket{_format_labels(key, ('le', '+Inf'))} {state[-1]}"
+            )
+            samples.append(f"{self.name}_sum{_format_labels(key)} {state[-2]}")
+            samples.append(f"{self.name}_count{_format_labels(key)} {state[-1]}")
+        return samples
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_LATENCY: Histogram = REGISTRY.register(
+    Histogram(
+        "yolo_stage_latency_seconds",
+        "Latency of each processing stage (decode, preprocess, inference, postprocess, draw, encode).",
+    )
+)
+QUEUE_DEPTH: Gauge = REGISTRY.register(
+    Gauge("yolo_queue_depth", "Number of items waiting in each processing queue.")
+)
+PEER_CONNECTIONS: Gauge = REGISTRY.register(
+    Gauge("yolo_peer_connections", "Active WebRTC peer connections.")
+)
+WEBSOCKET_CLIENTS: Gauge = REGISTRY.register(
+    Gauge("yolo_websocket_clients", "Active websocket detection clients.")
+)
+FRAMES_PROCESSED: Counter = REGISTRY.register(
+    Counter("yolo_frames_processed_total", "Frames run through the detector.")
+)
+FRAMES_DROPPED: Counter = REGISTRY.register(
+    Counter(
+        "yolo_frames_dropped_total",
+        "Frames passed through without detection, by reason.",
+    )
+)
+CACHE_REQUESTS: Counter = REGISTRY.register(
+    Counter("yolo_cache_requests_total", "Cache lookups by cache and result.")
+)
+ARTIFACT_BYTES: Gauge = REGISTRY.register(
+    Gauge("yolo_artifact_bytes", "Bytes held by processed outputs, by storage.")
+)
+SESSIONS: Gauge = REGISTRY.register(
+    Gauge("yolo_sessions", "Live client sessions held in memory, by kind.")
+)
+SESSION_BYTES: Gauge = REGISTRY.register(
+    Gauge("yolo_session_bytes", "Estimated memory held by live client sessions.")
+)
+SESSIONS_EVICTED: Counter = REGISTRY.register(
+    Counter(
+        "yolo_sessions_evicted_total",
+        "Sessions dropped without being closed, by reason (ttl or memory).",
+    )
+)
+LOG_RECORDS_DROPPED: Counter = REGISTRY.register(
+    Counter(
+        "yolo_log_records_dropped_total",
+        "Log records dropped because the log queue was full.",
+    )
+)
+VARIANT_SELECTED: Counter = REGISTRY.register(
+    Counter(
+        "yolo_model_variant_total",
+        "Requests run at each model variant, by priority class.",
+    )
+)
+SHADOW_BOXES: Counter = REGISTRY.register(
+    Counter(
+        "yolo_shadow_boxes_total",
+        "Boxes compared between the active and the shadow model, by outcome.",
+    )
+)
+
+
+def time_stage(stage: str):
+    """Context manager recording the duration of a processing stage."""
+    return STAGE_LATENCY.time(stage=stage)
+
+
+def observe_prediction(results) -> None:
+    """
+    Record the preprocess/inference/postprocess timings that ultralytics
+    measures for every prediction.
+    """
+    if not results:
+        return
+    speed = getattr(results[0], "speed", None) or {}
+    for stage in ("preprocess", "inference", "postprocess"):
+        if speed.get(stage) is not None:
+            STAGE_LATENCY.observe(speed[stage] / 1000.0, stage=stage)
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
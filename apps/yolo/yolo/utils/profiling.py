@@ -0,0 +1,148 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from typing import Dict, Any, Optional
+
+
+class _NullSpan:
+    """No-op context manager returned while profiling is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """Timing span that reports its duration to the profiler on exit."""
+
+    __slots__ = ("_profiler", "_name", "_start")
+
+    def __init__(self, profiler: "Profiler", name: str):
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._profiler.record(self._name, time.perf_counter() - self._start)
+        return False
+
+
+class Profiler:
+    """
+    Runtime-toggleable hot path profiler.
+    While disabled, span() returns a shared no-op object so instrumented code
+    only pays for an attribute lookup and a branch.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        # name -> [count, total seconds, max seconds]
+        self._spans: Dict[str, list] = {}
+        self._sampling = False
+
+    def span(self, name: str):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def record(self, name: str, elapsed: float) -> None:
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                self._spans[name] = [1, elapsed, elapsed]
+            else:
+                stats[0] += 1
+                stats[1] += elapsed
+                if elapsed > stats[2]:
+                    stats[2] = elapsed
+
+    def reset(self) -> None:
+        with self._lock:
+            self._spans.clear()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return per-span call counts and latency summaries in milliseconds."""
+        with self._lock:
+            items = [(name, list(stats)) for name, stats in self._spans.items()]
+        return {
+            name: {
+                "count": count,
+                "total_ms": round(total * 1000, 3),
+                "avg_ms": round(total * 1000 / count, 3),
+                "max_ms": round(worst * 1000, 3),
+            }
+            for name, (count, total, worst) in items
+        }
+
+    def sample(
+        self,
+        seconds: float,
+        interval: float = 0.005,
+        max_samples: Optional[int] = None,
+    ) -> str:
+        """
+        Sample the Python stacks of every thread for the given duration, or
+        until max_samples samples were taken, and return them in the folded
+        format understood by flamegraph.pl and speedscope
+        ("root;caller;callee count" per line).
+        Blocks the calling thread, so run it off the event loop.
+        """
+        with self._lock:
+            if self._sampling:
+                raise RuntimeError("A sampling session is already running")
+            self._sampling = True
+
+        try:
+            own_id = threading.get_ident()
+            thread_names = {}
+            folded: Counter = Counter()
+            deadline = time.monotonic() + seconds
+            samples = 0
+
+            while time.monotonic() < deadline and (
+                max_samples is None or samples < max_samples
+            ):
+                samples += 1
+                for thread in threading.enumerate():
+                    thread_names[thread.ident] = thread.name
+
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(
+                            f"{code.co_name} ({os.path.basename(code.co_filename)})"
+                        )
+                        frame = frame.f_back
+                    stack.append(thread_names.get(thread_id, str(thread_id)))
+                    folded[";".join(reversed(stack))] += 1
+
+                time.sleep(interval)
+        finally:
+            with self._lock:
+                self._sampling = False
+
+        return "\n".join(f"{stack} {count}" for stack, count in folded.items())
+
+
+PROFILER = Profiler()
+
+
+def span(name: str):
+    """Time a hot path section when profiling is enabled."""
+    return PROFILER.span(name)
@@ -1,11 +1,29 @@
 import asyncio
-from typing import Set
+from typing import Dict, Optional, Set
 from aiortc import RTCPeerConnection
+from utils.admission import admission
 from utils.logger import setup_logger
+from utils.metrics import PEER_CONNECTIONS
 
 logger = setup_logger()
 
 peer_connections: Set[RTCPeerConnection] = set()
+# Client each admitted peer connection counts against
+peer_clients: Dict[RTCPeerConnection, Optional[str]] = {}
+
+PEER_CONNECTIONS.set_function(lambda: len(peer_connections))
+
+
+def open_peer_connection(client: Optional[str]) -> RTCPeerConnection:
+    """
+    Create a peer connection for a client, raising Rejected if the client
+    or the server is already at its connection limit.
+    """
+    admission.open_connection(client)
+    pc = RTCPeerConnection()
+    peer_connections.add(pc)
+    peer_clients[pc] = client
+    return pc
 
 
 async def pc_cleanup(pc: RTCPeerConnection) -> None:
@@ -17,6 +35,13 @@ async def pc_cleanup(pc: RTCPeerConnection) -> None:
     """
     logger.info("Cleaning up peer connection")
     peer_connections.discard(pc)
+    if pc in peer_clients:
+        admission.close_connection(peer_clients.pop(pc))
+    # Closing the connection does not end the tracks it was sending, which
+    # would otherwise keep their per client state until it expires
+    for sender in pc.getSenders():
+        if sender.track is not None:
+            sender.track.stop()
     await pc.close()
 
 